@@ -0,0 +1 @@
+"""下载引擎的基准测试: 本地 Range 服务器 (server.py) 和测试驱动 (run.py)"""
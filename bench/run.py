@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from catpaw.engine import DownloadEngine, verify_hash
+from catpaw.chunks import ChunkHashes
+from catpaw.extract import extract_archive, find_seven_zip, create_extractor, py7zr_available, ExtractionError
+from catpaw.manifest import VersionInfo
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    """把 64M / 1G 之类的字符串转换为字节数"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def peak_memory():
+    """当前进程的峰值内存 (字节), 无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位, Linux 以 KB 为单位
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+def make_payload(work_dir, size, seven_zip, packer=None):
+    """生成指定大小的测试文件; packer 为 7z 或 py7zr 时打包为存储模式的 7z 压缩包, 以便测量解压阶段"""
+    payload = os.path.join(work_dir, f"payload-{size}.bin")
+    if not os.path.exists(payload):
+        with open(payload, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                block = os.urandom(min(remaining, 1024 * 1024))
+                f.write(block)
+                remaining -= len(block)
+
+    path = payload
+    if packer:
+        archive = os.path.join(work_dir, f"archive-{size}.7z")
+        if not os.path.exists(archive):
+            if packer == "7z":
+                subprocess.run([seven_zip, "a", "-mx0", archive, payload], stdout=subprocess.DEVNULL, check=True)
+            else:
+                import py7zr
+                with py7zr.SevenZipFile(archive, 'w', filters=[{'id': py7zr.FILTER_COPY}]) as z:
+                    z.write(payload, os.path.basename(payload))
+        path = archive
+
+    hash_algo = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            hash_algo.update(block)
+    return path, hash_algo.hexdigest()
+
+
+def write_chunk_hashes(path, chunk_size):
+    """按 chunk_size 计算分块哈希 (与清单中的 chunkb2b 相同), 写入 path.chunks 并返回该路径"""
+    chunks_path = f"{path}.{chunk_size}.chunks"
+    if not os.path.exists(chunks_path):
+        hashes = []
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                hashes.append(hashlib.blake2b(block, digest_size=32).hexdigest())
+        with open(chunks_path, 'w') as f:
+            json.dump({'chunk_size': chunk_size, 'hashes': hashes}, f)
+    return chunks_path
+
+
+def load_chunk_hashes(chunks_path):
+    with open(chunks_path, 'r') as f:
+        data = json.load(f)
+    return ChunkHashes(data['chunk_size'], data['hashes'], lambda: hashlib.blake2b(digest_size=32))
+
+
+def start_server(root, args):
+    """在独立进程中启动基准服务器, 避免其 CPU 占用计入下载器"""
+    command = [
+        sys.executable, "-m", "bench.server", "--root", root,
+        "--bandwidth", str(args.bandwidth), "--latency", str(args.latency),
+        "--jitter", str(args.jitter), "--fail-rate", str(args.fail_rate),
+        "--slow-rate", str(args.slow_rate), "--slow-bandwidth", str(args.slow_bandwidth),
+        "--corrupt-rate", str(args.corrupt_rate),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    port = int(process.stdout.readline())
+    return process, port
+
+
+def run_case(url, threads, expected_hash, extract, hedging=True, extractor="auto", chunks_path=None):
+    """在当前进程中执行一次下载-合并-校验-解压, 返回测量结果; chunks_path 为分块哈希文件时下载中逐块校验"""
+    work_dir = tempfile.mkdtemp(prefix="catpaw-bench-")
+    save_path = os.path.join(work_dir, url.split('/')[-1])
+    result = {'threads': threads}
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    engine = DownloadEngine(threads=threads, hedging=hedging)
+    metrics = engine.metrics
+    try:
+        engine.download(url, save_path, load_chunk_hashes(chunks_path) if chunks_path else None)
+        result['size'] = os.path.getsize(save_path)
+        download_seconds = metrics.stages.get('download', 0)
+        result['throughput'] = round(result['size'] / download_seconds) if download_seconds > 0 else None
+
+        version_info = VersionInfo("bench", "0", "", 1, url, expected_hash, None)
+        with metrics.stage('hash'):
+            result['verified'] = verify_hash(save_path, version_info, 'x64')
+
+        if extract:
+            with metrics.stage('extract'):
+                extract_archive(save_path, os.path.join(work_dir, "extracted"), extractor=create_extractor(extractor))
+        result['ok'] = result['verified']
+    except Exception as e:
+        result['ok'] = False
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    session = metrics.to_dict()
+    result['stages'] = session['stages']
+    result['segments'] = session['segments']
+
+    result['total_seconds'] = round(time.perf_counter() - started, 4)
+    result['cpu_seconds'] = round(time.process_time() - cpu_started, 4)
+    result['peak_memory'] = peak_memory()
+    return result
+
+
+def run_child(args):
+    """子进程模式: 只执行一个测试用例, 把结果以 JSON 输出到标准输出"""
+    result = run_case(args.url, args.child_threads, args.expected_hash, args.extract, not args.no_hedge, args.extractor,
+                      args.chunks_file)
+    sys.stdout.write(json.dumps(result) + "\n")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="下载引擎基准测试")
+    parser.add_argument("--threads", default="1,2,4,8,16", help="逗号分隔的线程数列表")
+    parser.add_argument("--sizes", default="8M,64M,256M", help="逗号分隔的文件大小列表, 例如 8M,1G")
+    parser.add_argument("--repeat", type=int, default=1, help="每个组合重复的次数")
+    parser.add_argument("--bandwidth", type=int, default=0, help="服务器每个连接的带宽 (KB/s), 0 表示不限")
+    parser.add_argument("--latency", type=float, default=0.0, help="服务器每个请求的延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="服务器随机延迟上限 (毫秒)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="服务器注入故障的概率 (0-1)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="服务器把请求限制为慢速的概率 (0-1)")
+    parser.add_argument("--slow-bandwidth", type=int, default=64, help="慢连接的带宽 (KB/s)")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="服务器篡改响应中一个字节的概率 (0-1)")
+    parser.add_argument("--chunk-size", default="0",
+                        help="分块哈希的分块大小 (例如 1M), 提供后逐块校验并重新下载损坏的分块; 0 表示不使用")
+    parser.add_argument("--no-hedge", action="store_true", help="关闭下载末尾的对冲请求")
+    parser.add_argument("--work-dir", help="测试文件目录, 默认使用临时目录 (可重复使用已生成的文件)")
+    parser.add_argument("--no-extract", action="store_true", help="不测量解压阶段")
+    parser.add_argument("--extractor", choices=["auto", "py7zr", "7z"], default="auto",
+                        help="解压后端, auto 在安装了 py7zr 时使用进程内解压")
+    parser.add_argument("--output", default="bench_output.json", help="结果文件 (JSON)")
+    # 子进程参数
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--child-threads", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--expected-hash", help=argparse.SUPPRESS)
+    parser.add_argument("--extract", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--chunks-file", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.child:
+        return run_child(args)
+
+    thread_counts = [int(t) for t in args.threads.split(',') if t.strip()]
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    chunk_size = parse_size(args.chunk_size)
+
+    seven_zip = None
+    try:
+        seven_zip = find_seven_zip()
+    except ExtractionError:
+        pass
+    # 解压阶段使用的后端, 同时决定用什么打包测试文件; 都不可用时跳过解压阶段
+    extractor = None
+    if not args.no_extract:
+        extractor = create_extractor(args.extractor).name
+        if extractor == "7z" and not seven_zip:
+            extractor = "py7zr" if py7zr_available() else None
+        if extractor is None:
+            print("未找到 7z 且未安装 py7zr, 跳过解压阶段", file=sys.stderr)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="catpaw-bench-data-")
+    os.makedirs(work_dir, exist_ok=True)
+    packer = ("7z" if seven_zip else "py7zr") if extractor else None
+    payloads = {size: make_payload(work_dir, size, seven_zip, packer) for size in sizes}
+
+    server, port = start_server(work_dir, args)
+    results = []
+    try:
+        for size in sizes:
+            path, expected_hash = payloads[size]
+            url = f"http://127.0.0.1:{port}/{os.path.basename(path)}"
+            for threads in thread_counts:
+                for repeat in range(args.repeat):
+                    # 每个用例在独立进程中运行, CPU 和峰值内存互不影响
+                    command = [
+                        sys.executable, "-m", "bench.run", "--child", "--url", url,
+                        "--child-threads", str(threads), "--expected-hash", expected_hash,
+                    ]
+                    if extractor:
+                        command += ["--extract", "--extractor", extractor]
+                    if args.no_hedge:
+                        command.append("--no-hedge")
+                    if chunk_size:
+                        command += ["--chunks-file", write_chunk_hashes(path, chunk_size)]
+                    output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True).stdout
+                    result = json.loads(output.strip().splitlines()[-1])
+                    result['payload_size'] = size
+                    result['repeat'] = repeat
+                    results.append(result)
+                    print(f"size={size} threads={threads} repeat={repeat} ok={result['ok']} "
+                          f"total={result['total_seconds']}s throughput={result.get('throughput')}", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'server': {
+                'bandwidth': args.bandwidth * 1024,
+                'latency_ms': args.latency,
+                'jitter_ms': args.jitter,
+                'fail_rate': args.fail_rate,
+                'slow_rate': args.slow_rate,
+                'slow_bandwidth': args.slow_bandwidth * 1024,
+                'corrupt_rate': args.corrupt_rate,
+            },
+            'chunk_size': chunk_size or None,
+            'hedging': not args.no_hedge,
+            'extract': bool(extractor),
+            'extractor': extractor,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import sys
+import time
+import random
+import argparse
+from http.server import ThreadingHTTPServer
+
+from catpaw.mirror import RangeFileHandler
+
+
+class BenchHandler(RangeFileHandler):
+    """模拟 CDN: 支持 Range/ETag, 可配置每连接带宽、延迟、抖动、故障注入、慢连接和数据损坏"""
+
+    bandwidth = 0  # 每个连接的带宽 (字节/秒), 0 表示不限
+    latency = 0.0  # 每个请求的固定延迟 (秒)
+    jitter = 0.0  # 额外的随机延迟上限 (秒)
+    fail_rate = 0.0  # 请求失败的概率 (一半直接返回 503, 一半在传输中途断开)
+    slow_rate = 0.0  # 请求被限制为慢速的概率
+    slow_bandwidth = 64 * 1024  # 慢连接的带宽 (字节/秒)
+    corrupt_rate = 0.0  # 响应中一个字节被篡改的概率
+
+    def handle_file(self, head_only):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        self.cut_at = None
+        self.corrupt_at = random.random() if self.corrupt_rate and random.random() < self.corrupt_rate else None
+        self.request_bandwidth = self.bandwidth
+        if self.slow_rate and random.random() < self.slow_rate:
+            self.request_bandwidth = self.slow_bandwidth
+        if self.fail_rate and random.random() < self.fail_rate:
+            if random.random() < 0.5:
+                self.send_error(503)
+                return
+            self.cut_at = random.random()
+        RangeFileHandler.handle_file(self, head_only)
+
+    def send_body(self, f, start, length):
+        bandwidth = self.request_bandwidth
+        if not bandwidth and self.cut_at is None and self.corrupt_at is None:
+            RangeFileHandler.send_body(self, f, start, length)
+            return
+
+        f.seek(start)
+        limit = int(length * self.cut_at) if self.cut_at is not None else length
+        corrupt_at = int(length * self.corrupt_at) if self.corrupt_at is not None else -1
+        block_size = 64 * 1024
+        if bandwidth:
+            block_size = max(4096, min(block_size, bandwidth // 20))
+        started = time.monotonic()
+        sent = 0
+        while sent < limit:
+            data = f.read(min(block_size, limit - sent))
+            if not data:
+                break
+            if sent <= corrupt_at < sent + len(data):
+                # 模拟传输中的数据损坏
+                data = bytearray(data)
+                data[corrupt_at - sent] ^= 0xFF
+            self.wfile.write(data)
+            sent += len(data)
+            if bandwidth:
+                ahead = sent / bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        if self.cut_at is not None:
+            # 模拟连接在传输中途断开
+            self.close_connection = True
+            raise ConnectionAbortedError("injected failure")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="基准测试用的本地 Range 服务器")
+    parser.add_argument("--root", required=True, help="提供下载的文件目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 表示自动选择端口")
+    parser.add_argument("--bandwidth", type=int, default=0, help="每个连接的带宽 (KB/s), 0 表示不限")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机延迟上限 (毫秒)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="请求失败的概率 (0-1)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="请求被限制为慢速的概率 (0-1)")
+    parser.add_argument("--slow-bandwidth", type=int, default=64, help="慢连接的带宽 (KB/s)")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="响应中一个字节被篡改的概率 (0-1)")
+    args = parser.parse_args(argv)
+
+    class Handler(BenchHandler):
+        root_dir = args.root
+        bandwidth = args.bandwidth * 1024
+        latency = args.latency / 1000
+        jitter = args.jitter / 1000
+        fail_rate = args.fail_rate
+        slow_rate = args.slow_rate
+        slow_bandwidth = args.slow_bandwidth * 1024
+        corrupt_rate = args.corrupt_rate
+
+    httpd = ThreadingHTTPServer((args.host, args.port), Handler)
+    httpd.daemon_threads = True
+    # 第一行输出端口号, 供 run.py 读取
+    print(httpd.server_address[1], flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
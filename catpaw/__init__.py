@@ -0,0 +1,57 @@
+"""猫爪下载器的下载引擎, 不依赖 Tk, 可供界面、命令行和脚本共同使用"""
+from .manifest import (
+    API_BASE,
+    API_ENDPOINTS,
+    VersionInfo,
+    UpdateInfo,
+    parse_channel_manifest,
+    fetch_channel_versions,
+    latest_available,
+    find_version,
+    parse_update_manifest,
+    fetch_update_info,
+    version_file_for_arch,
+)
+from .engine import (
+    DownloadEngine,
+    DownloadTracker,
+    DownloadError,
+    HashMismatchError,
+    DownloadAborted,
+    DownloadCancelled,
+    RetryableError,
+    get_system_architecture,
+    split_ranges,
+    verify_hash,
+    download_verified,
+    install,
+)
+from .endpoints import Scoreboard, EndpointPool, SCOREBOARD, DOWNLOAD_ENDPOINTS
+from .writer import WriteBehind
+from .blockmap import BlockMap, build_blockmap, find_blocks, download_with_blockmap
+from .staging import InstallError, staged_install, install_archive, rollback, has_snapshot
+from .control import CancelToken
+from .selective import InstallIndex
+from .chunks import ChunkHashes, expected_chunks
+from .treehash import tree_digest, expected_tree_hash
+from .volumes import download_volumes, install_volumes, volume_files
+from .extract import (
+    ArchiveEntry,
+    ExtractionError,
+    UnsupportedMethodError,
+    SevenZipExtractor,
+    Py7zrExtractor,
+    create_extractor,
+    py7zr_available,
+    extract_archive,
+    list_archive,
+    find_seven_zip,
+)
+from .store import ArchiveCache
+from .mirror import MirrorServer, mirror_url
+from .ratelimit import RateLimiter, ConnectionBudget
+from .jobs import DownloadJob, DownloadQueue
+from .transport import RequestsTransport, Http2Transport, create_transport, http2_available
+from .prefetch import Prefetcher
+from .metrics import SegmentMetrics, SessionMetrics, MetricsRegistry, MetricsServer, MetricsFileWriter
+from .uiprobe import LagProbe
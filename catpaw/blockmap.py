@@ -0,0 +1,281 @@
+"""块映射 (zsync 式增量下载)
+
+发布者为新版本的压缩包生成块映射: 文件按 block_size 切块, 每块记录一个弱校验和与一个强校验和.
+下载器在本地的旧压缩包或其他文件中查找内容相同的块 (可以在任意偏移处), 复制找到的块,
+只通过分段引擎下载缺少的字节区间, 最后仍按 hashb2b/hashb2s 校验整个文件.
+"""
+import os
+import json
+import mmap
+import hashlib
+from itertools import accumulate
+from urllib.parse import urljoin
+
+from .engine import DownloadAborted, verify_hash
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 64 * 1024  # 弱校验和按 (b << 24) | a 组合, 块大小不能超过 64 KB
+ROLL_BUDGET = 16 * 1024 * 1024  # 每个本地文件逐字节搜索的字节数上限 (纯 Python 约 2 MB/s), 用完后只按块比较
+GIVE_UP_BYTES = 4 * 1024 * 1024  # 逐字节搜索这么多字节仍未找到任何块时放弃该文件 (多半与新文件无关)
+SCAN_SIZE = 1024 * 1024  # 逐字节搜索每次读取的长度
+RANGE_MERGE_GAP = 256 * 1024  # 缺少的区间之间相隔不到该值时合并为一个请求
+MAX_SOURCES = 3  # 自动查找时最多使用的本地文件数
+
+
+def weak_checksum(block):
+    """rsync 式弱校验和: a 为字节之和, b 为加权和 (第 i 个字节的权重为块长 - i), 返回 (b << 24) | a"""
+    return (sum(accumulate(block)) << 24) | sum(block)
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+class BlockMap:
+    """新文件的块映射: 长度、块大小和每块的 (弱校验和, 强校验和)"""
+
+    def __init__(self, block_size, length, blocks):
+        if not 0 < block_size <= MAX_BLOCK_SIZE:
+            raise ValueError(f"块大小必须在 1 到 {MAX_BLOCK_SIZE} 之间")
+        if len(blocks) != (length + block_size - 1) // block_size:
+            raise ValueError("块的数量与文件长度不一致")
+        self.block_size = block_size
+        self.length = length
+        self.weak = [int(weak) for weak, _ in blocks]
+        self.strong = [strong.lower() for _, strong in blocks]
+
+    def __len__(self):
+        return len(self.strong)
+
+    @property
+    def full_blocks(self):
+        """完整的块数 (末尾不足一块的部分总是下载)"""
+        return self.length // self.block_size
+
+    def block_range(self, index):
+        """第 index 块的 (start, end), end 为闭区间"""
+        start = index * self.block_size
+        return start, min(start + self.block_size, self.length) - 1
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(int(data['block_size']), int(data['length']), data['blocks'])
+
+    def to_json(self):
+        return json.dumps({
+            'block_size': self.block_size, 'length': self.length,
+            'blocks': [[weak, strong] for weak, strong in zip(self.weak, self.strong)],
+        }, separators=(',', ':'))
+
+
+def build_blockmap(path, block_size=DEFAULT_BLOCK_SIZE):
+    """为文件生成块映射 (供发布者使用)"""
+    blocks = []
+    length = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            length += len(block)
+            blocks.append([weak_checksum(block), strong_checksum(block)])
+    return BlockMap(block_size, length, blocks)
+
+
+def find_blocks(blockmap, paths, matches=None, on_log=None, roll_budget=ROLL_BUDGET):
+    """在本地文件中查找与新文件相同的块, 返回 {块序号: (文件路径, 偏移)}
+
+    每个位置先按整块比较强校验和 (相同或只是整体平移的内容在这一步就能连续匹配),
+    不匹配时逐字节滚动弱校验和重新对齐, 每个文件最多滚动 roll_budget 字节; 滚动 GIVE_UP_BYTES
+    仍没有找到任何块的文件被跳过.
+    """
+    matches = {} if matches is None else matches
+    for path in paths:
+        try:
+            found = _scan(blockmap, path, matches, roll_budget)
+        except (OSError, ValueError) as e:
+            if on_log:
+                on_log(f"读取本地文件失败: {path}: {str(e)}")
+            continue
+        if found and on_log:
+            on_log(f"在 {path} 中找到 {found} 个相同的块")
+    return matches
+
+
+def _scan(blockmap, path, matches, roll_budget):
+    block_size = blockmap.block_size
+    by_weak = {}
+    by_strong = {}
+    for i in range(blockmap.full_blocks):
+        if i not in matches:
+            by_weak.setdefault(blockmap.weak[i], []).append(i)
+            by_strong.setdefault(blockmap.strong[i], []).append(i)
+    if not by_strong:
+        return 0
+
+    def take(strong, offset):
+        # 内容相同的块 (例如全零的块) 一次全部匹配
+        indexes = by_strong.pop(strong, None)
+        if not indexes:
+            return False
+        for i in indexes:
+            matches[i] = (path, offset)
+            indexes_weak = by_weak.get(blockmap.weak[i])
+            if indexes_weak and i in indexes_weak:
+                indexes_weak.remove(i)
+                if not indexes_weak:
+                    del by_weak[blockmap.weak[i]]
+        return True
+
+    found = len(matches)
+    rolled = 0
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < block_size:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position = 0
+            while position + block_size <= size and by_strong:
+                if take(strong_checksum(data[position:position + block_size]), position):
+                    position += block_size
+                    continue
+                if rolled >= roll_budget:
+                    position += block_size
+                    continue
+                if rolled >= GIVE_UP_BYTES and len(matches) == found:
+                    break
+                end = min(size - block_size, position + SCAN_SIZE)
+                offset = _roll(data, position + 1, end, block_size, by_weak, take)
+                if offset is None:
+                    rolled += end + 1 - position
+                    position = end + 1
+                else:
+                    rolled += offset - position
+                    position = offset + block_size
+    return len(matches) - found
+
+
+def _roll(data, start, end, block_size, by_weak, take):
+    """从 start 到 end (含) 逐字节滚动弱校验和, 返回第一个强校验和也一致的偏移 (已记录匹配), 没有时返回 None"""
+    if start > end:
+        return None
+    window = data[start:end + block_size]
+    first = window[:block_size]
+    a = sum(first)
+    b = sum(accumulate(first))
+    offset = start
+    for dropped, added in zip(window, window[block_size:]):
+        if (b << 24) | a in by_weak and take(strong_checksum(data[offset:offset + block_size]), offset):
+            return offset
+        a += added - dropped
+        b += a - block_size * dropped
+        offset += 1
+    if (b << 24) | a in by_weak and take(strong_checksum(data[offset:offset + block_size]), offset):
+        return offset
+    return None
+
+
+def missing_ranges(blockmap, matches, merge_gap=RANGE_MERGE_GAP):
+    """没有找到的块合并成的字节区间 [(start, end)], 相隔不到 merge_gap 的区间合并为一个"""
+    ranges = []
+    for i in range(len(blockmap)):
+        if i in matches:
+            continue
+        start, end = blockmap.block_range(i)
+        if ranges and start - ranges[-1][1] - 1 < merge_gap:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def assemble(engine, blockmap, matches, save_path):
+    """创建长度为 blockmap.length 的文件, 把找到的块从本地文件复制到各自的位置"""
+    # 把来源和位置都连续的块合并成一次复制
+    runs = []
+    for i in sorted(matches):
+        path, offset = matches[i]
+        start, end = blockmap.block_range(i)
+        last = runs[-1] if runs else None
+        if last and last[0] == path and last[1] + last[3] == offset and last[2] + last[3] == start:
+            last[3] += end - start + 1
+        else:
+            runs.append([path, offset, start, end - start + 1])
+    engine.copy_ranges(save_path, blockmap.length, runs)
+
+
+def fetch_blockmap(engine, version_info):
+    """下载版本信息中的块映射 (地址可以相对于压缩包地址)"""
+    from .netwarm import shared_session
+
+    url = urljoin(version_info.url, version_info.blockmap)
+    response = shared_session().get(url, headers=engine.headers, timeout=engine.timeout)
+    response.raise_for_status()
+    return BlockMap.from_json(response.text)
+
+
+def local_sources(save_path, directories=(), extra=()):
+    """可供复用的本地文件: extra 中的文件 (目录展开为其中的文件), 以及 directories 中与 save_path
+    扩展名相同的其他文件 (按修改时间从新到旧, 最多 MAX_SOURCES 个)"""
+    sources = []
+    for path in extra or ():
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                sources.extend(os.path.join(root, name) for name in sorted(files))
+        elif os.path.isfile(path):
+            sources.append(path)
+
+    name = os.path.basename(save_path)
+    suffix = os.path.splitext(name)[1].lower()
+    candidates = []
+    for directory in directories:
+        if not directory or not os.path.isdir(directory):
+            continue
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            if entry != name and os.path.splitext(entry)[1].lower() == suffix and os.path.isfile(path):
+                candidates.append(path)
+    candidates.sort(key=os.path.getmtime, reverse=True)
+    seen = set()
+    result = []
+    for path in sources + candidates[:MAX_SOURCES]:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+def download_with_blockmap(engine, version_info, url, save_path, sources, arch=None):
+    """块映射模式: 复用本地文件中相同的块, 只下载缺少的区间; 结果通过哈希校验时返回 True
+
+    没有可复用的块、块映射不可用或结果校验失败时返回 False, 由调用方完整下载; 暂停和取消照常处理.
+    """
+    try:
+        blockmap = fetch_blockmap(engine, version_info)
+        with engine.metrics.stage('match'):
+            matches = find_blocks(blockmap, sources, on_log=engine.log)
+        if not matches:
+            engine.log("本地文件中没有可复用的块")
+            return False
+        ranges = missing_ranges(blockmap, matches)
+        needed = sum(end - start + 1 for start, end in ranges)
+        engine.log(f"复用本地的 {len(matches)}/{len(blockmap)} 个块, 需要下载 {needed / 1048576:.2f} MB "
+                   f"({len(ranges)} 个区间)")
+        with engine.metrics.stage('assemble'):
+            assemble(engine, blockmap, matches, save_path)
+        if ranges:
+            engine.fetch_ranges(url, save_path, ranges, blockmap.length)
+    except DownloadAborted:
+        raise
+    except Exception as e:
+        engine.log(f"块复用失败, 改为完整下载: {str(e)}")
+        return False
+
+    with engine.metrics.stage('hash'):
+        verified = verify_hash(save_path, version_info, arch)
+    if not verified:
+        os.remove(save_path)
+        engine.log("复用块后的文件哈希校验失败, 改为完整下载")
+    return verified
@@ -0,0 +1,65 @@
+import hashlib
+
+READ_SIZE = 1024 * 1024
+
+
+class ChunkHashes:
+    """分块哈希列表: 文件按 chunk_size 切成若干块, 每块一个 BLAKE2 哈希, 用于找出并重新下载损坏的分块"""
+
+    def __init__(self, chunk_size, hashes, new_hash):
+        self.chunk_size = chunk_size
+        self.hashes = [h.strip().lower() for h in hashes]
+        self.new_hash = new_hash  # 创建哈希对象的函数
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def matches(self, total_size):
+        """哈希数量是否与文件大小一致"""
+        return total_size > 0 and len(self.hashes) == (total_size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_range(self, index, total_size):
+        """第 index 块的 (start, end), end 为闭区间"""
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, total_size) - 1
+
+    def indexes(self, start, end, total_size):
+        """完全位于 [start, end] 内的分块序号"""
+        index = (start + self.chunk_size - 1) // self.chunk_size
+        while index < len(self.hashes) and self.chunk_range(index, total_size)[1] <= end:
+            yield index
+            index += 1
+
+    def verify(self, f, index, offset, length):
+        """校验已打开文件中从 offset 开始、长度为 length 的数据是否为第 index 块"""
+        hash_algo = self.new_hash()
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(READ_SIZE, remaining))
+            if not block:
+                return False
+            hash_algo.update(block)
+            remaining -= len(block)
+        return hash_algo.hexdigest() == self.hashes[index]
+
+    def bad_chunks(self, path, base, start, end, total_size):
+        """校验 [start, end] 内的分块, path 为从文件 base 位置开始的数据, 返回校验失败的分块序号"""
+        bad = []
+        with open(path, 'rb') as f:
+            for index in self.indexes(start, end, total_size):
+                chunk_start, chunk_end = self.chunk_range(index, total_size)
+                if not self.verify(f, index, chunk_start - base, chunk_end - chunk_start + 1):
+                    bad.append(index)
+        return bad
+
+
+def expected_chunks(version_info, arch):
+    """返回当前架构对应的分块哈希列表 (与 expected_hash 使用相同的算法), 清单未提供时返回 None"""
+    if arch == 'x86':
+        hashes, new_hash = version_info.chunkb2s, lambda: hashlib.blake2s(digest_size=32)
+    else:
+        hashes, new_hash = version_info.chunkb2b, lambda: hashlib.blake2b(digest_size=32)
+    if not version_info.chunk_size or not hashes:
+        return None
+    return ChunkHashes(version_info.chunk_size, hashes.split(','), new_hash)
@@ -0,0 +1,325 @@
+import sys
+import json
+import hashlib
+import time
+import argparse
+from threading import Lock
+
+from .engine import get_system_architecture, HashMismatchError
+from .extract import ExtractionError, create_extractor, py7zr_available
+from .staging import InstallError, rollback
+from .blockmap import build_blockmap, DEFAULT_BLOCK_SIZE
+from .treehash import tree_digest, DEFAULT_LEAF_SIZE
+from .ratelimit import RateLimiter
+from .jobs import DownloadQueue, RUNNING, DONE, CANCELLED
+from .transport import create_transport, http2_available
+from .metrics import MetricsServer, MetricsFileWriter
+from .mirror import MirrorServer, DEFAULT_MIRROR_PORT
+from .prefetch import Prefetcher
+from .netwarm import shared_session
+from .endpoints import SCOREBOARD, DOWNLOAD_ENDPOINTS
+from .manifest import API_ENDPOINTS, fetch_channel_versions, parse_channel_manifest, latest_available, find_version
+
+HEADERS = {"User-Agent": "RF-Py1-Api/cli"}
+_emit_lock = Lock()
+
+
+def emit(event, **fields):
+    """向标准输出写入一行 JSON 事件, 供脚本和 CI 解析"""
+    record = {'event': event, 'time': round(time.time(), 3)}
+    record.update(fields)
+    with _emit_lock:
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+def load_manifest(source):
+    """从 URL 或本地文件读取通道清单"""
+    if source.startswith(('http://', 'https://')):
+        response = shared_session().get(source, headers=HEADERS, timeout=10)
+        response.raise_for_status()
+        return parse_channel_manifest(response.text)
+    with open(source, 'r', encoding='utf-8') as f:
+        return parse_channel_manifest(f.read())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="catpaw", description="猫爪下载器命令行版本 (无界面)")
+    parser.add_argument("--channel", choices=["beta", "stable"], default="stable", help="更新通道")
+    parser.add_argument("--ver-code", help="版本代码, 默认使用最新可用版本")
+    parser.add_argument("--target", help="离线包保存目录")
+    parser.add_argument("--threads", type=int, default=4, help="每个任务的下载线程数")
+    parser.add_argument("--job", action="append", default=[], metavar="CHANNEL[:VER_CODE]",
+                        help="加入下载队列的任务 (可重复), 例如 --job beta --job stable:1234")
+    parser.add_argument("--max-jobs", type=int, default=2, help="同时运行的任务数")
+    parser.add_argument("--max-connections", type=int, default=16, help="所有任务合计的连接数上限")
+    parser.add_argument("--disk-limit", type=int, default=0, help="所有任务合计的写盘限速 (KB/s), 0 表示不限速")
+    parser.add_argument("--extract-to", help="下载后解压到的客户端目录")
+    parser.add_argument("--no-staging", action="store_true",
+                        help="直接解压到客户端目录 (默认先解压到临时目录再整体替换, 并保留上一个版本的快照)")
+    parser.add_argument("--full-extract", action="store_true",
+                        help="解压全部文件 (默认按压缩包中的大小和 CRC32 只写入内容有变化的文件, 并删除新版本不再包含的文件)")
+    parser.add_argument("--rollback", action="store_true", help="把 --extract-to 指定的客户端目录换回上一个版本的快照")
+    parser.add_argument("--extractor", choices=["auto", "py7zr", "7z"], default="auto",
+                        help="解压后端: py7zr 为进程内解压 (需要 py7zr), 7z 调用 7z 可执行文件; auto 优先进程内解压")
+    parser.add_argument("--arch", choices=["x86", "x64", "arm64"], help="覆盖自动检测的系统架构 (决定哈希算法)")
+    parser.add_argument("--rate-limit", type=int, default=0, help="所有连接合计的限速 (KB/s), 0 表示不限速")
+    parser.add_argument("--retries", type=int, default=5, help="每个分段出错后的最大重试次数 (从已下载的位置继续)")
+    parser.add_argument("--failure-budget", type=int, default=20, help="每个任务所有分段合计允许的失败次数, 超过后任务失败")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="用这么多个子进程下载一个文件的各分段 (适用于高带宽的局域网镜像, 不支持 --rate-limit), 0 表示只用线程")
+    parser.add_argument("--no-hedge", action="store_true", help="下载末尾不为最慢的分段发起对冲请求")
+    parser.add_argument("--http2", action="store_true", help="使用 HTTP/2 在一个连接上并发传输所有分段 (需要 httpx[http2], 否则回退到 HTTP/1.1)")
+    parser.add_argument("--report", help="结束后写入 JSON 会话报告 (每个分段的首字节时间、吞吐量、重试、停顿, 以及各阶段耗时)")
+    parser.add_argument("--metrics-port", type=int, help="在本机该端口提供 /metrics (Prometheus 文本) 和 /report (JSON)")
+    parser.add_argument("--metrics-file", help="定期把 Prometheus 文本格式的指标写入该文件")
+    parser.add_argument("--interval", type=float, default=0.5, help="进度事件的最小间隔 (秒)")
+    parser.add_argument("--manifest", help="使用指定的通道清单 (URL 或本地文件) 代替官方 API")
+    parser.add_argument("--api-endpoint", action="append", default=[], metavar="URL",
+                        help="等价的 API 服务器 (可重复, 替换默认地址), 按延迟选择, 失败时自动切换")
+    parser.add_argument("--download-endpoint", action="append", default=[], metavar="URL",
+                        help="与版本信息中的下载主机等价的主机 (可重复), 按延迟和吞吐量选择, 失败时自动切换")
+    parser.add_argument("--scoreboard", help="保存各端点延迟、吞吐量和失败记录的文件, 下次运行时沿用")
+    parser.add_argument("--mirror", action="append", default=[], help="优先使用的局域网镜像地址 (可重复), 失败时回退到官方地址")
+    parser.add_argument("--cache", help="已校验压缩包的缓存目录")
+    parser.add_argument("--reuse", action="append", default=[], metavar="PATH",
+                        help="清单提供块映射时可复用的本地文件或目录 (可重复), 与 --target 和 --cache 中的旧压缩包一起查找相同的块")
+    parser.add_argument("--make-blockmap", metavar="FILE",
+                        help="为发布的压缩包生成块映射 (写入 FILE.blockmap, 清单中以 blockmap= 引用)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="生成块映射时的块大小 (字节, 最大 65536)")
+    parser.add_argument("--tree-hash", metavar="FILE",
+                        help="计算发布的压缩包的 BLAKE2 树模式哈希 (清单中的 treeb2b= / treeb2s=, 可以并行校验)")
+    parser.add_argument("--leaf-size", type=int, default=DEFAULT_LEAF_SIZE,
+                        help="树模式哈希的叶子大小 (字节), 不是默认值时在清单中以 treeleaf= 给出")
+    parser.add_argument("--serve", action="store_true", help="以局域网镜像模式运行, 对外提供 --cache 目录中已校验的压缩包")
+    parser.add_argument("--bind", default="0.0.0.0", help="镜像模式监听地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_MIRROR_PORT, help="镜像模式监听端口")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="以后台预取模式运行, 有新的正式版本 (level=1) 时下载到 --cache 目录 (默认限速 512 KB/s)")
+    parser.add_argument("--list", action="store_true", help="只列出通道内的版本")
+    return parser
+
+
+def serve(args):
+    """镜像模式: 一直运行直到被中断"""
+    if not args.cache:
+        emit("error", stage="args", message="镜像模式需要 --cache")
+        return 2
+    server = MirrorServer(args.cache, host=args.bind, port=args.port)
+    emit("serve", cache=server.cache.cache_dir, host=args.bind, port=server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+def prefetch(args):
+    """预取模式: 定期检查通道, 一直运行直到被中断"""
+    if not args.cache:
+        emit("error", stage="args", message="预取模式需要 --cache")
+        return 2
+
+    def fetch_versions():
+        return load_manifest(args.manifest) if args.manifest else fetch_channel_versions(args.channel, headers=HEADERS)
+
+    prefetcher = Prefetcher(
+        args.cache, fetch_versions, rate=(args.rate_limit or 512) * 1024, headers=HEADERS,
+        arch=args.arch or get_system_architecture(), idle_delay=0,
+        on_log=lambda message: emit("log", message=message),
+        on_done=lambda v: emit("prefetched", version=v.version, ver_code=v.ver_code, cache=args.cache),
+    ).start()
+    emit("prefetch", channel=args.channel, cache=args.cache)
+    try:
+        while not prefetcher.stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        prefetcher.stop()
+    return 0
+
+
+def resolve_jobs(args):
+    """把 --job / --channel / --ver-code 解析为 (通道, 版本) 列表"""
+    specs = args.job or [f"{args.channel}:{args.ver_code}" if args.ver_code else args.channel]
+    manifests = {}
+    resolved = []
+    for spec in specs:
+        channel, _, ver_code = spec.partition(':')
+        if channel not in manifests:
+            manifests[channel] = load_manifest(args.manifest) if args.manifest else fetch_channel_versions(channel, headers=HEADERS)
+        versions = manifests[channel]
+        version_info = find_version(versions, ver_code) if ver_code else latest_available(versions)
+        if version_info is None:
+            raise LookupError(f"通道 {channel} 中找不到版本 {ver_code}".strip())
+        resolved.append((channel, version_info))
+    return resolved
+
+
+def setup_endpoints(args):
+    """按参数配置等价端点; 有多个端点时先并行探测一次延迟"""
+    if args.scoreboard:
+        SCOREBOARD.load(args.scoreboard)
+    if args.api_endpoint:
+        API_ENDPOINTS.set_bases(args.api_endpoint)
+    DOWNLOAD_ENDPOINTS.set_bases(args.download_endpoint)
+    for name, pool in (("api", API_ENDPOINTS), ("download", DOWNLOAD_ENDPOINTS)):
+        if len(pool.bases) > 1:
+            emit("endpoints", kind=name, ranked=pool.probe())
+
+
+def rollback_client(args):
+    """回滚模式: 换回上一个版本的快照"""
+    if not args.extract_to:
+        emit("error", stage="args", message="回滚需要 --extract-to")
+        return 2
+    try:
+        rollback(args.extract_to)
+    except InstallError as e:
+        emit("error", stage="rollback", message=str(e))
+        return 1
+    emit("rollback", client_dir=args.extract_to)
+    return 0
+
+
+def make_blockmap(args):
+    """发布模式: 为压缩包生成块映射文件"""
+    path = args.make_blockmap + ".blockmap"
+    try:
+        blockmap = build_blockmap(args.make_blockmap, args.block_size)
+        with open(path, 'w') as f:
+            f.write(blockmap.to_json())
+    except (OSError, ValueError) as e:
+        emit("error", stage="blockmap", message=str(e))
+        return 1
+    emit("blockmap", path=path, blocks=len(blockmap), block_size=blockmap.block_size)
+    return 0
+
+
+def tree_hash(args):
+    """发布模式: 计算压缩包的树模式哈希"""
+    try:
+        treeb2b = tree_digest(args.tree_hash, hashlib.blake2b, args.leaf_size)
+        treeb2s = tree_digest(args.tree_hash, hashlib.blake2s, args.leaf_size)
+    except (OSError, ValueError) as e:
+        emit("error", stage="treehash", message=str(e))
+        return 1
+    emit("treehash", path=args.tree_hash, treeb2b=treeb2b, treeb2s=treeb2s, leaf_size=args.leaf_size)
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    setup_endpoints(args)
+
+    if args.rollback:
+        return rollback_client(args)
+
+    if args.make_blockmap:
+        return make_blockmap(args)
+
+    if args.tree_hash:
+        return tree_hash(args)
+
+    if args.serve:
+        return serve(args)
+
+    if args.prefetch:
+        return prefetch(args)
+
+    if args.list:
+        try:
+            versions = load_manifest(args.manifest) if args.manifest else fetch_channel_versions(args.channel, headers=HEADERS)
+        except Exception as e:
+            emit("error", stage="manifest", message=str(e))
+            return 1
+        for v in versions:
+            emit("version", version=v.version, ver_code=v.ver_code, level=v.level, url=v.url)
+        return 0
+
+    if not args.target:
+        emit("error", stage="args", message="缺少 --target")
+        return 2
+
+    try:
+        resolved = resolve_jobs(args)
+    except Exception as e:
+        emit("error", stage="manifest", message=str(e))
+        return 1
+
+    def on_job_done(job):
+        if job.state == DONE:
+            emit("done", job=job.id, path=job.path, extracted=bool(job.client_dir),
+                 seconds=round(time.time() - started, 3))
+        elif job.state == CANCELLED:
+            emit("cancelled", job=job.id)
+        else:
+            if isinstance(job.error, HashMismatchError):
+                stage = "verify"
+            elif isinstance(job.error, (ExtractionError, InstallError)):
+                stage = "extract"
+            else:
+                stage = "download"
+            emit("error", job=job.id, stage=stage, message=str(job.error))
+
+    transport = create_transport(http2=args.http2, pool_size=args.max_connections)
+    if args.http2 and not http2_available():
+        emit("log", message="未安装 httpx[http2], 使用 HTTP/1.1 连接池")
+    if args.extractor == "py7zr" and not py7zr_available():
+        emit("log", message="未安装 py7zr, 使用 7z 解压")
+    queue = DownloadQueue(
+        max_connections=args.max_connections, max_jobs=args.max_jobs,
+        limiter=RateLimiter(args.rate_limit * 1024), disk_limiter=RateLimiter(args.disk_limit * 1024),
+        headers=HEADERS, arch=args.arch or get_system_architecture(), mirrors=args.mirror, cache_dir=args.cache,
+        on_log=lambda job, message: emit("log", job=job.id, message=message),
+        on_extract_output=lambda job, line: emit("extract", job=job.id, line=line.rstrip()),
+        on_job_done=on_job_done, transport=transport, extractor=create_extractor(args.extractor),
+        staged=not args.no_staging, selective=not args.full_extract, reuse=args.reuse,
+        engine_options={'retries': args.retries, 'failure_budget': args.failure_budget, 'hedging': not args.no_hedge,
+                        'processes': args.processes},
+    )
+    metrics_server = MetricsServer(queue.registry, port=args.metrics_port).start() if args.metrics_port else None
+    metrics_writer = MetricsFileWriter(queue.registry, args.metrics_file).start() if args.metrics_file else None
+    started = time.time()
+    jobs = []
+    for channel, version_info in resolved:
+        job = queue.submit(version_info, args.target, threads=args.threads, channel=channel, client_dir=args.extract_to)
+        if job in jobs:
+            continue
+        jobs.append(job)
+        emit("start", job=job.id, channel=channel, version=version_info.version, ver_code=version_info.ver_code,
+             threads=args.threads, target=args.target)
+
+    # 主线程定期输出每个任务的进度; Ctrl+C 取消所有任务并删除临时文件
+    try:
+        while queue.active():
+            for job in jobs:
+                extract_progress = job.extract_progress if job.state == RUNNING else None
+                if extract_progress:
+                    emit("extract_progress", job=job.id, **extract_progress)
+                    continue
+                progress = job.progress() if job.state == RUNNING else None
+                if progress:
+                    emit("progress", job=job.id, downloaded=progress['downloaded'], total=progress['total'],
+                         percent=round(progress['percent'], 2), speed=round(progress['speed']),
+                         remaining=round(progress['remaining'], 1))
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        emit("log", message="正在取消下载")
+        for job in jobs:
+            job.cancel()
+    queue.wait()
+    queue.shutdown()
+
+    if args.report:
+        queue.registry.write_report(args.report)
+        emit("report", path=args.report)
+    if metrics_writer:
+        metrics_writer.stop()
+    if metrics_server:
+        metrics_server.stop()
+
+    return 0 if all(job.state == DONE for job in jobs) else 1
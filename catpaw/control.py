@@ -0,0 +1,71 @@
+from threading import Condition, Lock
+
+# 令牌状态
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+
+
+class CancelToken:
+    """下载的控制令牌: 界面线程暂停、继续或取消, 下载的所有工作线程共用同一个令牌
+
+    状态变为暂停或取消时依次调用已注册的回调 (引擎在回调中断开正在进行的连接).
+    """
+
+    def __init__(self):
+        self._cond = Condition()
+        self._state = RUNNING
+        self._listeners = []
+        self._listeners_lock = Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def paused(self):
+        return self._state == PAUSED
+
+    @property
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def add_listener(self, callback):
+        with self._listeners_lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._listeners_lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _set(self, state, allowed):
+        with self._cond:
+            if self._state not in allowed:
+                return False
+            self._state = state
+            self._cond.notify_all()
+        if state != RUNNING:
+            with self._listeners_lock:
+                listeners = list(self._listeners)
+            for callback in listeners:
+                callback()
+        return True
+
+    def pause(self):
+        """暂停: 断开连接, 已下载的数据保留"""
+        return self._set(PAUSED, (RUNNING,))
+
+    def resume(self):
+        """继续: 从已保存的位置继续下载"""
+        return self._set(RUNNING, (PAUSED,))
+
+    def cancel(self):
+        """取消: 中止下载并删除临时文件"""
+        return self._set(CANCELLED, (RUNNING, PAUSED))
+
+    def wait_resumed(self, timeout=None):
+        """暂停时等待继续或取消, 返回是否可以继续下载 (未被取消)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._state != PAUSED, timeout)
+            return self._state == RUNNING
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlsplit
+
+from .netwarm import shared_session
+
+EWMA_WEIGHT = 0.3  # 新样本在延迟和吞吐量滑动平均中的权重
+SCORE_BYTES = 4 * 1024 * 1024  # 评分时假设的传输量: 得分 = 延迟 + SCORE_BYTES / 吞吐量 (秒, 越小越好)
+FAILURE_COOLDOWN = 300  # 端点失败后排到最后的时间 (秒)
+
+
+def origin(url):
+    """url 的 scheme://host[:port] 部分"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class Scoreboard:
+    """各端点观测到的延迟、吞吐量和最近一次失败时间, 指定 path 时持久化为 JSON 文件"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.lock = Lock()
+        if path:
+            self.load(path)
+
+    def load(self, path):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            self.entries = entries if isinstance(entries, dict) else {}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"保存端点记录失败: {str(e)}")
+
+    def _update(self, base, **samples):
+        with self.lock:
+            entry = self.entries.setdefault(base, {})
+            for key, value in samples.items():
+                previous = entry.get(key)
+                entry[key] = value if previous is None else previous + (value - previous) * EWMA_WEIGHT
+            entry['failed_at'] = None
+            self._save()
+
+    def record_latency(self, base, seconds):
+        """记录一次请求从发出到收到响应头的时间"""
+        self._update(base, latency=seconds)
+
+    def record_transfer(self, base, size, seconds):
+        """记录一次下载的数据量和耗时"""
+        if size > 0 and seconds > 0:
+            self._update(base, throughput=size / seconds)
+
+    def record_failure(self, base):
+        with self.lock:
+            self.entries.setdefault(base, {})['failed_at'] = time.time()
+            self._save()
+
+    def ranked(self, bases):
+        """按 (最近是否失败, 预计耗时) 从好到差排序, 得分相同时保持原顺序
+
+        缺少延迟或吞吐量记录的端点按其他候选端点的中位数估算, 不会因为没有记录而总是排在前面或后面.
+        """
+        with self.lock:
+            entries = [dict(self.entries.get(base, {})) for base in bases]
+        latency = _median([entry['latency'] for entry in entries if entry.get('latency')]) or 0.0
+        throughput = _median([entry['throughput'] for entry in entries if entry.get('throughput')])
+        now = time.time()
+
+        def score(item):
+            entry = item[1]
+            failed_at = entry.get('failed_at')
+            seconds = entry.get('latency') or latency
+            if entry.get('throughput') or throughput:
+                seconds += SCORE_BYTES / (entry.get('throughput') or throughput)
+            return failed_at is not None and now - failed_at < FAILURE_COOLDOWN, seconds
+
+        return [base for base, _ in sorted(zip(bases, entries), key=score)]
+
+
+def _median(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+SCOREBOARD = Scoreboard()
+
+
+class EndpointPool:
+    """一组提供相同内容的端点 (scheme://host[:port]): 请求发往当前得分最好的端点, 失败时依次尝试其余端点"""
+
+    def __init__(self, bases=None, scoreboard=None):
+        self.bases = [base.rstrip('/') for base in (bases or [])]
+        self.scoreboard = scoreboard or SCOREBOARD
+
+    def set_bases(self, bases):
+        self.bases = [base.rstrip('/') for base in bases]
+
+    def ranked(self, first=None):
+        """按得分排序的端点; first 为额外的候选端点, 得分相同时排在最前"""
+        bases = list(self.bases)
+        if first:
+            bases = [first] + [base for base in bases if base != first]
+        return self.scoreboard.ranked(bases)
+
+    def best(self):
+        ranked = self.ranked()
+        return ranked[0] if ranked else None
+
+    def urls(self, url):
+        """把 url 换到各个等价端点上, 按得分排序; url 自身的主机也是候选之一, 没有记录时优先使用
+
+        只有主机在端点列表中的地址才会被替换 (例如下载器自身的更新不会被换到游戏的下载服务器上), 否则返回 [url].
+        """
+        parts = urlsplit(url)
+        if parts.netloc and origin(url).lower() not in (base.lower() for base in self.bases):
+            return [url]
+        suffix = url[len(origin(url)):] if parts.netloc else url
+        return [base + suffix for base in self.ranked(origin(url))]
+
+    def probe(self, path="/", timeout=5):
+        """并行请求每个端点, 记录响应延迟; 返回按得分排序的端点"""
+        def probe_one(base):
+            started = time.monotonic()
+            try:
+                with shared_session().get(base + path, timeout=timeout, stream=True):
+                    pass
+                self.scoreboard.record_latency(base, time.monotonic() - started)
+            except Exception:
+                self.scoreboard.record_failure(base)
+
+        if self.bases:
+            with ThreadPoolExecutor(max_workers=len(self.bases)) as executor:
+                list(executor.map(probe_one, self.bases))
+        return self.ranked()
+
+    def get(self, path, headers=None, timeout=10):
+        """按得分依次向各端点发送 GET 请求, 返回第一个成功的响应; 全部失败时抛出最后一个错误"""
+        last_error = None
+        for base in self.ranked():
+            try:
+                response = shared_session().get(base + path, headers=headers, timeout=timeout)
+                response.raise_for_status()
+            except Exception as e:
+                self.scoreboard.record_failure(base)
+                last_error = e
+                continue
+            # 清单很小, 只记录延迟; 吞吐量来自真正的下载
+            self.scoreboard.record_latency(base, response.elapsed.total_seconds())
+            return response
+        raise last_error or ValueError("没有可用的端点")
+
+
+DOWNLOAD_ENDPOINTS = EndpointPool()  # 下载服务器的等价主机, 默认为空 (只使用版本信息中的地址)
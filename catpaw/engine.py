@@ -0,0 +1,1054 @@
+import os
+import json
+import time
+import random
+import shutil
+import hashlib
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Thread, Lock, Event, local
+
+from .transport import create_transport
+from .metrics import SessionMetrics
+from .chunks import expected_chunks
+from .treehash import expected_tree_hash, tree_digest
+from .writer import WriteBehind
+from .control import CancelToken, RUNNING
+from .endpoints import SCOREBOARD, DOWNLOAD_ENDPOINTS, origin
+
+DEFAULT_HEADERS = {"User-Agent": "RF-Py1-Api/engine"}  # 未指定时使用的UA
+MIN_BUFFER_SIZE = 64 * 1024  # 接收缓冲区的最小值, 也是无法使用 readinto 时每次读取的块大小
+MAX_BUFFER_SIZE = 4 * 1024 * 1024  # 接收缓冲区的最大值
+BUFFER_TARGET_SECONDS = 0.25  # 按吞吐量调整缓冲区, 使每次读取大约需要这么长时间
+RESUME_SUFFIX = ".resume"  # 续传记录文件的后缀
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)  # 可以重试的 HTTP 状态码
+STALL_TIMEOUT = 15  # 连接超过该时间 (秒) 没有收到数据视为停顿, 断开重连
+WATCH_WINDOW = 3.0  # 看门狗比较各连接速度的时间窗口 (秒)
+SLOW_RATIO = 0.1  # 速度低于其他连接中位数的该比例时断开重连
+MAX_SLOW_RECONNECTS = 3  # 每个分段因速度过慢重连的次数上限
+HEDGE_MIN_BYTES = 1024 * 1024  # 剩余数据少于该值的分段不发起对冲请求
+HEDGE_MIN_SECONDS = 2.0  # 预计剩余时间少于该值的分段不发起对冲请求
+
+
+# 获取系统架构
+def get_system_architecture():
+    arch = platform.machine().lower()
+    if 'amd64' in arch or 'x86_64' in arch:
+        return 'x64'
+    elif 'x86' in arch or arch in ('i386', 'i686'):
+        return 'x86'
+    elif 'arm64' in arch or 'aarch64' in arch:
+        return 'arm64'
+    else:
+        raise ValueError(f"Unsupported system architecture: {arch}")
+
+
+class DownloadError(Exception):
+    """下载过程中发生的错误"""
+
+
+class HashMismatchError(DownloadError):
+    """下载文件的哈希值与版本信息不一致"""
+
+
+class DownloadAborted(DownloadError):
+    """下载被中止 (调用了 stop 或其他分段失败)"""
+
+
+class DownloadCancelled(DownloadAborted):
+    """下载被取消 (CancelToken.cancel), 临时文件已删除"""
+
+
+class RetryableError(DownloadError):
+    """可以重试的错误: 连接提前结束或服务器暂时不可用"""
+
+
+class _Reconnect(Exception):
+    """看门狗要求断开重连 (不计入失败次数)"""
+
+
+class _Cancelled(Exception):
+    """同一分段的另一个请求已经先完成"""
+
+
+class _Transfer:
+    """一个分段正在进行的传输 (原请求或对冲请求), 看门狗据此比较速度, 并可要求其停止"""
+
+    def __init__(self, index, start, end, primary=None):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.offset = start  # 下一个要写入的字节
+        self.is_hedge = primary is not None
+        self.primary = primary  # 对冲请求对应的原请求
+        self.hedge = None  # 原请求对应的对冲请求
+        self.stop = None  # 看门狗或对冲请求设置的异常, 接收数据时抛出
+        self.done = False
+        self.rate = None  # 上一个窗口内的速度 (字节/秒)
+        self.slow_reconnects = 0
+        self._window_bytes = 0
+        self._window_started = time.monotonic()
+
+    @property
+    def remaining(self):
+        return self.end - self.offset + 1
+
+    def restart(self, offset):
+        self.offset = offset
+        self.stop = None
+        self.rate = None
+        self._window_bytes = 0
+        self._window_started = time.monotonic()
+
+    def received(self, size):
+        self.offset += size
+        self._window_bytes += size
+
+    def sample(self, now, window):
+        """每个窗口结束时更新速度"""
+        elapsed = now - self._window_started
+        if elapsed >= window:
+            self.rate = self._window_bytes / elapsed
+            self._window_bytes = 0
+            self._window_started = now
+
+
+class DownloadTracker:
+    def __init__(self, total_size):
+        self.total_size = total_size
+        self.downloaded = 0
+        self.lock = Lock()
+        self.start_time = time.time()
+        self.last_update = self.start_time
+        self.last_downloaded = 0
+        self.speed = 0
+        self.remaining_time = 0
+
+    def update(self, size):
+        with self.lock:
+            self.downloaded += size
+
+    def get_progress(self):
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            percent = (self.downloaded / self.total_size) * 100 if self.total_size else 0
+            self.speed = (self.downloaded - self.last_downloaded) / (time.time() - self.last_update + 1e-9)
+            self.last_downloaded = self.downloaded
+            self.last_update = time.time()
+
+            self.remaining_time = (self.total_size - self.downloaded) / self.speed if self.speed > 0 else 0
+
+            return {
+                'percent': percent,
+                'downloaded': self.downloaded,
+                'total': self.total_size,
+                'speed': self.speed,
+                'remaining': self.remaining_time,
+                'elapsed': elapsed,
+            }
+
+    def _human_size(self, size):
+        units = ('B', 'KB', 'MB', 'GB')
+        index = 0
+        while size >= 1024 and index < 3:
+            size /= 1024
+            index += 1
+        return f"{size:.2f} {units[index]}"
+
+    def _format_time(self, seconds):
+        if seconds <= 0:
+            return "--:--"
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        days, hours = divmod(hours, 24)
+        if days > 0:
+            return f"{int(days)}天 {int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+        elif hours > 0:
+            return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+        return f"{int(minutes):02}:{int(seconds):02}"
+
+
+def split_ranges(total_size, num_parts, align=1):
+    """把文件按线程数切分为 (start, end, index) 区间, end 为闭区间; 区间的边界对齐到 align 的整数倍"""
+    blocks = (total_size + align - 1) // align
+    num_parts = max(1, min(num_parts, blocks))
+    chunk_size = blocks // num_parts * align
+    ranges = []
+    for i in range(num_parts):
+        start = i * chunk_size
+        end = start + chunk_size - 1
+        if i == num_parts - 1:
+            end = total_size - 1
+        ranges.append((start, end, i))
+    return ranges
+
+
+def split_spans(spans, num_parts):
+    """把若干 (start, end) 区间切成长度不超过平均值的分段 [(start, end, index)], 区间较多时不再切分"""
+    total = sum(end - start + 1 for start, end in spans)
+    limit = max(1, -(-total // max(1, num_parts)))
+    parts = []
+    for start, end in spans:
+        while end - start + 1 > limit:
+            parts.append((start, start + limit - 1, len(parts)))
+            start += limit
+        parts.append((start, end, len(parts)))
+    return parts
+
+
+def expected_hash(version_info, arch):
+    """返回当前架构对应的期望哈希值与哈希对象"""
+    # 根据系统架构选择哈希算法
+    if arch == 'x86':
+        return version_info.hashb2s, hashlib.blake2s(digest_size=32)
+    return version_info.hashb2b, hashlib.blake2b(digest_size=32)
+
+
+def verify_hash(file_path, version_info, arch=None):
+    """校验文件的 BLAKE2 哈希值; 清单提供树模式哈希 (treeb2b/treeb2s) 时各叶子在多个线程中并行计算"""
+    try:
+        arch = arch or get_system_architecture()
+        tree = expected_tree_hash(version_info, arch)
+        if tree:
+            expected, new_hash, leaf_size = tree
+            return tree_digest(file_path, new_hash, leaf_size) == expected
+
+        expected, hash_algo = expected_hash(version_info, arch)
+
+        # 计算文件哈希值
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                hash_algo.update(chunk)
+        actual_hash = hash_algo.hexdigest()
+
+        # 比较哈希值
+        return actual_hash.lower() == expected.lower()
+
+    except Exception as e:
+        print(f"哈希校验失败: {str(e)}")
+        return False
+
+
+class DownloadEngine:
+    """多线程分段下载引擎, 进度和日志通过回调通知调用方"""
+
+    def __init__(self, threads=4, headers=None, on_progress=None, on_log=None, timeout=30, limiter=None,
+                 budget=None, disk_limiter=None, transport=None, metrics=None, retries=5, failure_budget=20,
+                 backoff=0.5, max_backoff=15, stall_timeout=STALL_TIMEOUT, hedging=True, resume=False, writer=None,
+                 token=None, processes=0):
+        self.threads = max(1, int(threads))
+        self.headers = dict(headers or DEFAULT_HEADERS)
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.timeout = timeout  # 建立连接的超时时间
+        self.stall_timeout = stall_timeout  # 读取数据的超时时间
+        self.limiter = limiter  # 共享的 RateLimiter, 为 None 时不限速
+        self.budget = budget  # 共享的 ConnectionBudget, 为 None 时不限制连接数
+        self.disk_limiter = disk_limiter  # 限制写盘速度的 RateLimiter
+        # 后台写盘线程: 下载线程只把数据放入有上限的队列, 不等待磁盘
+        self.writer = writer or WriteBehind(disk_limiter=disk_limiter)
+        # 所有分段共用的传输层 (HTTP/1.1 连接池或 HTTP/2 多路复用)
+        self.transport = transport or create_transport(pool_size=self.threads)
+        self.metrics = metrics or SessionMetrics()  # 分段和各阶段的指标
+        self.retries = max(0, int(retries))  # 每个分段的最大重试次数
+        self.failure_budget = max(0, int(failure_budget))  # 一次下载所有分段合计允许的失败次数
+        self.backoff = backoff  # 第一次重试前的等待时间 (秒), 之后每次翻倍
+        self.max_backoff = max_backoff
+        self.hedging = hedging  # 下载末尾是否为最慢的分段发起对冲请求
+        self.resume = resume  # 是否保留未完成的分段文件, 下次下载同一文件时继续
+        self.processes = max(0, int(processes))  # 大于 1 时分段由这么多个子进程下载 (见 multiproc)
+        self.tracker = None
+        self.validator = None  # 服务器返回的 ETag 或 Last-Modified, 用于判断文件是否变化
+        self.chunks = None  # 本次下载使用的分块哈希列表 (ChunkHashes)
+        self._failures = 0
+        self._failure_lock = Lock()
+        self._abort = Event()  # 有分段失败时通知其他分段停止
+        self._transfers = []  # 正在进行的分段传输, 供看门狗检查
+        self._transfers_lock = Lock()
+        self._local = local()  # 每个线程复用的接收缓冲区
+        self._children = []  # spawn 创建的引擎, 随本引擎一起中止
+        self._responses = set()  # 正在读取的响应, 暂停或取消时断开
+        self._parts_state = None  # 上一次下载的分段记录, 暂停后继续时据此保留分段文件
+        # 暂停、继续和取消; spawn 创建的引擎共用同一个令牌
+        self.token = token or CancelToken()
+        self.token.add_listener(self._interrupt)
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def stop(self):
+        """中止正在进行的下载; 开启续传时已下载的分段会保留, 下次下载同一文件时继续"""
+        self._abort.set()
+        for child in list(self._children):
+            child.stop()
+
+    @property
+    def stopped(self):
+        return self.aborted()
+
+    def aborted(self):
+        """本次下载是否已被中止 (分段失败、暂停或取消)"""
+        return self._abort.is_set()
+
+    def wait_aborted(self, timeout):
+        """最多等待 timeout 秒, 期间被中止时立即返回; 返回是否已中止"""
+        return self._abort.wait(timeout)
+
+    def record_failure(self, error):
+        """记一次可重试的失败, 一次下载的失败次数合计超过 failure_budget 时抛出 DownloadError"""
+        with self._failure_lock:
+            self._failures += 1
+            failures = self._failures
+        if failures > self.failure_budget:
+            raise DownloadError(f"下载失败次数超过上限 ({self.failure_budget}): {str(error)}") from (
+                error if isinstance(error, BaseException) else None)
+
+    def report_bytes(self, size):
+        """报告收到了 size 字节: 先向共享限速器领取令牌, 再更新进度; 等待令牌期间被中止时抛出 DownloadAborted"""
+        self._report(size)
+
+    def saved_parts(self, save_path, state, keep_parts=False):
+        """上次与 state 中各项都一致的分段记录, 没有时返回 None
+
+        keep_parts 为暂停后继续, 先比较暂停前的记录; 开启续传时再比较 save_path 的续传记录文件.
+        """
+        if keep_parts and self._parts_state and all(self._parts_state.get(key) == value for key, value in state.items()):
+            return self._parts_state
+        if self.resume:
+            try:
+                with open(save_path + RESUME_SUFFIX, 'r') as f:
+                    saved = json.load(f)
+                if isinstance(saved, dict) and all(saved.get(key) == value for key, value in state.items()):
+                    return saved
+            except (OSError, ValueError):
+                pass
+        return None
+
+    def save_parts(self, save_path, state):
+        """记录本次的分段状态 (暂停后继续时使用), 开启续传时同时写入续传记录文件"""
+        self._parts_state = state
+        if self.resume:
+            with open(save_path + RESUME_SUFFIX, 'w') as f:
+                json.dump(state, f)
+
+    def _interrupt(self):
+        """令牌被暂停或取消: 通知所有工作线程停止, 并断开阻塞在读取中的连接"""
+        self._abort.set()
+        with self._transfers_lock:
+            responses = list(self._responses)
+        for response in responses:
+            self.transport.interrupt(response)
+
+    def spawn(self, threads=None, metrics=None):
+        """创建与本引擎共享限速器、连接预算、传输层和重试设置的新引擎, 用于同时下载多个文件"""
+        child = DownloadEngine(
+            threads=threads or self.threads, headers=self.headers, on_log=self.on_log, timeout=self.timeout,
+            limiter=self.limiter, budget=self.budget, disk_limiter=self.disk_limiter, transport=self.transport,
+            metrics=metrics, retries=self.retries, failure_budget=self.failure_budget, backoff=self.backoff,
+            max_backoff=self.max_backoff, stall_timeout=self.stall_timeout, hedging=self.hedging, resume=self.resume,
+            writer=self.writer, token=self.token, processes=self.processes,
+        )
+        self._children.append(child)
+        return child
+
+    @contextmanager
+    def connection(self):
+        """占用一个全局连接名额, 排队期间被中止时抛出 DownloadAborted"""
+        if self.budget is None:
+            yield
+            return
+        if not self.budget.acquire(self._abort):
+            raise DownloadAborted("下载已中止")
+        try:
+            yield
+        finally:
+            self.budget.release()
+
+    @contextmanager
+    def _request(self, url, headers):
+        """占用连接名额并发起请求; 响应在读取期间登记, 暂停或取消时可以从其他线程断开"""
+        with self.connection(), self.transport.get(url, headers=headers, timeout=self.request_timeout()) as response:
+            with self._transfers_lock:
+                self._responses.add(response)
+            try:
+                if self._abort.is_set():
+                    raise DownloadAborted("下载已中止")
+                yield response
+            finally:
+                with self._transfers_lock:
+                    self._responses.discard(response)
+
+    @contextmanager
+    def _open(self, path, offset=0, truncate=False):
+        """打开 path 的后台写入流, 退出时等待数据全部写入 (检查点: 开启续传时 fsync)"""
+        if truncate:
+            open(path, 'wb').close()
+        stream = self.writer.open(path, offset)
+        try:
+            yield stream
+        except BaseException:
+            try:
+                stream.close(self.resume)
+            except OSError:
+                pass  # 已经有错误在抛出
+            raise
+        try:
+            stream.close(self.resume)
+        except OSError as e:
+            raise DownloadError(f"写入文件失败: {str(e)}") from e
+
+    def _write(self, f, data):
+        try:
+            f.write(data)
+        except OSError as e:
+            # 磁盘错误不重试
+            raise DownloadError(f"写入文件失败: {str(e)}") from e
+
+    def _report(self, size, progress=True):
+        # 每收到一块数据都先向共享限速器领取令牌
+        if self.limiter and not self.limiter.consume(size, self._abort):
+            raise DownloadAborted("下载已中止")
+        if not progress:
+            return
+        self.tracker.update(size)
+        if self.on_progress:
+            self.on_progress(self.tracker)
+
+    def _buffer(self, size):
+        """当前线程的接收缓冲区 (不小于 size), 在分段、重试之间复用"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < size:
+            buffer = memoryview(bytearray(size))
+            self._local.buffer = buffer
+        return buffer[:size]
+
+    def _receive(self, response, f, segment, transfer=None):
+        """把响应内容写入 f, 同时更新限速、进度和分段指标; 对冲请求的数据在胜出前不计入进度
+
+        直接读入复用的大缓冲区并整块写入文件, 缓冲区大小随吞吐量调整, 减少 Python 层的循环次数.
+        """
+        reader = getattr(response, 'raw', response)
+        if response.headers.get('Content-Encoding', 'identity') != 'identity' or not hasattr(reader, 'readinto'):
+            # 压缩传输时 readinto 读到的是未解码的数据, 使用 iter_content
+            for chunk in response.iter_content(chunk_size=MIN_BUFFER_SIZE):
+                if chunk:
+                    self._on_data(f, chunk, segment, transfer)
+            return
+
+        size = MIN_BUFFER_SIZE
+        while True:
+            view = self._buffer(size)
+            started = time.monotonic()
+            received = reader.readinto(view)
+            if not received:
+                break
+            self._on_data(f, view[:received], segment, transfer)
+            # 计入限速等待的时间, 限速时缓冲区不会变得过大
+            elapsed = time.monotonic() - started
+            if received == size and elapsed < BUFFER_TARGET_SECONDS / 4:
+                size = min(size * 2, MAX_BUFFER_SIZE)
+            elif elapsed > BUFFER_TARGET_SECONDS:
+                size = max(size // 2, MIN_BUFFER_SIZE)
+
+    def _on_data(self, f, data, segment, transfer):
+        if self._abort.is_set():
+            raise DownloadAborted("下载已中止")
+        if transfer is not None and transfer.stop is not None:
+            raise transfer.stop
+        size = len(data)
+        segment.on_data(size)
+        self._write(f, data)
+        if transfer is not None:
+            transfer.received(size)
+        self._report(size, progress=transfer is None or not transfer.is_hedge)
+
+    def request_timeout(self):
+        """(连接超时, 读取超时), 读取超时即停顿检测的时间窗口"""
+        return (self.timeout, self.stall_timeout)
+
+    def _check_status(self, response, *expected):
+        """状态码不是 expected 时抛出错误, 服务器暂时不可用时抛出可重试的错误"""
+        status = response.status_code
+        if status in expected:
+            return
+        if status in RETRY_STATUSES:
+            raise RetryableError(f"服务器暂时不可用: {status}")
+        raise DownloadError(f"服务器返回了意外的状态码: {status}")
+
+    def _retry(self, error, attempt, name):
+        """error 可以重试且未超出重试次数和失败预算时, 等待退避时间后返回; 否则抛出错误
+
+        attempt 为该请求已重试的次数, 除 DownloadError (RetryableError 除外) 以外的异常都视为网络错误.
+        """
+        if isinstance(error, DownloadError) and not isinstance(error, RetryableError):
+            raise error
+        if self._abort.is_set():
+            # 被中止时断开的连接不算失败
+            raise DownloadAborted("下载已中止") from error
+        if attempt >= self.retries:
+            raise DownloadError(f"{name} 重试 {attempt} 次后仍然失败: {str(error)}") from error
+        self.record_failure(error)
+        # 指数退避, 等待时间在 [delay/2, delay] 之间随机, 避免所有分段同时重连
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.log(f"{name} 出错, {delay:.1f} 秒后重试 ({attempt + 1}/{self.retries}): {str(error)}")
+        if self.wait_aborted(delay):
+            raise DownloadAborted("下载已中止")
+
+    def probe(self, url):
+        """探测文件大小和服务器是否支持 Range, 返回 (total_size, accept_ranges)"""
+        attempt = 0
+        while True:
+            try:
+                return self._probe(url)
+            except Exception as e:
+                self._retry(e, attempt, "探测文件大小")
+                attempt += 1
+
+    def _probe(self, url):
+        headers = self.headers.copy()
+        headers['Range'] = 'bytes=0-0'
+        with self._request(url, headers) as response:
+            self._check_status(response, 200, 206)
+            etag = response.headers.get('ETag')
+            # 弱 ETag 不能用于 If-Range
+            self.validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[-1]
+                if total.isdigit():
+                    return int(total), True
+            return int(response.headers.get('Content-Length', 0)), False
+
+    def download(self, url, save_path, chunks=None):
+        """下载 url 到 save_path, 返回保存路径
+
+        chunks 为分块哈希列表时, 每个分段下载完成后逐块校验, 只重新下载校验失败的分块.
+        令牌暂停时断开连接并保留已下载的分段, 继续后从断点下载; 取消时删除临时文件并抛出 DownloadCancelled.
+        """
+        return self._controlled(save_path, lambda keep_parts: self._download(url, save_path, chunks, keep_parts))
+
+    def _controlled(self, save_path, run):
+        """按令牌处理暂停和取消: run(keep_parts) 被中止后, 暂停时等待继续再次调用, 取消时删除临时文件"""
+        keep_parts = False
+        while True:
+            try:
+                return run(keep_parts)
+            except DownloadAborted:
+                if self.token.cancelled:
+                    self._remove_temp_files(save_path)
+                    raise DownloadCancelled("下载已取消")
+                if not self.token.paused:
+                    raise
+            self.log("下载已暂停, 已下载的数据会保留")
+            if not self.token.wait_resumed():
+                self._remove_temp_files(save_path)
+                raise DownloadCancelled("下载已取消")
+            self.log("继续下载")
+            keep_parts = True
+
+    def _remove_temp_files(self, save_path):
+        """删除未完成的下载: 分段文件、对冲请求文件、续传记录和未完成的目标文件"""
+        save_dir = os.path.dirname(save_path) or '.'
+        name = os.path.basename(save_path)
+        for entry in os.listdir(save_dir) if os.path.isdir(save_dir) else []:
+            if entry == name or entry.startswith(name + ".part") or entry == name + RESUME_SUFFIX:
+                try:
+                    os.remove(os.path.join(save_dir, entry))
+                except OSError as e:
+                    self.log(f"删除临时文件失败: {entry}: {str(e)}")
+
+    def _download(self, url, save_path, chunks, keep_parts):
+        self._failures = 0
+        self._abort.clear()
+        if self.token.state != RUNNING:
+            raise DownloadAborted("下载已中止")
+        with self.metrics.stage('probe'):
+            total_size, accept_ranges = self.probe(url)
+        self.metrics.reset(url, total_size)
+        self.tracker = DownloadTracker(total_size)
+        self.log(f"文件大小: {self.tracker._human_size(total_size)}, 线程数: {self.threads}, 传输: {self.transport.name}")
+        self.chunks = chunks
+        if chunks is not None and not chunks.matches(total_size):
+            self.log("分块哈希的数量与文件大小不一致, 跳过分块校验")
+            self.chunks = None
+
+        save_dir = os.path.dirname(save_path)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+
+        if not accept_ranges or total_size <= 0:
+            with self.metrics.stage('download'):
+                self._download_single(url, save_path, total_size)
+            return save_path
+
+        if self.processes > 1 and not (self.limiter and self.limiter.rate):
+            from .multiproc import download_processes
+            if self.chunks:
+                self.log("多进程下载不逐块校验, 只校验整个文件")
+            with self.metrics.stage('download'):
+                return download_processes(self, url, save_path, total_size, keep_parts)
+
+        # 分段边界与分块对齐, 每个分块都能在所属的分段内单独校验
+        ranges = split_ranges(total_size, self.threads, self.chunks.chunk_size if self.chunks else 1)
+        resumed = self._prepare_parts(url, save_path, total_size, ranges, keep_parts)
+        if resumed:
+            self.tracker.update(resumed)
+            self.log(f"从上次中断的位置继续, 已下载 {self.tracker._human_size(resumed)}")
+        part_files = self._download_parts(url, save_path, ranges, len(ranges))
+
+        with self.metrics.stage('merge'):
+            self._merge(save_path, part_files)
+        if os.path.exists(save_path + RESUME_SUFFIX):
+            os.remove(save_path + RESUME_SUFFIX)
+        return save_path
+
+    def _download_parts(self, url, save_path, ranges, workers):
+        """用 workers 个线程下载各分段 (由看门狗监视停顿并发起对冲请求), 返回分段文件列表"""
+        watch_stop = Event()
+        watchdog = Thread(target=self._watchdog, args=(url, save_path, watch_stop), daemon=True)
+        with self.metrics.stage('download'):
+            watchdog.start()
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(self._download_range, url, save_path, start, end, i) for start, end, i in ranges]
+                    try:
+                        return [future.result() for future in futures]
+                    except Exception:
+                        self._abort.set()  # 让其他分段尽快停止
+                        raise
+            finally:
+                watch_stop.set()
+                watchdog.join()
+
+    def copy_ranges(self, save_path, length, copies):
+        """创建长度为 length 的 save_path, 把本地文件中的数据复制到各自的位置 (经后台写盘线程, 受写盘限速)
+
+        copies 为 [(源文件路径, 源偏移, 目标偏移, 长度)]; 源文件变短时抛出 DownloadError.
+        """
+        save_dir = os.path.dirname(save_path)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        with open(save_path, 'wb') as f:
+            f.truncate(length)
+        for path, offset, start, size in copies:
+            with open(path, 'rb') as source, self._open(save_path, start) as f:
+                source.seek(offset)
+                while size > 0:
+                    block = source.read(min(1024 * 1024, size))
+                    if not block:
+                        raise DownloadError(f"{path} 在复制时变短了")
+                    self._write(f, block)
+                    size -= len(block)
+
+    def fetch_ranges(self, url, save_path, ranges, total_size):
+        """只下载 url 中的若干字节区间 [(start, end)] (end 为闭区间), 写入已存在的 save_path 的相同位置
+
+        total_size 为预期的文件大小, 与服务器不一致或服务器不支持 Range 时抛出 DownloadError;
+        较长的区间按线程数切分. 暂停、继续和取消与 download 相同.
+        """
+        return self._controlled(save_path, lambda keep_parts: self._fetch_ranges(url, save_path, ranges, total_size, keep_parts))
+
+    def _fetch_ranges(self, url, save_path, ranges, total_size, keep_parts):
+        self._failures = 0
+        self._abort.clear()
+        if self.token.state != RUNNING:
+            raise DownloadAborted("下载已中止")
+        with self.metrics.stage('probe'):
+            size, accept_ranges = self.probe(url)
+        if not accept_ranges:
+            raise DownloadError("服务器不支持 Range 请求, 无法只下载缺少的部分")
+        if size != total_size:
+            raise DownloadError(f"服务器上的文件大小 ({size}) 与预期 ({total_size}) 不一致")
+        self.metrics.reset(url, total_size)
+        self.chunks = None
+        parts = split_spans(ranges, self.threads)
+        self.tracker = DownloadTracker(sum(end - start + 1 for start, end, _ in parts))
+        self.log(f"下载 {len(ranges)} 个区间, 共 {self.tracker._human_size(self.tracker.total_size)}, "
+                 f"线程数: {self.threads}, 传输: {self.transport.name}")
+        resumed = self._prepare_parts(url, save_path, total_size, parts, keep_parts)
+        if resumed:
+            self.tracker.update(resumed)
+            self.log(f"从上次中断的位置继续, 已下载 {self.tracker._human_size(resumed)}")
+        part_files = self._download_parts(url, save_path, parts, min(self.threads, len(parts)))
+
+        with self.metrics.stage('merge'):
+            for (start, _, _), part_file in zip(parts, part_files):
+                with self._open(save_path, start) as f, open(part_file, 'rb') as part_f:
+                    while True:
+                        block = part_f.read(1024 * 1024)
+                        if not block:
+                            break
+                        self._write(f, block)
+                os.remove(part_file)
+        if os.path.exists(save_path + RESUME_SUFFIX):
+            os.remove(save_path + RESUME_SUFFIX)
+        return save_path
+
+    def _prepare_parts(self, url, save_path, total_size, ranges, keep_parts=False):
+        """准备分段文件, 返回已下载的字节数
+
+        开启续传且上次的记录 (地址、大小、ETag、分段边界) 与本次一致时保留已有的分段文件, 否则清空;
+        keep_parts 为暂停后继续, 与暂停前的记录一致时同样保留.
+        """
+        state = {
+            'url': url, 'size': total_size, 'validator': self.validator,
+            'parts': [[start, end] for start, end, _ in ranges],
+            'chunk_size': self.chunks.chunk_size if self.chunks else None,
+        }
+        keep = self.saved_parts(save_path, state, keep_parts) is not None
+        self.save_parts(save_path, state)
+
+        resumed = 0
+        for start, end, i in ranges:
+            part_path = f"{save_path}.part{i}"
+            if keep and os.path.isfile(part_path) and os.path.getsize(part_path) <= end - start + 1:
+                resumed += os.path.getsize(part_path)
+            else:
+                open(part_path, 'wb').close()
+        return resumed
+
+    def _download_single(self, url, save_path, total_size):
+        """服务器不支持 Range 时单连接下载, 重试只能从头开始"""
+        segment = self.metrics.segment(0, 0, total_size - 1)
+        while True:
+            segment.begin()
+            try:
+                with self._request(url, self.headers) as response:
+                    self._check_status(response, 200)
+                    with self._open(save_path, truncate=True) as f:
+                        self._receive(response, f, segment)
+                if 0 < total_size and os.path.getsize(save_path) < total_size:
+                    raise RetryableError("连接提前结束")
+                break
+            except Exception as e:
+                self._retry(e, segment.retries, "下载")
+                segment.retries += 1
+                # 从头开始, 已计入进度的字节需要扣除
+                self.tracker.update(-(os.path.getsize(save_path) if os.path.exists(save_path) else 0))
+        segment.finish()
+
+    def _download_range(self, url, save_path, start, end, part_index):
+        """下载一个分段, 出错或被看门狗断开时从该分段已写入的位置继续请求剩余部分"""
+        part_path = f"{save_path}.part{part_index}"
+        size = end - start + 1
+        segment = self.metrics.segment(part_index, start, end)
+        transfer = _Transfer(part_index, start, end)
+        with self._transfers_lock:
+            self._transfers.append(transfer)
+        try:
+            while True:
+                offset = start + os.path.getsize(part_path)
+                with self._transfers_lock:
+                    hedge_won = transfer.hedge is not None and transfer.hedge.done
+                    if not hedge_won:
+                        transfer.restart(offset)
+                if hedge_won:
+                    self._adopt_hedge(transfer, part_path, save_path)
+                    break
+                if offset > end:
+                    self._finish_transfer(transfer, save_path)
+                    break
+                headers = self.headers.copy()
+                headers['Range'] = f'bytes={offset}-{end}'
+                if self.validator:
+                    # 文件在下载期间发生变化时服务器返回 200, 不会把新旧内容拼在一起
+                    headers['If-Range'] = self.validator
+                segment.begin()
+                try:
+                    with self._request(url, headers) as response:
+                        self._check_status(response, 206)
+                        if not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                            raise DownloadError(f"分段 {part_index} 的 Content-Range 与请求不一致")
+                        with self._open(part_path, offset - start) as f:
+                            self._receive(response, f, segment, transfer)
+                    if os.path.getsize(part_path) < size:
+                        raise RetryableError("连接提前结束")
+                except _Cancelled:
+                    pass
+                except _Reconnect as e:
+                    segment.retries += 1
+                    self.log(f"分段 {part_index} {str(e)}, 重新连接")
+                except Exception as e:
+                    if transfer.hedge is not None and transfer.hedge.done:
+                        continue  # 对冲请求已经完成, 不需要重试
+                    self._retry(e, segment.retries, f"分段 {part_index}")
+                    segment.retries += 1
+        finally:
+            with self._transfers_lock:
+                self._transfers.remove(transfer)
+        segment.finish()
+
+        if os.path.getsize(part_path) != size:
+            raise DownloadError(f"分段 {part_index} 大小不完整")
+        if self.chunks:
+            self._check_chunks(url, part_path, start, end, part_index)
+        return part_path
+
+    def _check_chunks(self, url, part_path, start, end, part_index):
+        """逐块校验下载完成的分段, 只重新下载校验失败的分块"""
+        for attempt in range(self.retries + 1):
+            bad = self.chunks.bad_chunks(part_path, start, start, end, self.tracker.total_size)
+            if not bad:
+                return
+            if attempt == self.retries:
+                break
+            self.log(f"分段 {part_index} 中有 {len(bad)} 个分块校验失败, 重新下载这些分块")
+            for index in bad:
+                self._refetch_chunk(url, part_path, start, index, part_index)
+        raise HashMismatchError(f"分段 {part_index} 的分块重新下载 {self.retries} 次后仍然校验失败")
+
+    def _refetch_chunk(self, url, part_path, base, index, part_index):
+        """重新下载一个分块, 覆盖分段文件中对应的位置"""
+        chunk_start, chunk_end = self.chunks.chunk_range(index, self.tracker.total_size)
+        length = chunk_end - chunk_start + 1
+        segment = self.metrics.segment(part_index, chunk_start, chunk_end)
+        # 损坏的数据已计入进度, 重新下载的部分不重复计算
+        self.tracker.update(-length)
+        headers = self.headers.copy()
+        headers['Range'] = f'bytes={chunk_start}-{chunk_end}'
+        if self.validator:
+            headers['If-Range'] = self.validator
+        while True:
+            received = segment.bytes
+            segment.begin()
+            try:
+                with self._request(url, headers) as response:
+                    self._check_status(response, 206)
+                    if not response.headers.get('Content-Range', '').startswith(f'bytes {chunk_start}-'):
+                        raise DownloadError(f"分块 {index} 的 Content-Range 与请求不一致")
+                    with self._open(part_path, chunk_start - base) as f:
+                        self._receive(response, f, segment)
+                if segment.bytes - received < length:
+                    raise RetryableError("连接提前结束")
+                break
+            except Exception as e:
+                self.tracker.update(-(segment.bytes - received))
+                self._retry(e, segment.retries, f"分块 {index}")
+                segment.retries += 1
+        segment.finish()
+
+    def _finish_transfer(self, transfer, save_path):
+        """原请求先完成: 取消对冲请求"""
+        with self._transfers_lock:
+            transfer.done = True
+            hedge = transfer.hedge
+            if hedge is not None and not hedge.done:
+                hedge.stop = _Cancelled()
+                return
+        if hedge is not None:
+            # 两个请求同时完成, 使用原请求的数据
+            os.remove(self._hedge_path(save_path, transfer.index))
+
+    def _adopt_hedge(self, transfer, part_path, save_path):
+        """对冲请求先完成: 保留原分段在对冲起点之前的数据, 拼接对冲请求下载的剩余部分"""
+        hedge_path = self._hedge_path(save_path, transfer.index)
+        written = os.path.getsize(part_path)
+        with open(part_path, 'r+b') as f, open(hedge_path, 'rb') as hedge_f:
+            f.truncate(transfer.hedge.start - transfer.start)
+            f.seek(0, os.SEEK_END)
+            shutil.copyfileobj(hedge_f, f, 1024 * 1024)
+        os.remove(hedge_path)
+        # 进度中原请求多出的部分换成对冲请求下载的部分
+        self.tracker.update(transfer.end - transfer.start + 1 - written)
+        self.log(f"分段 {transfer.index} 由对冲请求完成")
+
+    def _hedge_path(self, save_path, part_index):
+        return f"{save_path}.part{part_index}.hedge"
+
+    def _watchdog(self, url, save_path, stop):
+        """定期比较各连接的速度: 明显慢于其他连接的断开重连; 有空闲线程时为最慢的分段发起对冲请求"""
+        while not stop.wait(WATCH_WINDOW / 2):
+            now = time.monotonic()
+            with self._transfers_lock:
+                transfers = [t for t in self._transfers if not t.done]
+                for t in transfers:
+                    t.sample(now, WATCH_WINDOW)
+                # 参照速度包括正在进行的连接和已完成分段的平均速度
+                rates = [t.rate for t in transfers if t.rate is not None]
+                rates += [segment.throughput for segment in list(self.metrics.segments) if segment.throughput]
+                rates.sort()
+                primaries = [t for t in transfers if not t.is_hedge]
+                if len(rates) >= 2:
+                    median = rates[len(rates) // 2]
+                    for t in primaries:
+                        if (t.rate is not None and t.rate < median * SLOW_RATIO and t.hedge is None
+                                and t.slow_reconnects < MAX_SLOW_RECONNECTS and t.remaining >= HEDGE_MIN_BYTES):
+                            t.slow_reconnects += 1
+                            t.stop = _Reconnect(f"速度过慢 ({t.rate / 1024:.0f} KB/s, 中位数 {median / 1024:.0f} KB/s)")
+                            t.rate = None
+
+                if not self.hedging:
+                    continue
+                idle = self.threads - len(transfers)
+                candidates = [
+                    t for t in primaries
+                    if t.hedge is None and t.stop is None and t.rate and t.remaining >= HEDGE_MIN_BYTES
+                    and t.remaining / t.rate >= HEDGE_MIN_SECONDS
+                ]
+                candidates.sort(key=lambda t: t.remaining / t.rate, reverse=True)
+                hedges = []
+                for t in candidates[:max(0, idle)]:
+                    t.hedge = _Transfer(t.index, t.offset, t.end, primary=t)
+                    self._transfers.append(t.hedge)
+                    hedges.append(t.hedge)
+            for hedge in hedges:
+                self.log(f"分段 {hedge.index} 剩余 {self.tracker._human_size(hedge.remaining)}, 发起对冲请求")
+                Thread(target=self._download_hedge, args=(url, save_path, hedge), daemon=True).start()
+
+    def _download_hedge(self, url, save_path, hedge):
+        """对冲请求: 重复下载原分段剩余的部分, 先完成的一方胜出, 另一方被取消"""
+        hedge_path = self._hedge_path(save_path, hedge.index)
+        segment = self.metrics.segment(hedge.index, hedge.start, hedge.end)
+        segment.hedge = True
+        headers = self.headers.copy()
+        headers['Range'] = f'bytes={hedge.start}-{hedge.end}'
+        complete = False
+        segment.begin()
+        try:
+            with self._request(url, headers) as response:
+                self._check_status(response, 206)
+                if not response.headers.get('Content-Range', '').startswith(f'bytes {hedge.start}-'):
+                    raise DownloadError("对冲请求的 Content-Range 与请求不一致")
+                with self._open(hedge_path, truncate=True) as f:
+                    self._receive(response, f, segment, hedge)
+            complete = os.path.getsize(hedge_path) == hedge.end - hedge.start + 1
+        except _Cancelled:
+            pass
+        except Exception as e:
+            self.log(f"分段 {hedge.index} 的对冲请求失败: {str(e)}")
+        segment.finish()
+
+        with self._transfers_lock:
+            self._transfers.remove(hedge)
+            won = complete and not hedge.primary.done
+            if won:
+                hedge.done = True
+                hedge.primary.stop = _Cancelled()
+        if not won and os.path.exists(hedge_path):
+            os.remove(hedge_path)
+
+    def _merge(self, save_path, part_files):
+        if len(part_files) == 1:
+            os.replace(part_files[0], save_path)
+            return
+        # 读取分段文件的同时由写盘线程写入, 读写重叠进行
+        with self._open(save_path, truncate=True) as f:
+            for part_file in part_files:
+                with open(part_file, 'rb') as part_f:
+                    while True:
+                        block = part_f.read(1024 * 1024)
+                        if not block:
+                            break
+                        self._write(f, block)
+                os.remove(part_file)
+
+
+def download_verified(engine, version_info, save_path, arch=None, mirrors=None, reuse=None):
+    """依次尝试局域网镜像和官方地址, 每个来源下载的文件都必须通过哈希校验, 返回保存路径
+
+    官方地址按 DOWNLOAD_ENDPOINTS 中等价主机的得分排序, 每次下载的吞吐量和失败都记入端点记录.
+    清单提供分块哈希时下载过程中逐块校验并重新下载损坏的分块, 整个文件的哈希仍是最后一道校验.
+    清单提供块映射且 reuse 中有本地文件时, 先复用其中相同的块、只下载缺少的区间, 不成功再完整下载.
+    """
+    from .mirror import mirror_url
+
+    arch = arch or get_system_architecture()
+    if version_info.blockmap and reuse:
+        from .blockmap import download_with_blockmap
+        if download_with_blockmap(engine, version_info, DOWNLOAD_ENDPOINTS.urls(version_info.url)[0], save_path,
+                                  reuse, arch):
+            return save_path
+    chunks = expected_chunks(version_info, arch)
+    sources = [mirror_url(mirror, version_info.url) for mirror in (mirrors or [])]
+    sources += DOWNLOAD_ENDPOINTS.urls(version_info.url)
+    last_error = None
+    for source in sources:
+        started = time.monotonic()
+        try:
+            engine.download(source, save_path, chunks)
+        except DownloadAborted:
+            raise
+        except Exception as e:
+            engine.log(f"从 {source} 下载失败: {str(e)}")
+            SCOREBOARD.record_failure(origin(source))
+            last_error = e
+            continue
+        transferred = sum(segment.bytes for segment in list(engine.metrics.segments))
+        SCOREBOARD.record_transfer(origin(source), transferred, time.monotonic() - started)
+
+        # 校验文件哈希值
+        with engine.metrics.stage('hash'):
+            verified = verify_hash(save_path, version_info, arch)
+        if verified:
+            return save_path
+        os.remove(save_path)  # 删除校验失败的文件
+        engine.log(f"从 {source} 下载的文件哈希校验失败")
+        SCOREBOARD.record_failure(origin(source))
+        last_error = HashMismatchError("下载的文件哈希校验失败, 文件可能损坏或被篡改")
+    raise last_error
+
+
+def install(version_info, save_dir, threads=4, client_dir=None, arch=None, headers=None,
+            on_progress=None, on_log=None, on_extract_output=None, mirrors=None, cache_dir=None, limiter=None,
+            engine=None, extractor=None, on_extract_progress=None, staged=True, reuse=None, selective=True):
+    """下载、校验并 (可选) 解压指定版本, 返回压缩包路径 (分卷版本为第一个分卷); 解压成功后压缩包会被删除
+
+    mirrors 为优先使用的局域网镜像地址列表, cache_dir 为已校验压缩包的缓存目录 (可由镜像服务对外提供),
+    limiter 为所有连接共享的 RateLimiter; 传入 engine 时使用该引擎, 忽略 threads/headers/回调/limiter;
+    extractor 为解压后端 (默认按 create_extractor 选择), on_extract_progress 接收结构化的解压进度;
+    staged 时先解压到临时目录再整体替换客户端目录, 旧版本保留为可回滚的快照; selective 时只写入内容有变化的文件;
+    清单提供块映射时复用 save_dir 和缓存目录中的旧压缩包以及 reuse 中的文件 (或目录) 里相同的块
+    """
+    from .staging import install_archive
+    from .store import ArchiveCache, link_or_copy
+
+    if not version_info.url:
+        raise DownloadError("无法获取下载链接, 请检查版本信息")
+
+    arch = arch or get_system_architecture()
+    save_path = os.path.join(save_dir, version_info.url.split('/')[-1])
+    cache = ArchiveCache(cache_dir) if cache_dir else None
+    if engine is None:
+        engine = DownloadEngine(threads=threads, headers=headers, on_progress=on_progress, on_log=on_log, limiter=limiter)
+
+    if len(version_info.volume_infos()) > 1:
+        from .volumes import install_volumes
+        return install_volumes(engine, version_info, save_dir, client_dir, arch, mirrors, cache, on_extract_output,
+                               extractor, on_extract_progress, staged, selective)
+
+    cached_path = cache.lookup(version_info, arch) if cache else None
+    if cached_path:
+        engine.log(f"使用本地缓存: {cached_path}")
+        if client_dir:
+            with engine.metrics.stage('extract'):
+                install_archive(cached_path, client_dir, on_output=on_extract_output, on_progress=on_extract_progress,
+                                extractor=extractor, staged=staged, on_log=engine.log, selective=selective)
+            return cached_path
+        if os.path.abspath(save_path) != cached_path:
+            # 硬链接到保存位置, 多 GB 的压缩包不必再完整复制一遍; 之后删除保存位置的文件不影响缓存
+            os.makedirs(save_dir, exist_ok=True)
+            link_or_copy(cached_path, save_path)
+        return save_path
+
+    sources = None
+    if version_info.blockmap:
+        from .blockmap import local_sources
+        sources = local_sources(save_path, [save_dir, cache.cache_dir if cache else None], reuse)
+    download_verified(engine, version_info, save_path, arch, mirrors, sources)
+    if cache:
+        cache.add(save_path, version_info, arch)
+
+    if client_dir:
+        with engine.metrics.stage('extract'):
+            install_archive(save_path, client_dir, on_output=on_extract_output, on_progress=on_extract_progress,
+                            extractor=extractor, staged=staged, on_log=engine.log, selective=selective)
+        # 删除下载的压缩包
+        os.remove(save_path)
+
+    return save_path
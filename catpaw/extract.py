@@ -0,0 +1,267 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+try:
+    import py7zr
+    from py7zr.callbacks import ExtractCallback
+except ImportError:
+    py7zr = None
+    ExtractCallback = object
+
+
+class ExtractionError(Exception):
+    """解压失败"""
+
+
+class UnsupportedMethodError(ExtractionError):
+    """进程内解压不支持压缩包使用的压缩方法或过滤器"""
+
+
+class ArchiveEntry:
+    """压缩包中的一个条目: 名称 (以 / 分隔)、解压后的大小、CRC32 (没有时为 None) 和是否为目录"""
+
+    def __init__(self, name, size, crc, is_dir=False):
+        self.name = name.replace('\\', '/').strip('/')
+        self.size = size
+        self.crc = crc
+        self.is_dir = is_dir
+
+
+def find_seven_zip():
+    """查找 7z 可执行文件: 优先使用程序目录下释放的 7z.exe, 否则在 PATH 中查找"""
+    app_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    local_exe = os.path.join(app_dir, "7z.exe")
+    if os.path.exists(local_exe):
+        return local_exe
+    for name in ("7z", "7za", "7zz"):
+        path = shutil.which(name)
+        if path:
+            return path
+    raise ExtractionError("找不到 7z 可执行文件")
+
+
+def _progress(entry, entries, total_entries=None, extracted=None, total_bytes=None):
+    """解压进度: 当前条目、已完成的条目数和字节数 (后端无法提供的项为 None)"""
+    return {
+        'entry': entry,
+        'entries': entries,
+        'total_entries': total_entries,
+        'bytes': extracted,
+        'total_bytes': total_bytes,
+    }
+
+
+class SevenZipExtractor:
+    """调用 7z 可执行文件解压, 输出逐行转发; 进度只有当前文件和已完成的文件数"""
+
+    name = "7z"
+
+    def __init__(self, seven_zip=None):
+        self.seven_zip = seven_zip
+
+    def list(self, archive_path):
+        """按 7z l -slt 的输出列出条目"""
+        seven_zip = self.seven_zip or find_seven_zip()
+        result = subprocess.run(
+            [seven_zip, "l", "-slt", "-sccUTF-8", archive_path],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        if result.returncode != 0:
+            raise ExtractionError(f"列出压缩包内容时发生错误，返回状态码: {result.returncode}")
+        entries = []
+        fields = None
+        # 分隔线之前是压缩包自身的信息, 之后每个条目一段 "键 = 值", 段之间为空行
+        for line in result.stdout.decode('utf-8', 'replace').splitlines() + ['']:
+            if line.startswith('----------'):
+                fields = {}
+            elif fields is None:
+                continue
+            elif line.strip():
+                key, _, value = line.partition(' = ')
+                fields[key.strip()] = value.strip()
+            elif fields.get('Path'):
+                is_dir = fields.get('Folder') == '+' or 'D' in fields.get('Attributes', '').split(' ')[0]
+                crc = fields.get('CRC')
+                entries.append(ArchiveEntry(fields['Path'], int(fields.get('Size') or 0), int(crc, 16) if crc else None, is_dir))
+                fields = {}
+        return entries
+
+    def extract(self, archive_path, target_dir, on_output=None, on_progress=None, members=None):
+        seven_zip = self.seven_zip or find_seven_zip()
+        command = [seven_zip, "x", "-bb1", archive_path, f"-o{target_dir}", "-y"]
+        list_file = None
+        if members is not None:
+            # 只解压指定的条目: 名称写入列表文件, -spd 关闭通配符匹配
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as f:
+                f.write('\n'.join(members) + '\n')
+                list_file = f.name
+            command += ["-scsUTF-8", "-spd", f"@{list_file}"]
+        try:
+            self._run(command, on_output, on_progress)
+        finally:
+            if list_file:
+                os.remove(list_file)
+
+    def _run(self, command, on_output, on_progress):
+        # 启动7z解压进程并捕获输出
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True
+        )
+
+        # 读取并转发输出
+        entries = 0
+        for output_line in process.stdout:
+            if on_output:
+                on_output(output_line)
+            # -bb1 时每解压一个文件输出一行 "- 文件名"
+            if on_progress and output_line.startswith("- "):
+                entries += 1
+                on_progress(_progress(output_line[2:].rstrip(), entries))
+
+        # 等待进程完成
+        return_code = process.wait()
+        if return_code != 0:
+            raise ExtractionError(f"解压过程中发生错误，返回状态码: {return_code}")
+
+
+class _Py7zrCallback(ExtractCallback):
+    """把 py7zr 的回调 (在其报告线程中调用, 数值为字符串) 转换为 on_output 行和结构化进度
+
+    只解压部分条目时 py7zr 仍会报告被跳过的条目, wanted 为需要报告的条目名集合.
+    """
+
+    def __init__(self, total_entries, total_bytes, on_output, on_progress, wanted=None):
+        self.total_entries = total_entries
+        self.total_bytes = total_bytes
+        self.on_output = on_output
+        self.on_progress = on_progress
+        self.wanted = wanted
+        self.entries = 0
+        self.extracted = 0
+        self.entry = None
+        self.skipping = False
+
+    def report(self):
+        if self.on_progress:
+            self.on_progress(_progress(self.entry, self.entries, self.total_entries, self.extracted, self.total_bytes))
+
+    def report_start_preparation(self):
+        pass
+
+    def report_start(self, processing_file_path, processing_bytes):
+        self.skipping = self.wanted is not None and processing_file_path not in self.wanted
+        if not self.skipping:
+            self.entry = processing_file_path
+
+    def report_update(self, decompressed_bytes):
+        if self.skipping:
+            return
+        self.extracted += int(decompressed_bytes)
+        self.report()
+
+    def report_end(self, processing_file_path, wrote_bytes):
+        if self.skipping:
+            return
+        self.entries += 1
+        if self.on_output:
+            self.on_output(f"- {processing_file_path}\n")
+        self.report()
+
+    def report_warning(self, message):
+        if self.on_output:
+            self.on_output(f"WARNING: {message}\n")
+
+    def report_postprocess(self):
+        pass
+
+
+class Py7zrExtractor:
+    """进程内解压 (py7zr): 不需要 7z 可执行文件, 条目直接写入目标目录, 提供按字节的进度"""
+
+    name = "py7zr"
+
+    def _open(self, archive_path):
+        from .volumes import VolumeReader, volume_files
+
+        volumes = volume_files(archive_path)
+        # 单个文件直接传路径, py7zr 可以多线程解压; 分卷拼接为一个文件对象
+        return archive_path if len(volumes) == 1 else io.BufferedReader(VolumeReader(volumes), 1024 * 1024)
+
+    def list(self, archive_path):
+        source = self._open(archive_path)
+        try:
+            with py7zr.SevenZipFile(source, mode='r') as archive:
+                return [
+                    ArchiveEntry(info.filename, info.uncompressed, info.crc32, info.is_directory)
+                    for info in archive.list()
+                ]
+        except Exception as e:
+            raise ExtractionError(f"读取压缩包目录时发生错误: {str(e)}") from e
+        finally:
+            if not isinstance(source, str):
+                source.close()
+
+    def extract(self, archive_path, target_dir, on_output=None, on_progress=None, members=None):
+        source = self._open(archive_path)
+        try:
+            with py7zr.SevenZipFile(source, mode='r') as archive:
+                infos = archive.list()
+                wanted = None if members is None else set(members)
+                if wanted is not None:
+                    infos = [info for info in infos if info.filename in wanted]
+                total_bytes = sum(info.uncompressed for info in infos if not info.is_directory)
+                callback = _Py7zrCallback(len(infos), total_bytes, on_output, on_progress, wanted)
+                if members is None:
+                    archive.extractall(path=target_dir, callback=callback)
+                else:
+                    archive.extract(path=target_dir, targets=members, callback=callback)
+        except py7zr.exceptions.UnsupportedCompressionMethodError as e:
+            raise UnsupportedMethodError(str(e)) from e
+        except Exception as e:
+            raise ExtractionError(f"解压过程中发生错误: {str(e)}") from e
+        finally:
+            if not isinstance(source, str):
+                source.close()
+        callback.entries, callback.extracted = callback.total_entries, callback.total_bytes
+        callback.report()
+
+
+def py7zr_available():
+    return py7zr is not None
+
+
+def create_extractor(backend="auto", seven_zip=None):
+    """创建解压后端: py7zr 为进程内解压, 7z 调用 7z 可执行文件; auto 优先进程内解压, 未安装 py7zr 时回退到 7z"""
+    if backend in ("auto", "py7zr") and seven_zip is None and py7zr_available():
+        return Py7zrExtractor()
+    return SevenZipExtractor(seven_zip)
+
+
+def list_archive(archive_path, seven_zip=None, extractor=None):
+    """列出压缩包 (或分卷的第一个分卷) 中的条目 (ArchiveEntry)"""
+    extractor = extractor or create_extractor(seven_zip=seven_zip)
+    return extractor.list(archive_path)
+
+
+def extract_archive(archive_path, target_dir, seven_zip=None, on_output=None, on_progress=None, extractor=None,
+                    members=None):
+    """把压缩包 (或分卷的第一个分卷) 解压到 target_dir, members 为条目名列表时只解压这些条目
+
+    on_output 逐行接收解压输出, on_progress 接收结构化进度 (entry/entries/total_entries/bytes/total_bytes).
+    进程内解压遇到不支持的压缩方法时回退到 7z 可执行文件.
+    """
+    extractor = extractor or create_extractor(seven_zip=seven_zip)
+    try:
+        extractor.extract(archive_path, target_dir, on_output=on_output, on_progress=on_progress, members=members)
+    except UnsupportedMethodError as e:
+        if on_output:
+            on_output(f"py7zr 不支持该压缩方法, 改用 7z 解压: {str(e)}\n")
+        SevenZipExtractor(seven_zip).extract(archive_path, target_dir, on_output=on_output, on_progress=on_progress,
+                                             members=members)
@@ -0,0 +1,187 @@
+import os
+import itertools
+from queue import Queue
+from threading import Thread, Lock, Event
+
+from .engine import DownloadEngine, DownloadCancelled, install, get_system_architecture
+from .control import CancelToken
+from .ratelimit import RateLimiter, ConnectionBudget
+from .transport import create_transport
+from .metrics import MetricsRegistry, SessionMetrics
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class DownloadJob:
+    """下载队列中的一个任务 (版本 + 通道 + 目标目录)"""
+
+    def __init__(self, job_id, version_info, save_dir, threads=4, channel=None, client_dir=None):
+        self.id = job_id
+        self.version_info = version_info
+        self.save_dir = save_dir
+        self.threads = threads
+        self.channel = channel
+        self.client_dir = client_dir
+        self.state = QUEUED
+        self.engine = None
+        self.metrics = None
+        self.path = None
+        self.error = None
+        self.extract_progress = None  # 最近一次的解压进度, 尚未开始解压时为 None
+        self.token = CancelToken()  # 暂停、继续和取消, 任务的所有下载线程共用
+        self.finished = Event()
+
+    @property
+    def save_path(self):
+        return os.path.join(self.save_dir, self.version_info.url.split('/')[-1])
+
+    @property
+    def label(self):
+        channel = f"{self.channel} " if self.channel else ""
+        return f"{channel}{self.version_info.version} ({self.version_info.ver_code})"
+
+    @property
+    def paused(self):
+        return self.token.paused
+
+    def pause(self):
+        """暂停下载: 断开连接, 已下载的数据保留"""
+        return self.token.pause()
+
+    def resume(self):
+        return self.token.resume()
+
+    def cancel(self):
+        """取消任务: 排队中的任务不再开始, 运行中的任务尽快停止并删除临时文件"""
+        return self.token.cancel()
+
+    def progress(self):
+        """返回任务的下载进度, 尚未开始下载时返回 None"""
+        tracker = self.engine.tracker if self.engine else None
+        return tracker.get_progress() if tracker else None
+
+
+class DownloadQueue:
+    """多版本、多通道的下载队列
+
+    所有任务共享一个全局连接数预算、一个网络限速器和一个写盘限速器,
+    max_jobs 控制同时运行的任务数, 其余任务排队等待.
+    """
+
+    def __init__(self, max_connections=16, max_jobs=2, limiter=None, disk_limiter=None, headers=None,
+                 arch=None, mirrors=None, cache_dir=None, on_log=None, on_extract_output=None, on_job_done=None,
+                 transport=None, engine_options=None, extractor=None, staged=True, reuse=None,
+                 selective=True):
+        self.budget = ConnectionBudget(max_connections)
+        # 所有任务共用一个传输层, 同一主机的连接 (或 HTTP/2 连接) 在任务之间复用
+        self.transport = transport or create_transport(pool_size=max_connections)
+        self.registry = MetricsRegistry()  # 所有任务的会话指标
+        self.limiter = limiter or RateLimiter()
+        self.disk_limiter = disk_limiter or RateLimiter()
+        self.headers = headers
+        self.arch = arch or get_system_architecture()
+        self.mirrors = mirrors
+        self.cache_dir = cache_dir
+        self.on_log = on_log
+        self.on_extract_output = on_extract_output
+        self.on_job_done = on_job_done
+        self.engine_options = dict(engine_options or {})  # 传给 DownloadEngine 的其他参数 (重试次数、失败预算等)
+        self.extractor = extractor  # 解压后端, 为 None 时按 create_extractor 的默认规则选择
+        self.staged = staged  # 是否分阶段安装 (解压到临时目录后整体替换, 保留可回滚的快照)
+        self.selective = selective  # 是否只写入内容有变化的文件 (并删除新版本不再包含的文件)
+        self.reuse = reuse  # 块映射模式下额外可复用的本地文件或目录
+        self._ids = itertools.count(1)
+        self._jobs = []
+        self._lock = Lock()
+        self._pending = Queue()
+        self._workers = []
+        for _ in range(max(1, max_jobs)):
+            worker = Thread(target=self._worker, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, version_info, save_dir, threads=4, channel=None, client_dir=None):
+        """加入一个下载任务; 同一个保存路径已有未完成的任务时返回该任务"""
+        with self._lock:
+            job = DownloadJob(next(self._ids), version_info, save_dir, threads, channel, client_dir)
+            for existing in self._jobs:
+                if existing.state in (QUEUED, RUNNING) and existing.save_path == job.save_path:
+                    return existing
+            self._jobs.append(job)
+        self._pending.put(job)
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def active(self):
+        """是否还有排队或运行中的任务 (包括暂停的任务)"""
+        return any(job.state in (QUEUED, RUNNING) for job in self.jobs())
+
+    def wait(self, timeout=None):
+        """等待当前所有任务结束"""
+        for job in self.jobs():
+            job.finished.wait(timeout)
+
+    def shutdown(self):
+        """停止接收新任务, 已在运行的任务会继续完成"""
+        for _ in self._workers:
+            self._pending.put(None)
+
+    def _log(self, job, message):
+        if self.on_log:
+            self.on_log(job, message)
+
+    def _extract_output(self, job):
+        if not self.on_extract_output:
+            return None
+        return lambda line: self.on_extract_output(job, line)
+
+    def _worker(self):
+        while True:
+            job = self._pending.get()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job):
+        if job.token.cancelled:
+            job.state = CANCELLED
+            self._finish(job)
+            return
+        job.state = RUNNING
+        job.metrics = self.registry.register(SessionMetrics(job.label))
+        job.engine = DownloadEngine(
+            threads=job.threads, headers=self.headers, on_log=lambda message: self._log(job, message),
+            limiter=self.limiter, budget=self.budget, disk_limiter=self.disk_limiter, transport=self.transport,
+            metrics=job.metrics, token=job.token, **self.engine_options
+        )
+        try:
+            job.path = install(
+                job.version_info, job.save_dir, client_dir=job.client_dir, arch=self.arch,
+                mirrors=self.mirrors, cache_dir=self.cache_dir, engine=job.engine,
+                on_extract_output=self._extract_output(job), extractor=self.extractor,
+                on_extract_progress=lambda progress: setattr(job, 'extract_progress', progress), staged=self.staged,
+                reuse=self.reuse, selective=self.selective,
+            )
+            job.state = DONE
+        except DownloadCancelled as e:
+            job.error = e
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.state = FAILED
+        finally:
+            job.metrics.result = job.state
+            self._finish(job)
+
+    def _finish(self, job):
+        if self.on_job_done:
+            self.on_job_done(job)
+        job.finished.set()
@@ -0,0 +1,196 @@
+from .endpoints import EndpointPool
+
+# API 服务器地址
+API_BASE = "https://api17-2e40-yzlty.ru2023.top"
+# 提供相同内容的 API 服务器, 请求发往得分最好的一个, 失败时自动切换 (可通过配置替换)
+API_ENDPOINTS = EndpointPool([API_BASE])
+
+
+class VersionInfo:
+    """通道中的一个版本
+
+    可选字段: chunk_size 和 chunkb2b/chunkb2s (逗号分隔的分块哈希); 分卷版本的 volume_count 为分卷数,
+    url 为第一个分卷 (.001), volb2b/volb2s 为逗号分隔的各分卷哈希; blockmap 为块映射的地址
+    (可以相对于 url), 用于复用本地旧压缩包中相同的块; treeb2b/treeb2s 为 BLAKE2 树模式哈希, tree_leaf 为其叶子大小
+    (未提供时为 treehash.DEFAULT_LEAF_SIZE), 提供时校验可以并行计算.
+    """
+
+    def __init__(self, version, ver_code, changelog, level, url, hashb2b, hashb2s, chunk_size=None,
+                 chunkb2b=None, chunkb2s=None, volume_count=None, volb2b=None, volb2s=None, blockmap=None,
+                 treeb2b=None, treeb2s=None, tree_leaf=None):
+        self.version = version
+        self.ver_code = ver_code
+        self.changelog = changelog.replace('\\n', '\n')
+        self.level = level
+        self.url = url
+        self.hashb2b = hashb2b
+        self.hashb2s = hashb2s
+        self.chunk_size = chunk_size
+        self.chunkb2b = chunkb2b
+        self.chunkb2s = chunkb2s
+        self.volume_count = volume_count
+        self.volb2b = volb2b
+        self.volb2s = volb2s
+        self.blockmap = blockmap
+        self.treeb2b = treeb2b
+        self.treeb2s = treeb2s
+        self.tree_leaf = tree_leaf
+
+    def volume_infos(self):
+        """分卷版本返回每个分卷的 VersionInfo (各自的地址和哈希), 否则返回 [self]"""
+        if not self.volume_count or self.volume_count < 2:
+            return [self]
+        base = self.url[:-4] if self.url.endswith('.001') else self.url
+        hashb2b = (self.volb2b or '').split(',')
+        hashb2s = (self.volb2s or '').split(',')
+        return [
+            VersionInfo(
+                self.version, self.ver_code, self.changelog, self.level, f"{base}.{i + 1:03d}",
+                hashb2b[i].strip() if i < len(hashb2b) else None, hashb2s[i].strip() if i < len(hashb2s) else None,
+            )
+            for i in range(self.volume_count)
+        ]
+
+
+class UpdateInfo(VersionInfo):
+    """下载器自身的更新信息 (version.ini), delta_url 为针对 delta_from 版本的差分补丁"""
+
+    def __init__(self, version, ver_code, changelog, url, hashb2b=None, hashb2s=None, notice="",
+                 delta_url=None, delta_from=None):
+        VersionInfo.__init__(self, version, ver_code, changelog, None, url, hashb2b, hashb2s)
+        self.notice = notice
+        self.delta_url = delta_url
+        self.delta_from = delta_from
+
+
+def version_file_for_arch(arch, win7=False):
+    """根据系统架构选择下载器自身更新使用的 version.ini 文件"""
+    if win7:
+        return "version-win7-1.ini" if arch == 'x86' else "version-win7.ini"
+    if arch == 'x86':
+        return "version-32.ini"
+    elif arch == 'arm64':
+        return "version-64.ini"
+    return "version.ini"
+
+
+def parse_channel_manifest(text):
+    """解析更新通道的版本列表 (beta.ini / stable.ini)"""
+    versions = []
+
+    current_version = None
+    current_ver_code = None
+    current_changelog = ""
+    current_level = None
+    current_url = None
+    current_hashb2b = None
+    current_hashb2s = None
+    current_optional = {}
+    in_changelog = False
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            if current_version:
+                versions.append(VersionInfo(current_version, current_ver_code, current_changelog, current_level, current_url, current_hashb2b, current_hashb2s, **current_optional))
+                current_changelog = ""
+            current_version = line[1:-1]
+            current_ver_code = None
+            current_level = None
+            current_url = None
+            current_hashb2b = None
+            current_hashb2s = None
+            current_optional = {}
+            in_changelog = False
+        elif line.startswith('ver='):
+            current_ver_code = line[4:]
+        elif line.startswith('changelog='):
+            current_changelog = line[10:].replace('\\n', '\n')
+            in_changelog = True
+        elif line.startswith('level='):
+            current_level = int(line[6:])
+        elif line.startswith('url='):
+            current_url = line[4:]
+        elif line.startswith('hashb2b='):
+            current_hashb2b = line[8:]
+        elif line.startswith('hashb2s='):
+            current_hashb2s = line[8:]
+        elif line.startswith('chunksize='):
+            current_optional['chunk_size'] = int(line[10:])
+        elif line.startswith('chunkb2b=') or line.startswith('chunkb2s='):
+            current_optional[line[:8]] = line[9:]
+        elif line.startswith('volumes='):
+            current_optional['volume_count'] = int(line[8:])
+        elif line.startswith('volb2b=') or line.startswith('volb2s='):
+            current_optional[line[:6]] = line[7:]
+        elif line.startswith('blockmap='):
+            current_optional['blockmap'] = line[9:]
+        elif line.startswith('treeb2b=') or line.startswith('treeb2s='):
+            current_optional[line[:7]] = line[8:]
+        elif line.startswith('treeleaf='):
+            current_optional['tree_leaf'] = int(line[9:])
+        elif in_changelog:
+            current_changelog += '\n' + line
+
+    if current_version and current_url:
+        versions.append(VersionInfo(current_version, current_ver_code, current_changelog, current_level, current_url, current_hashb2b, current_hashb2s, **current_optional))
+
+    return versions
+
+
+def parse_update_manifest(text):
+    """解析下载器自身的 version.ini, 缺少必需字段时返回 None
+
+    返回的 UpdateInfo 中 notice 为公告; hashb2b/hashb2s 和 delta_url/delta_from 是可选字段.
+    """
+    fields = {}
+    changelog = ""
+    in_changelog = False
+
+    for line in text.splitlines():
+        line = line.strip()
+        key, sep, value = line.partition('=')
+        if sep and key in ('ver', 'ver_code', 'url', 'notice', 'hashb2b', 'hashb2s', 'delta_url', 'delta_from'):
+            fields[key] = value
+        elif sep and key == 'changelog':
+            changelog = value
+            in_changelog = True
+        elif in_changelog:
+            changelog += '\n' + line
+
+    if not (fields.get('ver') and changelog and fields.get('ver_code') and fields.get('url')):
+        return None
+    return UpdateInfo(
+        fields['ver'], fields['ver_code'], changelog, fields['url'],
+        hashb2b=fields.get('hashb2b'), hashb2s=fields.get('hashb2s'),
+        notice=fields.get('notice', '').replace('\\n', '\n'),
+        delta_url=fields.get('delta_url'), delta_from=fields.get('delta_from'),
+    )
+
+
+def fetch_update_info(arch, win7=False, headers=None, timeout=10):
+    """获取下载器自身的更新信息"""
+    response = API_ENDPOINTS.get(f"/{version_file_for_arch(arch, win7)}", headers=headers, timeout=timeout)
+    return parse_update_manifest(response.text)
+
+
+def fetch_channel_versions(channel, headers=None, timeout=10):
+    """获取指定更新通道的版本列表"""
+    response = API_ENDPOINTS.get(f"/verify1/{channel}.ini", headers=headers, timeout=timeout)
+    return parse_channel_manifest(response.text)
+
+
+def latest_available(versions):
+    """返回列表中第一个可下载的版本 (level 不为 0), 没有则返回 None"""
+    for version_info in versions:
+        if version_info.level != 0:
+            return version_info
+    return None
+
+
+def find_version(versions, ver_code):
+    """按版本代码查找版本"""
+    for version_info in versions:
+        if version_info.ver_code == ver_code:
+            return version_info
+    return None
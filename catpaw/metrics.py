@@ -0,0 +1,292 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock, Event
+
+STALL_THRESHOLD = 0.5  # 两次收到数据的间隔超过该值 (秒) 计为停顿
+
+
+class SegmentMetrics:
+    """一个分段的指标: 首字节时间、吞吐量、重试次数、停顿时间和字节数 (hedge 表示对冲请求)"""
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.bytes = 0
+        self.retries = 0
+        self.stall_time = 0.0
+        self.hedge = False
+        self.requested_at = None
+        self.first_byte_at = None
+        self.finished_at = None
+        self._last_data = None
+        self._ttfb = None
+
+    def begin(self):
+        """发出请求时调用 (每次重试都会重新计时首字节时间)"""
+        self.requested_at = time.monotonic()
+        self._last_data = None
+
+    def on_data(self, size):
+        now = time.monotonic()
+        if self._last_data is None:
+            if self.first_byte_at is None:
+                self.first_byte_at = now
+                self._ttfb = now - self.requested_at
+        elif now - self._last_data > STALL_THRESHOLD:
+            self.stall_time += now - self._last_data
+        self._last_data = now
+        self.bytes += size
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def ttfb(self):
+        return self._ttfb
+
+    @property
+    def throughput(self):
+        if self.first_byte_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_byte_at
+        return self.bytes / elapsed if elapsed > 0 else None
+
+    def to_dict(self):
+        return {
+            'index': self.index,
+            'start': self.start,
+            'end': self.end,
+            'bytes': self.bytes,
+            'ttfb': _round(self.ttfb),
+            'throughput': _round(self.throughput, 0),
+            'retries': self.retries,
+            'stall_time': _round(self.stall_time),
+            'hedge': self.hedge,
+        }
+
+
+class SessionMetrics:
+    """一次下载会话 (一个版本) 的指标, 包括各分段和 probe/download/merge/hash/extract 各阶段耗时"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.url = None
+        self.total_size = 0
+        self.started_at = time.time()
+        self.stages = {}
+        self.segments = []
+        self.children = []  # 同时下载的多个文件 (例如分卷) 各自的会话
+        self.result = None
+        self.lock = Lock()
+
+    def reset(self, url, total_size):
+        """开始下载一个新的来源时调用 (镜像失败回退到官方地址时会重新开始)"""
+        with self.lock:
+            self.url = url
+            self.total_size = total_size
+            self.segments = []
+
+    def child(self, label):
+        """创建一个子会话, 其字节数计入本会话"""
+        child = SessionMetrics(label)
+        with self.lock:
+            self.children.append(child)
+        return child
+
+    def segment(self, index, start, end):
+        segment = SegmentMetrics(index, start, end)
+        with self.lock:
+            self.segments.append(segment)
+        return segment
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的耗时, 同一阶段多次执行时累加"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def to_dict(self):
+        with self.lock:
+            segments = list(self.segments)
+            stages = dict(self.stages)
+            children = list(self.children)
+        children = [child.to_dict() for child in children]
+        result = {
+            'label': self.label,
+            'url': self.url,
+            'total_size': self.total_size,
+            'started_at': self.started_at,
+            'result': self.result,
+            'bytes': sum(segment.bytes for segment in segments) + sum(child['bytes'] for child in children),
+            'stages': {name: _round(seconds) for name, seconds in stages.items()},
+            'segments': [segment.to_dict() for segment in segments],
+        }
+        if children:
+            result['children'] = children
+        return result
+
+
+class MetricsRegistry:
+    """汇总多个下载会话, 输出 JSON 会话报告或 Prometheus 文本格式的指标"""
+
+    def __init__(self):
+        self.sessions = []
+        self.sections = {}  # 报告中的附加部分: 名称 -> 返回可序列化数据的函数
+        self.lock = Lock()
+
+    def register(self, session):
+        with self.lock:
+            self.sessions.append(session)
+        return session
+
+    def attach(self, name, provider):
+        """在会话报告中加入名为 name 的部分, 内容在生成报告时由 provider() 提供"""
+        with self.lock:
+            self.sections[name] = provider
+
+    def report(self):
+        with self.lock:
+            sessions = list(self.sessions)
+            sections = dict(self.sections)
+        report = {'generated_at': time.time(), 'sessions': [session.to_dict() for session in sessions]}
+        for name, provider in sections.items():
+            report[name] = provider()
+        return report
+
+    def write_report(self, path):
+        """写入 JSON 会话报告 (先写临时文件再替换, 避免读到一半的文件)"""
+        _atomic_write(path, json.dumps(self.report(), indent=2, ensure_ascii=False))
+
+    def render_text(self):
+        """Prometheus 文本格式, 同一指标的所有样本放在一起"""
+        families = {
+            'catpaw_session_bytes': [],
+            'catpaw_session_total_bytes': [],
+            'catpaw_stage_seconds': [],
+            'catpaw_segment_ttfb_seconds': [],
+            'catpaw_segment_throughput_bytes': [],
+            'catpaw_segment_retries': [],
+            'catpaw_segment_stall_seconds': [],
+        }
+        for number, session in enumerate(self.report()['sessions'], 1):
+            labels = f'session="{number}",label="{_escape(session["label"] or "")}"'
+            families['catpaw_session_bytes'].append((labels, session['bytes']))
+            families['catpaw_session_total_bytes'].append((labels, session['total_size']))
+            for stage, seconds in session['stages'].items():
+                families['catpaw_stage_seconds'].append((f'{labels},stage="{stage}"', seconds))
+            for segment in session['segments']:
+                segment_labels = f'{labels},segment="{segment["index"]}"'
+                if segment.get('hedge'):
+                    segment_labels += ',hedge="true"'
+                if segment['ttfb'] is not None:
+                    families['catpaw_segment_ttfb_seconds'].append((segment_labels, segment['ttfb']))
+                if segment['throughput'] is not None:
+                    families['catpaw_segment_throughput_bytes'].append((segment_labels, segment['throughput']))
+                families['catpaw_segment_retries'].append((segment_labels, segment['retries']))
+                families['catpaw_segment_stall_seconds'].append((segment_labels, segment['stall_time']))
+
+        lines = []
+        for name, samples in families.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{{{labels}}} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def write_text_file(self, path):
+        """写入 Prometheus 文本文件 (可供 node_exporter textfile collector 采集)"""
+        _atomic_write(path, self.render_text())
+
+
+class MetricsServer:
+    """本地指标端点: /metrics 返回 Prometheus 文本, /report 返回 JSON 会话报告"""
+
+    def __init__(self, registry, host="127.0.0.1", port=0):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith('/metrics'):
+                    body = registry.render_text().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path.startswith('/report'):
+                    body = json.dumps(registry.report(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MetricsFileWriter:
+    """定期把指标写入文本文件"""
+
+    def __init__(self, registry, path, interval=5.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = Event()
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            self.registry.write_text_file(self.path)
+        except OSError as e:
+            print(f"写入指标文件失败: {str(e)}")
+
+    def stop(self):
+        self.stopped.set()
+        self._write()
+
+
+def _atomic_write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _round(value, digits=4):
+    if value is None:
+        return None
+    return round(value, digits) if digits else int(round(value))
@@ -0,0 +1,150 @@
+import os
+import re
+import posixpath
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from urllib.parse import unquote, urlsplit
+
+from .store import ArchiveCache
+
+DEFAULT_MIRROR_PORT = 8760  # 局域网镜像默认端口
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """解析单段 Range 请求头, 返回 (start, end); 无 Range 返回 None; 无法满足时抛出 ValueError"""
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        raise ValueError(header)
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # bytes=-N 表示最后 N 个字节
+        start = max(0, size - int(match.group(2)))
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileHandler(BaseHTTPRequestHandler):
+    """支持 Range / ETag 的只读文件服务, 子类可覆盖 resolve_path 和 send_body"""
+
+    protocol_version = "HTTP/1.1"
+    root_dir = "."
+
+    def log_message(self, format, *args):
+        pass
+
+    def resolve_path(self, url_path):
+        """把请求路径映射为本地文件, 不允许访问根目录以外的文件"""
+        name = posixpath.basename(unquote(urlsplit(url_path).path))
+        if not name or name.startswith('.'):
+            return None
+        path = os.path.join(self.root_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def send_body(self, f, start, length):
+        """发送文件的 [start, start+length) 部分"""
+        f.seek(start)
+        self.wfile.flush()
+        self.connection.sendfile(f, start, length)
+
+    def do_HEAD(self):
+        self.handle_file(head_only=True)
+
+    def do_GET(self):
+        self.handle_file(head_only=False)
+
+    def handle_file(self, head_only):
+        path = self.resolve_path(self.path)
+        if path is None:
+            self.send_error(404)
+            return
+
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{size:x}-{int(stat.st_mtime):x}"'
+
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        # If-Range 不匹配时返回整个文件
+        if_range = self.headers.get('If-Range')
+        if byte_range and if_range and if_range != etag:
+            byte_range = None
+
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
+        length = end - start + 1
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        if head_only or length <= 0:
+            return
+        try:
+            with open(path, 'rb') as f:
+                self.send_body(f, start, length)
+        except (ConnectionError, OSError):
+            self.close_connection = True
+
+
+class MirrorServer:
+    """把本机缓存中已校验的压缩包通过 HTTP 提供给局域网内的其他下载器"""
+
+    def __init__(self, cache_dir, host="0.0.0.0", port=DEFAULT_MIRROR_PORT):
+        self.cache = ArchiveCache(cache_dir)
+        cache = self.cache
+
+        class Handler(RangeFileHandler):
+            root_dir = cache.cache_dir
+
+            def resolve_path(self, url_path):
+                path = RangeFileHandler.resolve_path(self, url_path)
+                # 只提供校验通过的文件
+                if path is None or path.endswith('.tmp') or not cache.is_verified(path):
+                    return None
+                return path
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def mirror_url(mirror, url):
+    """返回镜像上与官方下载地址同名的文件地址"""
+    return f"{mirror.rstrip('/')}/{url.split('/')[-1]}"
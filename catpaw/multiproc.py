@@ -0,0 +1,199 @@
+import os
+import time
+import multiprocessing
+from contextlib import ExitStack
+
+from .engine import (
+    DownloadError, DownloadAborted, RESUME_SUFFIX, RETRY_STATUSES, MIN_BUFFER_SIZE, MAX_BUFFER_SIZE,
+    BUFFER_TARGET_SECONDS, split_ranges,
+)
+
+REPORT_INTERVAL = 0.1  # 父进程汇总各分段进度的间隔 (秒)
+STOP_GRACE = 0.5  # 停止时等待子进程自行退出的时间 (秒), 超时后强制结束
+
+
+def _worker(url, path, segments, headers, validator, timeouts, retries, backoff, max_backoff, progress, events, stop):
+    """子进程: 每个分段一个线程, 从 progress 中记录的位置继续请求, 直接写入预分配文件的对应位置
+
+    validator 为探测时得到的 ETag 或 Last-Modified, 作为 If-Range 发送 (文件在服务器上变化时不会把新旧内容拼在一起);
+    progress 为共享内存中按分段序号排列的已写入字节数 (写入后才更新, 父进程读到的数据一定已经写入),
+    events 向父进程报告重试 ('retry') 和失败 ('failed'), stop 由父进程设置.
+    """
+    from threading import Thread
+
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(segments))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # 直接读取原始数据, 不能压缩传输
+    headers = dict(headers, **{'Accept-Encoding': 'identity'})
+    if validator:
+        headers['If-Range'] = validator
+
+    def run(start, end, index):
+        buffer = memoryview(bytearray(MAX_BUFFER_SIZE))
+        attempt = 0
+        with open(path, 'r+b', buffering=0) as f:
+            while start + progress[index] <= end and not stop.is_set():
+                offset = start + progress[index]
+                try:
+                    with session.get(url, headers=dict(headers, Range=f"bytes={offset}-{end}"), stream=True,
+                                     timeout=timeouts) as response:
+                        if response.status_code in RETRY_STATUSES:
+                            raise ConnectionError(f"服务器暂时不可用: {response.status_code}")
+                        if response.status_code != 206:
+                            events.put(('failed', index, f"服务器返回了意外的状态码: {response.status_code}"))
+                            return
+                        if not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                            events.put(('failed', index, f"分段 {index} 的 Content-Range 与请求不一致"))
+                            return
+                        f.seek(offset)
+                        size = MIN_BUFFER_SIZE
+                        while offset <= end and not stop.is_set():
+                            # readinto 读满缓冲区才返回, 缓冲区大小随吞吐量调整 (与 DownloadEngine._receive 相同)
+                            started = time.monotonic()
+                            received = response.raw.readinto(buffer[:min(size, end - offset + 1)])
+                            if not received:
+                                break
+                            elapsed = time.monotonic() - started
+                            if received == size and elapsed < BUFFER_TARGET_SECONDS / 4:
+                                size = min(size * 2, MAX_BUFFER_SIZE)
+                            elif elapsed > BUFFER_TARGET_SECONDS:
+                                size = max(size // 2, MIN_BUFFER_SIZE)
+                            try:
+                                view = buffer[:received]
+                                while view:
+                                    view = view[f.write(view):]
+                            except OSError as e:
+                                # 磁盘错误不重试
+                                events.put(('failed', index, f"写入文件失败: {str(e)}"))
+                                return
+                            offset += received
+                            progress[index] = offset - start
+                            attempt = 0
+                    if offset <= end and not stop.is_set():
+                        raise ConnectionError("连接提前结束")
+                except Exception as e:
+                    if stop.is_set():
+                        return
+                    if attempt >= retries:
+                        events.put(('failed', index, f"分段 {index} 重试 {attempt} 次后仍然失败: {str(e)}"))
+                        return
+                    delay = min(max_backoff, backoff * 2 ** attempt)
+                    attempt += 1
+                    events.put(('retry', index, str(e)))
+                    stop.wait(delay)
+
+    threads = [Thread(target=run, args=segment, daemon=True) for segment in segments]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _prepare_output(engine, url, save_path, total_size, ranges, keep_parts):
+    """预分配输出文件, 返回 (各分段已下载的字节数, 分段记录)
+
+    开启续传且记录 (地址、大小、ETag、分段边界) 一致时, 或暂停后继续时, 从记录的位置继续.
+    """
+    state = {
+        'url': url, 'size': total_size, 'validator': engine.validator, 'processes': True,
+        'parts': [[start, end] for start, end, _ in ranges],
+    }
+    saved = engine.saved_parts(save_path, state, keep_parts)
+    done = saved.get('done') if saved else None
+    if not (done and len(done) == len(ranges) and os.path.isfile(save_path)
+            and os.path.getsize(save_path) == total_size):
+        done = [0] * len(ranges)
+        with open(save_path, 'wb') as f:
+            f.truncate(total_size)
+    engine.save_parts(save_path, dict(state, done=list(done)))
+    return done, state
+
+
+def download_processes(engine, url, save_path, total_size, keep_parts=False):
+    """多进程下载: 分段分给 engine.processes 个子进程, 各自直接写入预分配的输出文件
+
+    每个子进程有独立的解释器 (不受 GIL 限制); 父进程通过共享内存汇总进度、指标和重试,
+    令牌暂停或取消时通知子进程停止, 来不及退出的子进程被强制结束 (已计入进度的数据都已写入).
+    不支持限速、对冲请求和逐块校验, 只用于局域网镜像等高带宽的场景.
+    """
+    connections = engine.threads if engine.budget is None else min(engine.threads, engine.budget.limit)
+    ranges = split_ranges(total_size, connections)
+    processes = min(engine.processes, len(ranges))
+    done, state = _prepare_output(engine, url, save_path, total_size, ranges, keep_parts)
+    if any(done):
+        engine.tracker.update(sum(done))
+        engine.log(f"从上次中断的位置继续, 已下载 {sum(done) / 1048576:.2f} MB")
+    engine.log(f"多进程下载: {processes} 个进程, {len(ranges)} 个分段")
+
+    context = multiprocessing.get_context('spawn')
+    progress = context.Array('q', done, lock=False)
+    events = context.Queue()
+    stop = context.Event()
+    segments = [engine.metrics.segment(i, start, end) for start, end, i in ranges]
+    workers = [
+        context.Process(
+            target=_worker, daemon=True,
+            args=(url, save_path, [r for r in ranges if r[2] % processes == k], engine.headers,
+                  engine.validator, engine.request_timeout(), engine.retries, engine.backoff, engine.max_backoff,
+                  progress, events, stop),
+        )
+        for k in range(processes)
+    ]
+    reported = list(done)
+
+    def collect():
+        delta = 0
+        for segment, (start, end, i) in zip(segments, ranges):
+            current = progress[i]
+            if current > reported[i]:
+                segment.on_data(current - reported[i])
+                delta += current - reported[i]
+                reported[i] = current
+                if start + current > end:
+                    segment.finish()
+        if delta:
+            engine.report_bytes(delta)
+
+    with ExitStack() as stack:
+        for _ in ranges:
+            stack.enter_context(engine.connection())
+        for worker in workers:
+            worker.start()
+        for segment in segments:
+            segment.begin()
+        try:
+            while True:
+                while not events.empty():
+                    kind, index, message = events.get()
+                    if kind == 'failed':
+                        raise DownloadError(message)
+                    segments[index].retries += 1
+                    engine.record_failure(message)
+                    engine.log(f"分段 {index} 出错, 重试: {message}")
+                collect()
+                if all(start + reported[i] > end for start, end, i in ranges):
+                    break
+                if engine.aborted():
+                    raise DownloadAborted("下载已中止")
+                if not any(worker.is_alive() for worker in workers) and events.empty():
+                    collect()
+                    if not all(start + reported[i] > end for start, end, i in ranges):
+                        raise DownloadError("下载进程意外退出")
+                engine.wait_aborted(REPORT_INTERVAL)
+        finally:
+            stop.set()
+            deadline = time.monotonic() + STOP_GRACE
+            for worker in workers:
+                worker.join(max(0.0, deadline - time.monotonic()))
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            collect()
+            engine.save_parts(save_path, dict(state, done=list(reported)))
+    if os.path.exists(save_path + RESUME_SUFFIX):
+        os.remove(save_path + RESUME_SUFFIX)
+    return save_path
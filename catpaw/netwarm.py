@@ -0,0 +1,222 @@
+import errno
+import socket
+import selectors
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+try:
+    from urllib3.exceptions import NameResolutionError
+except ImportError:  # urllib3 1.x
+    NameResolutionError = None
+
+DNS_TTL = 300  # DNS 缓存的有效期 (秒)
+CONNECTION_ATTEMPT_DELAY = 0.25  # 上一个地址未连上时, 间隔多久尝试下一个地址 (RFC 8305 建议 250 毫秒)
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, getattr(errno, 'WSAEWOULDBLOCK', 10035))
+
+
+class DnsCache:
+    """getaddrinfo 结果的缓存, 预热时解析的地址在真正下载时直接使用"""
+
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = Lock()
+
+    def resolve(self, host, port):
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        addresses = socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host, port):
+        """连接失败时丢弃缓存的地址, 下次重新解析"""
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+DNS_CACHE = DnsCache()
+
+
+def interleave_families(addresses):
+    """按地址族交替排列, 第一个地址的地址族优先 (通常为 IPv6)"""
+    if not addresses:
+        return []
+    first_family = addresses[0][0]
+    first = [a for a in addresses if a[0] == first_family]
+    second = [a for a in addresses if a[0] != first_family]
+    result = []
+    for i in range(max(len(first), len(second))):
+        result.extend(group[i] for group in (first, second) if i < len(group))
+    return result
+
+
+def happy_eyeballs_connect(addresses, timeout=None, source_address=None, socket_options=None,
+                           delay=CONNECTION_ATTEMPT_DELAY):
+    """Happy Eyeballs: 交替尝试 IPv6 和 IPv4 地址, 前一个尝试 delay 秒内没有连上就并发尝试下一个,
+    返回最先建立的连接, 其余的连接会被关闭"""
+    pending = interleave_families(addresses)
+    deadline = time.monotonic() + timeout if timeout else None
+    selector = selectors.DefaultSelector()
+    attempts = []
+    errors = []
+    next_attempt = 0.0
+    try:
+        while pending or attempts:
+            now = time.monotonic()
+            if pending and (not attempts or now >= next_attempt):
+                family, sock_type, proto, _, address = pending.pop(0)
+                sock = socket.socket(family, sock_type, proto)
+                try:
+                    for option in socket_options or ():
+                        sock.setsockopt(*option)
+                    if source_address:
+                        sock.bind(source_address)
+                    sock.setblocking(False)
+                    result = sock.connect_ex(address)
+                    if result not in (0,) + _IN_PROGRESS:
+                        raise OSError(result, f"connect to {address[0]} failed")
+                except OSError as e:
+                    sock.close()
+                    errors.append(e)
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE)
+                attempts.append(sock)
+                next_attempt = now + delay
+
+            wait = next_attempt - now if pending else None
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise socket.timeout("timed out")
+                wait = remaining if wait is None else min(wait, remaining)
+            for key, _ in selector.select(max(0.0, wait) if wait is not None else None):
+                sock = key.fileobj
+                selector.unregister(sock)
+                attempts.remove(sock)
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error == 0:
+                    sock.setblocking(True)
+                    sock.settimeout(timeout)
+                    return sock
+                sock.close()
+                errors.append(OSError(error, f"connect failed: {error}"))
+                next_attempt = 0.0  # 失败后立即尝试下一个地址
+        if errors:
+            raise errors[-1]
+        raise OSError("getaddrinfo returns an empty list")
+    finally:
+        for sock in attempts:
+            sock.close()
+        selector.close()
+
+
+class _HappyEyeballsConnection:
+    """替换 urllib3 建立连接的方式: 使用 DNS 缓存和 Happy Eyeballs"""
+
+    def _new_conn(self):
+        timeout = self.timeout if isinstance(self.timeout, (int, float)) else socket.getdefaulttimeout()
+        try:
+            addresses = DNS_CACHE.resolve(self._dns_host, self.port)
+            return happy_eyeballs_connect(addresses, timeout, self.source_address, self.socket_options)
+        except socket.gaierror as e:
+            if NameResolutionError is not None:
+                raise NameResolutionError(self.host, self, e) from e
+            raise NewConnectionError(self, f"Failed to resolve '{self.host}' ({e})") from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={timeout})") from e
+        except OSError as e:
+            DNS_CACHE.invalidate(self._dns_host, self.port)
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+
+
+class _WarmHTTPConnection(_HappyEyeballsConnection, HTTPConnection):
+    pass
+
+
+class _WarmHTTPSConnection(_HappyEyeballsConnection, HTTPSConnection):
+    pass
+
+
+class _WarmHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _WarmHTTPConnection
+
+
+class _WarmHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _WarmHTTPSConnection
+
+
+class WarmHTTPAdapter(HTTPAdapter):
+    """使用 DNS 缓存和 Happy Eyeballs 建立连接的 requests 适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _WarmHTTPConnectionPool, 'https': _WarmHTTPSConnectionPool}
+
+
+def _connect(conn):
+    try:
+        conn.connect()
+        return 1
+    except Exception:
+        conn.close()
+        return 0
+
+
+def warm_pool(session, url, connections=1):
+    """解析 url 的主机并在 session 的连接池中建立最多 connections 个连接 (包括 TLS 握手), 返回新建立的连接数"""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    DNS_CACHE.resolve(parts.hostname, port)
+    settings = session.merge_environment_settings(url, {}, None, None, None)
+    # 使用代理时连接的是代理服务器, 只预先解析
+    if settings['proxies']:
+        return 0
+
+    # 按 requests 发送请求时的方式取得连接池 (连接池的键包含证书设置)
+    adapter = session.get_adapter(url)
+    if hasattr(adapter, 'get_connection_with_tls_context'):
+        request = session.prepare_request(requests.Request('GET', url))
+        pool = adapter.get_connection_with_tls_context(request, settings['verify'], None, settings['cert'])
+    else:  # requests < 2.32
+        pool = adapter.get_connection(url)
+    conns = [pool._get_conn() for _ in range(max(1, min(connections, pool.pool.maxsize)))]
+    try:
+        fresh = [conn for conn in conns if conn.sock is None]
+        if not fresh:
+            return 0
+        with ThreadPoolExecutor(max_workers=len(fresh)) as executor:
+            return sum(executor.map(_connect, fresh))
+    finally:
+        for conn in conns:
+            pool._put_conn(conn)
+
+
+_shared_session = None
+_shared_lock = Lock()
+
+
+def shared_session():
+    """清单和 API 请求共用的会话, 启动时预热的连接可以被之后的请求复用"""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = requests.Session()
+            adapter = WarmHTTPAdapter()
+            _shared_session.mount("http://", adapter)
+            _shared_session.mount("https://", adapter)
+        return _shared_session
@@ -0,0 +1,115 @@
+import os
+import time
+from threading import Thread, Event
+
+from .engine import DownloadEngine, DownloadAborted, install, get_system_architecture
+from .ratelimit import RateLimiter
+from .metrics import SessionMetrics
+from .volumes import volume_files
+
+PREFETCH_DIR = "prefetch"  # 缓存目录下存放未完成预取文件的子目录
+
+
+def newest_release(versions):
+    """返回列表中第一个 level 为 1 的版本, 没有则返回 None"""
+    for version_info in versions:
+        if version_info.level == 1:
+            return version_info
+    return None
+
+
+class Prefetcher:
+    """空闲时在后台把最新版本预取到已校验缓存, 之后点击下载可以直接从缓存解压
+
+    fetch_versions 返回通道的版本列表; busy 返回前台是否有下载, 为真时预取立即暂停,
+    前台空闲 idle_delay 秒后从断点继续. 预取使用独立的限速器 (rate 字节/秒) 和较少的线程.
+    """
+
+    def __init__(self, cache_dir, fetch_versions, busy=None, rate=512 * 1024, threads=2, headers=None, arch=None,
+                 interval=1800, idle_delay=10, transport=None, on_log=None, on_done=None):
+        self.cache_dir = cache_dir
+        self.fetch_versions = fetch_versions
+        self.busy = busy or (lambda: False)
+        self.limiter = RateLimiter(rate)
+        self.threads = threads
+        self.headers = headers
+        self.arch = arch or get_system_architecture()
+        self.interval = interval  # 检查新版本的间隔 (秒)
+        self.idle_delay = idle_delay
+        self.transport = transport
+        self.on_log = on_log
+        self.on_done = on_done  # 预取完成时以版本信息调用
+        self.metrics = None
+        self.engine = None
+        self.stopped = Event()
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.engine:
+            self.engine.stop()
+
+    def _wait_idle(self):
+        """等待前台空闲 idle_delay 秒, 被停止时返回 False"""
+        idle_since = time.monotonic()
+        while not self.stopped.wait(1):
+            if self.busy():
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= self.idle_delay:
+                return True
+        return False
+
+    def _run(self):
+        while self._wait_idle():
+            try:
+                version_info = newest_release(self.fetch_versions())
+                if version_info and self._prefetch(version_info):
+                    if self.on_done:
+                        self.on_done(version_info)
+                    self.stopped.wait(self.interval)
+            except Exception as e:
+                self.log(f"预取失败: {str(e)}")
+                self.stopped.wait(self.interval)
+
+    def _prefetch(self, version_info):
+        """预取一个版本, 完成 (或已在缓存中) 返回 True, 因前台下载暂停返回 False"""
+        from .store import ArchiveCache
+
+        cache = ArchiveCache(self.cache_dir)
+        if all(cache.lookup(volume, self.arch) for volume in version_info.volume_infos()):
+            return True
+        self.metrics = SessionMetrics(f"prefetch {version_info.version} ({version_info.ver_code})")
+        self.engine = DownloadEngine(
+            threads=self.threads, headers=self.headers, on_log=self.on_log, limiter=self.limiter,
+            transport=self.transport, metrics=self.metrics, hedging=False, resume=True,
+        )
+        watch_stop = Event()
+        Thread(target=self._watch_busy, args=(self.engine, watch_stop), daemon=True).start()
+        save_dir = os.path.join(self.cache_dir, PREFETCH_DIR)
+        self.log(f"开始预取 {version_info.version} ({version_info.ver_code})")
+        try:
+            path = install(version_info, save_dir, arch=self.arch, cache_dir=self.cache_dir, engine=self.engine)
+        except DownloadAborted:
+            self.log("前台开始下载, 预取已暂停")
+            return False
+        finally:
+            watch_stop.set()
+        # 缓存中已有硬链接或副本, 删除预取目录中的文件
+        for volume_path in volume_files(path):
+            if os.path.exists(volume_path):
+                os.remove(volume_path)
+        self.log(f"预取完成: {version_info.version} ({version_info.ver_code})")
+        return True
+
+    def _watch_busy(self, engine, stop):
+        """前台开始下载时中止预取, 已下载的分段保留, 下次从断点继续"""
+        while not stop.wait(1):
+            if self.busy():
+                engine.stop()
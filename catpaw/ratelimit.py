@@ -0,0 +1,131 @@
+import time
+from contextlib import contextmanager
+from threading import Condition
+
+MIN_BURST = 64 * 1024  # 令牌桶的最小容量
+BURST_SECONDS = 0.2  # 令牌桶容量对应的时长
+
+
+class RateLimiter:
+    """所有下载连接共享的令牌桶限速器
+
+    rate 为每秒字节数, 0 表示不限速, 可以在下载过程中通过 set_rate 修改.
+    等待中的连接按排队顺序依次领取令牌, 每个仍在下载的连接轮流得到相同的份额,
+    慢下来的连接不会被其他连接饿死, 也就不会把限速造成的延迟都推给某一段.
+    """
+
+    def __init__(self, rate=0):
+        self._cond = Condition()
+        self._rate = max(0, int(rate))
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        """修改限速, 立即对所有连接生效"""
+        with self._cond:
+            self._refill()
+            self._rate = max(0, int(rate))
+            self._tokens = min(self._tokens, self._burst())
+            self._cond.notify_all()
+
+    def _burst(self):
+        return max(MIN_BURST, self._rate * BURST_SECONDS)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate > 0:
+            self._tokens = min(self._burst(), self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def _advance(self):
+        self._serving += 1
+        while self._serving in self._abandoned:
+            self._abandoned.discard(self._serving)
+            self._serving += 1
+        self._cond.notify_all()
+
+    def _abandon(self, ticket):
+        """放弃排队: 正在被服务时让给下一个, 否则轮到时跳过"""
+        if ticket != self._serving:
+            self._abandoned.add(ticket)
+        else:
+            self._advance()
+
+    def consume(self, size, abort=None):
+        """为 size 字节领取令牌, 必要时阻塞; 等待期间 abort (Event) 被设置时放弃并返回 False"""
+        if self._rate <= 0:
+            return True
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            try:
+                while self._rate > 0:
+                    if abort is not None and abort.is_set():
+                        self._abandon(ticket)
+                        return False
+                    if ticket == self._serving:
+                        self._refill()
+                        # 允许透支, 较大的块不会因为超过桶容量而永远等待
+                        if self._tokens > 0:
+                            self._tokens -= size
+                            break
+                        self._cond.wait(min(0.1, -self._tokens / self._rate + 0.001))
+                    else:
+                        self._cond.wait(0.1)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+            self._advance()
+            return True
+
+
+class ConnectionBudget:
+    """多个下载任务共享的全局连接数预算, 上限可以在运行中修改"""
+
+    def __init__(self, max_connections):
+        self._cond = Condition()
+        self._limit = max(1, int(max_connections))
+        self._in_use = 0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def set_limit(self, max_connections):
+        with self._cond:
+            self._limit = max(1, int(max_connections))
+            self._cond.notify_all()
+
+    def acquire(self, abort=None):
+        """占用一个连接名额; 等待期间 abort (Event) 被设置时返回 False"""
+        with self._cond:
+            while self._in_use >= self._limit:
+                if abort is not None and abort.is_set():
+                    return False
+                self._cond.wait(0.1 if abort is not None else None)
+            self._in_use += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,108 @@
+import os
+import json
+import zlib
+
+INDEX_SUFFIX = ".index"  # 客户端目录旁的文件索引
+READ_SIZE = 1024 * 1024
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def index_path(client_dir):
+    return os.path.abspath(client_dir).rstrip(os.sep) + INDEX_SUFFIX
+
+
+class InstallIndex:
+    """上次安装的文件索引: 压缩包中每个文件安装后的大小、修改时间 (纳秒) 和 CRC32, 保存在 <客户端目录>.index
+
+    已安装文件的大小和修改时间与索引一致时直接使用索引中的 CRC32, 否则重新读取文件计算.
+    索引中的文件名也是上次安装的文件列表, 新版本不再包含的文件据此删除 (不会删除用户自己添加的文件).
+    """
+
+    def __init__(self, client_dir):
+        self.client_dir = os.path.abspath(client_dir).rstrip(os.sep)
+        self.path = index_path(client_dir)
+        self.files = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                files = json.load(f).get('files')
+        except (OSError, ValueError, AttributeError):
+            return
+        if isinstance(files, dict):
+            self.files = files
+
+    def _path(self, name, root=None):
+        return os.path.join(root or self.client_dir, *name.split('/'))
+
+    def matches(self, entry):
+        """已安装的文件是否与压缩包条目相同 (大小和 CRC32 都一致)"""
+        try:
+            stat = os.stat(self._path(entry.name))
+        except OSError:
+            return False
+        if not os.path.isfile(self._path(entry.name)) or stat.st_size != entry.size:
+            return False
+        if entry.size == 0:
+            return True
+        if entry.crc is None:
+            return False
+        cached = self.files.get(entry.name)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2] == entry.crc
+        return file_crc32(self._path(entry.name)) == entry.crc
+
+    def plan(self, entries):
+        """返回 (需要解压的文件条目名, 上次安装过但新版本不再包含的文件名)"""
+        names = set()
+        changed = []
+        for entry in entries:
+            if entry.is_dir:
+                continue
+            names.add(entry.name)
+            if not self.matches(entry):
+                changed.append(entry.name)
+        stale = sorted(name for name in self.files if name not in names)
+        return changed, stale
+
+    def record(self, entries):
+        """安装完成后按客户端目录中的文件重建索引并保存"""
+        files = {}
+        for entry in entries:
+            if entry.is_dir:
+                continue
+            try:
+                stat = os.stat(self._path(entry.name))
+            except OSError:
+                continue
+            files[entry.name] = [stat.st_size, stat.st_mtime_ns, entry.crc]
+        self.files = files
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': files}, f)
+        os.replace(tmp_path, self.path)
+
+
+def remove_stale(root, names):
+    """删除 root 下的这些文件, 以及因此变空的目录, 返回删除的文件数"""
+    removed = 0
+    root = os.path.abspath(root)
+    for name in names:
+        path = os.path.abspath(os.path.join(root, *name.split('/')))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            continue
+        os.remove(path)
+        removed += 1
+        parent = os.path.dirname(path)
+        while parent != root and parent.startswith(root + os.sep) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+    return removed
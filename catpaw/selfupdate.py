@@ -0,0 +1,59 @@
+import os
+
+from .engine import HashMismatchError, DownloadAborted, download_verified, expected_hash, verify_hash, get_system_architecture
+
+try:
+    import bsdiff4
+except ImportError:
+    bsdiff4 = None
+
+
+def delta_available(update_info, current_version, arch):
+    """是否可以使用差分更新: 清单提供了针对当前版本的补丁和用于校验结果的哈希, 且安装了 bsdiff4"""
+    return bool(
+        bsdiff4 is not None and update_info.delta_url and update_info.delta_from == current_version
+        and expected_hash(update_info, arch)[0]
+    )
+
+
+def download_self_update(update_info, save_dir, engine, current_path=None, current_version=None, arch=None):
+    """下载新版本的下载器, 返回保存路径
+
+    有针对当前版本的差分补丁时先下载补丁, 与当前程序合成新版本, 合成失败时改为下载完整文件.
+    结果必须通过 version.ini 中的哈希校验; engine 开启续传时, 中断后再次调用会从断点继续.
+    """
+    arch = arch or get_system_architecture()
+    save_dir = save_dir or os.getcwd()
+    save_path = os.path.join(save_dir, update_info.url.split('/')[-1])
+
+    if current_path and os.path.isfile(current_path) and delta_available(update_info, current_version, arch):
+        try:
+            return _apply_delta(engine, update_info, current_path, save_path, arch)
+        except DownloadAborted:
+            raise
+        except Exception as e:
+            engine.log(f"差分更新失败, 改为下载完整文件: {str(e)}")
+
+    if not expected_hash(update_info, arch)[0]:
+        # 旧版 version.ini 没有哈希字段
+        engine.log("version.ini 未提供哈希值, 跳过校验")
+        return engine.download(update_info.url, save_path)
+    return download_verified(engine, update_info, save_path, arch)
+
+
+def _apply_delta(engine, update_info, current_path, save_path, arch):
+    patch_path = save_path + ".patch"
+    engine.log(f"下载差分补丁 (基于 v{update_info.delta_from})")
+    engine.download(update_info.delta_url, patch_path)
+    try:
+        with engine.metrics.stage('patch'):
+            bsdiff4.file_patch(current_path, save_path, patch_path)
+    finally:
+        os.remove(patch_path)
+
+    with engine.metrics.stage('hash'):
+        verified = verify_hash(save_path, update_info, arch)
+    if not verified:
+        os.remove(save_path)
+        raise HashMismatchError("差分合成的文件哈希校验失败")
+    return save_path
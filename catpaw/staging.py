@@ -0,0 +1,233 @@
+import os
+import shutil
+
+STAGING_SUFFIX = ".staging"  # 压缩包解压到的临时目录
+NEW_SUFFIX = ".new"  # 新版本目录: 硬链接的旧文件 + 解压出的文件
+ROLLBACK_SUFFIX = ".rollback"  # 上一个版本的快照
+SWAP_SUFFIX = ".swap"  # 回滚时当前版本的临时名称
+
+
+class InstallError(Exception):
+    """分阶段安装或回滚失败, 客户端目录保持原样"""
+
+
+def _remove_tree(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def link_tree(source_dir, target_dir):
+    """以硬链接复制目录树 (几乎不占额外空间), 不支持硬链接的文件系统上改为复制, 返回复制的文件数"""
+    copied = 0
+    os.makedirs(target_dir, exist_ok=True)
+    if not os.path.isdir(source_dir):
+        return copied
+    for root, dirs, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        for name in dirs:
+            os.makedirs(os.path.join(target_root, name), exist_ok=True)
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+                copied += 1
+    return copied
+
+
+def merge_tree(source_dir, target_dir):
+    """把 source_dir 中的文件移动到 target_dir 的对应位置
+
+    使用 os.replace 替换目录项, 而不是覆盖写入已有文件, 与快照共用 inode 的旧文件不会被改动.
+    """
+    for root, dirs, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        for name in dirs:
+            target = os.path.join(target_root, name)
+            if os.path.lexists(target) and not os.path.isdir(target):
+                os.remove(target)
+            os.makedirs(target, exist_ok=True)
+        for name in files:
+            target = os.path.join(target_root, name)
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            os.replace(os.path.join(root, name), target)
+
+
+def _swap_in(client_dir, new_dir):
+    """把 new_dir 换到 client_dir, 原来的目录保留为快照; 第二次改名失败时换回原目录"""
+    snapshot = client_dir + ROLLBACK_SUFFIX
+    if not os.path.isdir(client_dir):
+        os.rename(new_dir, client_dir)
+        return
+    _remove_tree(snapshot)
+    try:
+        os.rename(client_dir, snapshot)
+    except OSError as e:
+        raise InstallError(f"无法替换客户端目录, 请确认客户端已关闭: {str(e)}") from e
+    try:
+        os.rename(new_dir, client_dir)
+    except OSError as e:
+        os.rename(snapshot, client_dir)
+        raise InstallError(f"无法替换客户端目录: {str(e)}") from e
+
+
+def recover(client_dir):
+    """处理上次被中断的替换或回滚: 客户端目录不存在时恢复为完整的一个版本, 返回是否做了恢复"""
+    if os.path.isdir(client_dir):
+        return False
+    # 回滚在两次改名之间中断: 当前版本仍在 .swap, 快照已经换回
+    for candidate in (client_dir + SWAP_SUFFIX, client_dir + NEW_SUFFIX, client_dir + ROLLBACK_SUFFIX):
+        if os.path.isdir(candidate):
+            os.rename(candidate, client_dir)
+            return True
+    return False
+
+
+class _Plan:
+    """选择性解压的计划: 压缩包条目、需要解压的条目 (None 表示全部) 和需要删除的旧文件"""
+
+    def __init__(self, index=None, entries=None, members=None, stale=()):
+        self.index = index
+        self.entries = entries
+        self.members = members
+        self.stale = list(stale)
+
+
+def _plan(archive_path, client_dir, extractor, selective, log):
+    """selective 时按压缩包的条目列表 (大小和 CRC32) 与已安装的文件比较, 只解压内容不同的条目"""
+    from .extract import ExtractionError, list_archive
+    from .selective import InstallIndex
+
+    if not selective:
+        return _Plan()
+    index = InstallIndex(client_dir)
+    try:
+        entries = list_archive(archive_path, extractor=extractor)
+    except ExtractionError as e:
+        log(f"无法读取压缩包目录, 解压全部文件: {str(e)}")
+        return _Plan()
+    changed, stale = index.plan(entries)
+    total = sum(1 for entry in entries if not entry.is_dir)
+    log(f"{len(changed)}/{total} 个文件有变化, {len(stale)} 个旧文件将被删除")
+    return _Plan(index, entries, changed if len(changed) < total else None, stale)
+
+
+def _apply(archive_path, target_dir, plan, on_output, on_progress, extractor):
+    """按计划解压到 target_dir: 只解压有变化的条目并创建压缩包中的空目录"""
+    from .extract import extract_archive
+
+    if plan.members is None or plan.members:
+        extract_archive(archive_path, target_dir, on_output=on_output, on_progress=on_progress, extractor=extractor,
+                        members=plan.members)
+    os.makedirs(target_dir, exist_ok=True)
+    for entry in plan.entries or ():
+        if entry.is_dir:
+            os.makedirs(os.path.join(target_dir, *entry.name.split('/')), exist_ok=True)
+
+
+def _record(plan, log):
+    if plan.index is None:
+        return
+    try:
+        plan.index.record(plan.entries)
+    except OSError as e:
+        log(f"保存文件索引失败: {str(e)}")
+
+
+def staged_install(archive_path, client_dir, on_output=None, on_progress=None, extractor=None, on_log=None,
+                   selective=True):
+    """分阶段安装: 先解压到临时目录, 与旧版本的硬链接副本合并后整体替换客户端目录
+
+    解压失败或被中断时客户端目录不受影响; 替换成功后旧版本保留为快照 (未变化的文件与新版本共用),
+    rollback 可以在几秒内换回. 客户端正在运行导致目录无法改名时抛出 InstallError.
+    selective 时只解压与已安装文件不同的条目, 并删除新版本不再包含的文件.
+    """
+    from .selective import remove_stale
+
+    def log(message):
+        if on_log:
+            on_log(message)
+
+    client_dir = os.path.abspath(client_dir).rstrip(os.sep)
+    if recover(client_dir):
+        log("已恢复上次中断的安装")
+    staging = client_dir + STAGING_SUFFIX
+    new_dir = client_dir + NEW_SUFFIX
+    for path in (staging, new_dir):
+        _remove_tree(path)
+
+    try:
+        plan = _plan(archive_path, client_dir, extractor, selective, log)
+        _apply(archive_path, staging, plan, on_output, on_progress, extractor)
+        copied = link_tree(client_dir, new_dir)
+        if copied:
+            log(f"文件系统不支持硬链接, 复制了 {copied} 个文件")
+        merge_tree(staging, new_dir)
+        # 删除的是 .new 中的硬链接, 快照中的旧文件不受影响
+        remove_stale(new_dir, plan.stale)
+        _swap_in(client_dir, new_dir)
+    except BaseException:
+        for path in (staging, new_dir):
+            try:
+                _remove_tree(path)
+            except OSError as e:
+                log(f"删除临时目录失败: {path}: {str(e)}")
+        raise
+    _remove_tree(staging)
+    _record(plan, log)
+    log(f"安装完成, 上一个版本保留在 {client_dir + ROLLBACK_SUFFIX}")
+
+
+def has_snapshot(client_dir):
+    return os.path.isdir(os.path.abspath(client_dir).rstrip(os.sep) + ROLLBACK_SUFFIX)
+
+
+def rollback(client_dir):
+    """换回上一个版本的快照; 当前版本成为新的快照, 再次回滚即可换回"""
+    from .selective import index_path
+
+    client_dir = os.path.abspath(client_dir).rstrip(os.sep)
+    recover(client_dir)
+    snapshot = client_dir + ROLLBACK_SUFFIX
+    swap = client_dir + SWAP_SUFFIX
+    if not os.path.isdir(snapshot):
+        raise InstallError("没有可以回滚的版本")
+    _remove_tree(swap)
+    try:
+        os.rename(client_dir, swap)
+    except OSError as e:
+        raise InstallError(f"无法替换客户端目录, 请确认客户端已关闭: {str(e)}") from e
+    try:
+        os.rename(snapshot, client_dir)
+    except OSError as e:
+        os.rename(swap, client_dir)
+        raise InstallError(f"无法替换客户端目录: {str(e)}") from e
+    os.rename(swap, snapshot)
+    # 文件索引描述的是换下来的版本, 删除后下次安装重新比较所有文件 (不删除任何旧文件)
+    if os.path.exists(index_path(client_dir)):
+        os.remove(index_path(client_dir))
+
+
+def install_archive(archive_path, client_dir, on_output=None, on_progress=None, extractor=None, staged=True,
+                    on_log=None, selective=True):
+    """把压缩包安装到客户端目录: staged 时分阶段安装 (可回滚), 否则直接解压到客户端目录;
+    selective 时只写入内容有变化的文件并删除新版本不再包含的文件"""
+    from .selective import remove_stale
+
+    def log(message):
+        if on_log:
+            on_log(message)
+
+    if staged:
+        staged_install(archive_path, client_dir, on_output=on_output, on_progress=on_progress, extractor=extractor,
+                       on_log=on_log, selective=selective)
+        return
+    plan = _plan(archive_path, client_dir, extractor, selective, log)
+    _apply(archive_path, client_dir, plan, on_output, on_progress, extractor)
+    remove_stale(client_dir, plan.stale)
+    _record(plan, log)
@@ -0,0 +1,78 @@
+import os
+import json
+import shutil
+
+from .engine import expected_hash, verify_hash
+
+MARKER_SUFFIX = ".verified"  # 校验记录文件的后缀
+
+
+def link_or_copy(source, target):
+    """把 source 放到 target: 优先硬链接 (不占额外空间, 也不用读写整个文件), 不支持时复制; 先写临时文件再替换"""
+    tmp_path = target + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+class ArchiveCache:
+    """已校验压缩包的本地缓存目录, 每个文件旁边有一个记录哈希、大小和修改时间的校验记录"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, version_info):
+        return os.path.join(self.cache_dir, version_info.url.split('/')[-1])
+
+    def _read_marker(self, path):
+        try:
+            with open(path + MARKER_SUFFIX, 'r') as f:
+                marker = json.load(f)
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        # 文件在校验之后被改动过则视为未校验
+        if marker.get('size') != stat.st_size or marker.get('mtime') != int(stat.st_mtime):
+            return None
+        return marker
+
+    def _write_marker(self, path, hashes):
+        stat = os.stat(path)
+        with open(path + MARKER_SUFFIX, 'w') as f:
+            json.dump({'size': stat.st_size, 'mtime': int(stat.st_mtime), 'hashes': hashes}, f)
+
+    def is_verified(self, path):
+        """文件是否带有有效的校验记录 (供镜像服务判断能否对外提供)"""
+        return os.path.isfile(path) and self._read_marker(path) is not None
+
+    def lookup(self, version_info, arch):
+        """缓存中有该版本且哈希一致时返回路径, 否则返回 None"""
+        path = self.path_for(version_info)
+        marker = self._read_marker(path)
+        if marker is None:
+            return None
+        expected, _ = expected_hash(version_info, arch)
+        if not expected or marker.get('hashes', {}).get(arch_hash_key(arch), '').lower() != expected.lower():
+            return None
+        return path
+
+    def add(self, file_path, version_info, arch):
+        """把已校验的文件放入缓存 (优先硬链接), 返回缓存路径"""
+        path = self.path_for(version_info)
+        if os.path.abspath(file_path) != path:
+            link_or_copy(file_path, path)
+        elif not verify_hash(path, version_info, arch):
+            return None
+        expected, _ = expected_hash(version_info, arch)
+        self._write_marker(path, {arch_hash_key(arch): expected.lower()})
+        return path
+
+
+def arch_hash_key(arch):
+    """架构对应的哈希字段名"""
+    return 'hashb2s' if arch == 'x86' else 'hashb2b'
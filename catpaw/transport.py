@@ -0,0 +1,184 @@
+import socket
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+
+from .netwarm import DNS_CACHE, WarmHTTPAdapter, warm_pool
+
+try:
+    import httpx
+    import h2  # noqa: F401  httpx 只有在安装了 h2 时才能使用 HTTP/2
+except ImportError:
+    httpx = None
+
+
+class TransportError(Exception):
+    """传输层请求失败"""
+
+
+class RequestsTransport:
+    """基于 requests 的 HTTP/1.1 传输, 同一主机的连接会被复用 (keep-alive 连接池)
+
+    新连接使用 DNS 缓存并以 Happy Eyeballs 方式同时尝试 IPv6 和 IPv4.
+    """
+
+    name = "http/1.1"
+
+    def __init__(self, pool_size=16):
+        self.session = requests.Session()
+        adapter = WarmHTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, headers=None, timeout=None):
+        """发起流式 GET 请求, 返回可用 with 语句关闭的响应; timeout 可以是 (连接超时, 读取超时)"""
+        return self.session.get(url, headers=headers, stream=True, timeout=timeout)
+
+    def warm(self, url, connections=1):
+        """预先解析主机并建立 connections 个连接放入连接池, 返回新建立的连接数"""
+        return warm_pool(self.session, url, connections)
+
+    def interrupt(self, response):
+        """从其他线程断开响应的连接, 阻塞在读取中的线程立即返回"""
+        connection = getattr(getattr(response, 'raw', None), '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return
+        try:
+            # 绕过 SSLSocket.shutdown, 直接关闭底层 TCP 连接
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.session.close()
+
+
+class _Http2Response:
+    """把 httpx 的流式响应包装成与 requests 响应相同的接口"""
+
+    def __init__(self, context, on_close=None):
+        self._context = context
+        self._response = context.__enter__()
+        self.status_code = self._response.status_code
+        self.headers = self._response.headers
+        self.http_version = self._response.http_version
+        self.network_stream = self._response.extensions.get('network_stream')  # 响应所在的连接
+        self.interrupted = False
+        self._on_close = on_close
+        self._stream = None
+        self._pending = b''
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise TransportError(f"{self.status_code} Error for url: {self._response.url}")
+
+    def iter_content(self, chunk_size=8192):
+        return self._response.iter_bytes(chunk_size)
+
+    def readinto(self, buffer):
+        """把数据读入 buffer, 直到填满或响应结束, 返回读取的字节数 (httpx 没有 readinto, 需要复制一次)"""
+        if self._stream is None:
+            self._stream = self._response.iter_bytes()
+        filled = 0
+        while filled < len(buffer):
+            if self.interrupted:
+                raise TransportError("连接已被断开")
+            if not self._pending:
+                self._pending = next(self._stream, b'')
+                if not self._pending:
+                    break
+            size = min(len(buffer) - filled, len(self._pending))
+            buffer[filled:filled + size] = memoryview(self._pending)[:size]
+            self._pending = self._pending[size:]
+            filled += size
+        return filled
+
+    def close(self):
+        self.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._on_close:
+            self._on_close(self)
+        self._context.__exit__(*exc_info)
+
+
+class Http2Transport:
+    """基于 httpx 的 HTTP/2 传输, 所有分段作为并发的流复用同一个连接
+
+    服务器不支持 HTTP/2 时 httpx 会自动协商为 HTTP/1.1, 并使用连接池.
+    同一连接上的流不能单独断开 (读取线程阻塞在共用的套接字上), interrupt 在连接上所有正在读取的流
+    都被中断时关闭整个连接; 还有其他任务的流在读取时, 被中断的流在收到下一块数据时退出.
+    """
+
+    name = "http/2"
+
+    def __init__(self, pool_size=16):
+        self.client = httpx.Client(
+            http2=True,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max(1, pool_size), max_keepalive_connections=max(1, pool_size)),
+        )
+        self._responses = set()  # 正在读取的响应
+        self._lock = Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        if isinstance(timeout, tuple):
+            request_timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        else:
+            request_timeout = httpx.Timeout(timeout)
+        try:
+            response = _Http2Response(self.client.stream("GET", url, headers=headers, timeout=request_timeout),
+                                      on_close=self._closed)
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        with self._lock:
+            self._responses.add(response)
+        return response
+
+    def _closed(self, response):
+        with self._lock:
+            self._responses.discard(response)
+
+    def warm(self, url, connections=1):
+        """预先解析主机并建立 HTTP/2 连接 (所有分段复用一个连接, connections 被忽略)"""
+        parts = urlsplit(url)
+        DNS_CACHE.resolve(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        with self.client.stream("GET", url, headers={'Range': 'bytes=0-0'}, timeout=httpx.Timeout(10)):
+            pass
+        return 1
+
+    def interrupt(self, response):
+        """中断响应: 同一连接上正在读取的流都已被中断时关闭连接, 阻塞在读取中的线程立即返回"""
+        with self._lock:
+            response.interrupted = True
+            stream = response.network_stream
+            if stream is None or any(other.network_stream is stream and not other.interrupted
+                                     for other in self._responses):
+                return
+        sock = stream.get_extra_info('socket')
+        if sock is None:
+            return
+        try:
+            # 与 RequestsTransport 相同, 绕过 SSLSocket.shutdown 直接关闭底层 TCP 连接
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.client.close()
+
+
+def http2_available():
+    return httpx is not None
+
+
+def create_transport(http2=False, pool_size=16):
+    """创建传输层; 请求 HTTP/2 但未安装 httpx[http2] 时回退到 HTTP/1.1 连接池"""
+    if http2 and http2_available():
+        return Http2Transport(pool_size)
+    return RequestsTransport(pool_size)
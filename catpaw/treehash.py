@@ -0,0 +1,61 @@
+"""BLAKE2 树模式哈希
+
+文件按 leaf_size 切成叶子, 每个叶子用 BLAKE2 的树参数 (fanout=0 即不限扇出, depth=2, node_offset 为叶子序号,
+node_depth=0, 最后一个叶子设置 last_node) 单独计算摘要, 根节点 (node_depth=1, last_node) 按顺序读入所有叶子摘要.
+各叶子互不依赖, 可以在多个线程中同时计算 (hashlib 计算较大的数据时会释放 GIL, 能用满多个核心).
+"""
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LEAF_SIZE = 8 * 1024 * 1024
+DIGEST_SIZE = 32
+READ_SIZE = 1024 * 1024
+
+
+def _node(new_hash, leaf_size, node_offset, node_depth, last_node):
+    return new_hash(digest_size=DIGEST_SIZE, fanout=0, depth=2, leaf_size=leaf_size, node_offset=node_offset,
+                    node_depth=node_depth, inner_size=DIGEST_SIZE, last_node=last_node)
+
+
+def _hash_leaf(path, new_hash, leaf_size, index, last):
+    node = _node(new_hash, leaf_size, index, 0, last)
+    with open(path, 'rb') as f:
+        f.seek(index * leaf_size)
+        remaining = leaf_size
+        while remaining > 0:
+            block = f.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            node.update(block)
+            remaining -= len(block)
+    return node.digest()
+
+
+def tree_digest(path, new_hash=hashlib.blake2b, leaf_size=DEFAULT_LEAF_SIZE, workers=None):
+    """计算文件的树模式摘要 (十六进制), new_hash 为 hashlib.blake2b 或 hashlib.blake2s, workers 默认为核心数"""
+    if not 0 < leaf_size < 2 ** 32:
+        raise ValueError("叶子大小必须在 1 到 4294967295 字节之间")
+    count = max(1, (os.path.getsize(path) + leaf_size - 1) // leaf_size)
+    workers = min(count, workers or os.cpu_count() or 1)
+    leaves = [(path, new_hash, leaf_size, i, i == count - 1) for i in range(count)]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = list(executor.map(lambda leaf: _hash_leaf(*leaf), leaves))
+    else:
+        digests = [_hash_leaf(*leaf) for leaf in leaves]
+    root = _node(new_hash, leaf_size, 0, 1, True)
+    for digest in digests:
+        root.update(digest)
+    return root.hexdigest()
+
+
+def expected_tree_hash(version_info, arch):
+    """返回当前架构对应的 (树模式哈希, 哈希函数, 叶子大小), 清单未提供时返回 None"""
+    if arch == 'x86':
+        expected, new_hash = getattr(version_info, 'treeb2s', None), hashlib.blake2s
+    else:
+        expected, new_hash = getattr(version_info, 'treeb2b', None), hashlib.blake2b
+    if not expected:
+        return None
+    return expected.strip().lower(), new_hash, getattr(version_info, 'tree_leaf', None) or DEFAULT_LEAF_SIZE
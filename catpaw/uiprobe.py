@@ -0,0 +1,163 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+
+DEFAULT_INTERVAL = 0.05  # 心跳间隔 (秒)
+DEFAULT_THRESHOLD = 0.1  # 心跳延迟超过该值记为一次卡顿 (秒)
+LAG_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # 延迟直方图的上界 (秒)
+SPAN_HISTORY = 256  # 保留的已结束操作数, 用于把卡顿归到刚结束的操作上
+RECENT_STALLS = 50  # 报告中列出的最近卡顿数
+UNATTRIBUTED = "other"
+
+
+class _OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.max_stall = 0.0
+
+    def to_dict(self):
+        return {
+            'calls': self.calls, 'total_time': round(self.total_time, 4), 'max_time': round(self.max_time, 4),
+            'stalls': self.stalls, 'stall_time': round(self.stall_time, 4), 'max_stall': round(self.max_stall, 4),
+        }
+
+
+class LagProbe:
+    """界面响应探针: 在 Tk 主循环中按固定间隔安排心跳, 心跳实际执行时间与预定时间之差即主循环的延迟
+
+    延迟超过 threshold 记为一次卡顿, 归到与卡顿时间段重叠最多的操作 (operation / wrap 标记的函数),
+    没有重叠的操作时记为 "other". 标记操作可以在任何线程中进行.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, threshold=DEFAULT_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lock = Lock()
+        self.root = None
+        self._after_id = None
+        self._expected = None
+        self._started_at = None
+        self._active = {}  # 标记 -> (操作名, 开始时间)
+        self._spans = deque(maxlen=SPAN_HISTORY)  # (操作名, 开始时间, 结束时间)
+        self._next_token = 0
+        self.ticks = 0
+        self.lag_total = 0.0
+        self.max_lag = 0.0
+        self.histogram = [0] * (len(LAG_BUCKETS) + 1)
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.recent = deque(maxlen=RECENT_STALLS)
+        self.operations = {}
+
+    def start(self, root):
+        self.root = root
+        self._started_at = time.monotonic()
+        self._schedule()
+
+    def stop(self):
+        if self.root is not None and self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+        self._after_id = None
+        self.root = None
+
+    def _schedule(self):
+        self._expected = time.monotonic() + self.interval
+        self._after_id = self.root.after(int(self.interval * 1000), self._tick)
+
+    def _tick(self):
+        if self.root is None:
+            return
+        now = time.monotonic()
+        self.record_lag(self._expected, now)
+        self._schedule()
+
+    def record_lag(self, expected, now):
+        """记录一次心跳: 本应在 expected 执行, 实际在 now 执行"""
+        lag = max(0.0, now - expected)
+        with self.lock:
+            self.ticks += 1
+            self.lag_total += lag
+            self.max_lag = max(self.max_lag, lag)
+            bucket = 0
+            while bucket < len(LAG_BUCKETS) and lag > LAG_BUCKETS[bucket]:
+                bucket += 1
+            self.histogram[bucket] += 1
+            if lag <= self.threshold:
+                return
+            name = self._attribute(expected, now)
+            self.stalls += 1
+            self.stall_time += lag
+            stats = self.operations.setdefault(name, _OperationStats())
+            stats.stalls += 1
+            stats.stall_time += lag
+            stats.max_stall = max(stats.max_stall, lag)
+            self.recent.append({'at': time.time() - (time.monotonic() - expected), 'lag': round(lag, 4),
+                                'operation': name})
+
+    def _attribute(self, start, end):
+        # 调用方持有 self.lock
+        overlaps = {}
+        spans = list(self._spans) + [(name, began, end) for name, began in self._active.values()]
+        for name, began, finished in spans:
+            overlap = min(finished, end) - max(began, start)
+            if overlap > 0:
+                overlaps[name] = overlaps.get(name, 0.0) + overlap
+        if not overlaps:
+            return UNATTRIBUTED
+        return max(overlaps, key=overlaps.get)
+
+    @contextmanager
+    def operation(self, name):
+        """标记一段操作, 期间 (或重叠) 发生的卡顿归到 name"""
+        with self.lock:
+            token = self._next_token
+            self._next_token += 1
+            began = time.monotonic()
+            self._active[token] = (name, began)
+        try:
+            yield
+        finally:
+            finished = time.monotonic()
+            with self.lock:
+                del self._active[token]
+                self._spans.append((name, began, finished))
+                stats = self.operations.setdefault(name, _OperationStats())
+                stats.calls += 1
+                stats.total_time += finished - began
+                stats.max_time = max(stats.max_time, finished - began)
+
+    def wrap(self, name, func):
+        """返回把每次调用都标记为操作 name 的 func"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.operation(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def summary(self):
+        """供会话报告使用的汇总: 延迟分布、卡顿次数和时间, 以及各操作的耗时和造成的卡顿"""
+        with self.lock:
+            histogram = {f"<={bound}": count for bound, count in zip(LAG_BUCKETS, self.histogram)}
+            histogram[f">{LAG_BUCKETS[-1]}"] = self.histogram[-1]
+            return {
+                'interval': self.interval,
+                'threshold': self.threshold,
+                'duration': round(time.monotonic() - self._started_at, 3) if self._started_at else 0.0,
+                'ticks': self.ticks,
+                'mean_lag': round(self.lag_total / self.ticks, 4) if self.ticks else 0.0,
+                'max_lag': round(self.max_lag, 4),
+                'lag_histogram': histogram,
+                'stalls': self.stalls,
+                'stall_time': round(self.stall_time, 4),
+                'operations': {name: stats.to_dict() for name, stats in sorted(self.operations.items())},
+                'recent_stalls': list(self.recent),
+            }
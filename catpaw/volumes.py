@@ -0,0 +1,168 @@
+import io
+import os
+import re
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+from .engine import DownloadTracker, DownloadAborted, download_verified
+from .store import link_or_copy
+
+VOLUME_PATTERN = re.compile(r'^(.*)\.(\d{3})$')
+
+
+class VolumeTracker(DownloadTracker):
+    """多个分卷的合计进度, 读取时汇总各分卷引擎的进度; 尚未开始的分卷按已知分卷的大小估算"""
+
+    def __init__(self, engines, count):
+        DownloadTracker.__init__(self, 0)
+        self.engines = engines
+        self.count = count  # 需要下载的分卷数
+
+    def get_progress(self):
+        trackers = [engine.tracker for engine in list(self.engines) if engine.tracker]
+        with self.lock:
+            self.downloaded = sum(tracker.downloaded for tracker in trackers)
+            self.total_size = sum(tracker.total_size for tracker in trackers)
+            if trackers and len(trackers) < self.count:
+                self.total_size += max(tracker.total_size for tracker in trackers) * (self.count - len(trackers))
+        return DownloadTracker.get_progress(self)
+
+
+class VolumeReader(io.RawIOBase):
+    """把多个分卷拼接为一个只读、可随机访问的文件对象"""
+
+    def __init__(self, paths):
+        io.RawIOBase.__init__(self)
+        self.name = paths[0]
+        self._files = [open(path, 'rb') for path in paths]
+        self._offsets = [0]
+        for f in self._files:
+            self._offsets.append(self._offsets[-1] + os.fstat(f.fileno()).st_size)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._offsets[-1]
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        index = bisect_right(self._offsets, self._position) - 1
+        if index >= len(self._files):
+            return 0
+        f = self._files[index]
+        f.seek(self._position - self._offsets[index])
+        view = memoryview(buffer)[:self._offsets[index + 1] - self._position]
+        received = f.readinto(view)
+        self._position += received
+        return received
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        io.RawIOBase.close(self)
+
+
+def volume_files(path):
+    """path 为第一个分卷 (.001) 时返回同一目录下已存在的所有分卷, 否则返回 [path]"""
+    match = VOLUME_PATTERN.match(path)
+    if not match or match.group(2) != '001':
+        return [path]
+    paths = []
+    index = 1
+    while os.path.exists(f"{match.group(1)}.{index:03d}"):
+        paths.append(f"{match.group(1)}.{index:03d}")
+        index += 1
+    return paths
+
+
+def download_volumes(engine, volumes, save_paths, arch, mirrors=None, cache=None):
+    """并发下载各分卷, 每个分卷单独校验并放入缓存, 返回各分卷可供解压的路径 (有缓存时为缓存中的路径)
+
+    各分卷使用 engine.spawn 创建的引擎, 共享连接预算和限速器; engine.tracker 为所有分卷的合计进度.
+    """
+    paths = [None] * len(volumes)
+    pending = []
+    for i, volume in enumerate(volumes):
+        cached = cache.lookup(volume, arch) if cache else None
+        if cached:
+            paths[i] = cached
+        else:
+            pending.append(i)
+    if not pending:
+        engine.log(f"全部 {len(volumes)} 个分卷都在本地缓存中")
+        return paths
+
+    parallel = max(1, min(len(pending), engine.threads))
+    threads = max(1, engine.threads // parallel)
+    engines = []
+    failed = Event()  # 有分卷失败后不再开始新的分卷 (暂停由各分卷引擎共用的令牌处理)
+    engine.tracker = VolumeTracker(engines, len(pending))
+    engine.log(f"下载 {len(pending)}/{len(volumes)} 个分卷, 同时下载 {parallel} 个, 每个分卷 {threads} 个线程")
+
+    def fetch(i):
+        if failed.is_set():
+            raise DownloadAborted("下载已中止")
+        name = os.path.basename(save_paths[i])
+        child = engine.spawn(threads, engine.metrics.child(name))
+        if engine.on_progress:
+            child.on_progress = lambda _: engine.on_progress(engine.tracker)
+        engines.append(child)
+        download_verified(child, volumes[i], save_paths[i], arch, mirrors)
+        engine.log(f"分卷 {name} 下载完成并通过校验")
+        if cache:
+            return cache.add(save_paths[i], volumes[i], arch)
+        return save_paths[i]
+
+    with engine.metrics.stage('download'), ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {i: executor.submit(fetch, i) for i in pending}
+        try:
+            for i, future in futures.items():
+                paths[i] = future.result()
+        except Exception:
+            failed.set()
+            engine.stop()  # 一个分卷失败时停止其他分卷
+            raise
+    return paths
+
+
+def install_volumes(engine, version_info, save_dir, client_dir=None, arch=None, mirrors=None, cache=None,
+                    on_extract_output=None, extractor=None, on_extract_progress=None, staged=True, selective=True):
+    """下载、校验并 (可选) 解压分卷版本, 返回第一个分卷的路径; 解压成功后下载的分卷会被删除"""
+    from .staging import install_archive
+
+    volumes = version_info.volume_infos()
+    save_paths = [os.path.join(save_dir, volume.url.split('/')[-1]) for volume in volumes]
+    os.makedirs(save_dir, exist_ok=True)
+    paths = download_volumes(engine, volumes, save_paths, arch, mirrors, cache)
+
+    if client_dir:
+        # 所有分卷都在同一目录下, 从第一个分卷开始解压
+        with engine.metrics.stage('extract'):
+            install_archive(paths[0], client_dir, on_output=on_extract_output, on_progress=on_extract_progress,
+                            extractor=extractor, staged=staged, on_log=engine.log, selective=selective)
+        for path, save_path in zip(paths, save_paths):
+            if os.path.exists(save_path) and os.path.abspath(save_path) != os.path.abspath(path):
+                os.remove(save_path)
+            elif not cache:
+                os.remove(path)
+        return paths[0]
+
+    for path, save_path in zip(paths, save_paths):
+        if not (os.path.exists(save_path) and os.path.samefile(path, save_path)):
+            link_or_copy(path, save_path)
+    return save_paths[0]
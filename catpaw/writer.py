@@ -0,0 +1,125 @@
+import os
+from threading import Thread, Condition
+
+MAX_PENDING = 32 * 1024 * 1024  # 等待写盘的数据上限, 超出时下载线程等待 (背压)
+MAX_WRITE = 8 * 1024 * 1024  # 合并后单次写入的上限
+IDLE_TIMEOUT = 1.0  # 写盘线程空闲多久后退出 (秒), 有新数据时重新启动
+
+
+class WriteBehind:
+    """后台写盘: 下载线程把收到的数据交给写盘线程后立即继续接收, 磁盘慢时不会拖慢网络读取
+
+    同一文件中相邻的数据在等待期间合并为较大的顺序写入; 等待写盘的数据超过 max_pending 时,
+    下载线程在 write 中等待. flush 等待某个文件的数据全部写入并关闭文件, 只有 sync 时才 fsync.
+    写盘出错时该文件的后续数据被丢弃, 错误 (OSError) 在下一次 write 或 flush 时抛出.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING, max_write=MAX_WRITE, disk_limiter=None):
+        self.max_pending = max_pending
+        self.max_write = max_write
+        self.disk_limiter = disk_limiter  # 限制写盘速度的 RateLimiter, 在写盘线程中等待
+        self._cond = Condition()
+        self._queue = []  # 等待写入的 [path, offset, bytearray]
+        self._tails = {}  # 文件 -> 队列中该文件最后一项, 相邻的数据直接追加到这一项
+        self._pending = {}  # 文件 -> 已交出但尚未写入的字节数
+        self._total = 0
+        self._errors = {}  # 文件 -> 写盘线程遇到的错误
+        self._files = {}  # 写盘线程打开的文件
+        self._thread = None
+
+    def open(self, path, offset=0):
+        """从 offset 开始顺序写入 path 的写入流"""
+        return WriteStream(self, path, offset)
+
+    def write(self, path, offset, data):
+        """把 data 复制到写盘队列 (调用方可以立即复用自己的缓冲区)"""
+        size = len(data)
+        with self._cond:
+            while self._total >= self.max_pending and path not in self._errors:
+                self._cond.wait()
+            if path in self._errors:
+                raise self._errors[path]
+            tail = self._tails.get(path)
+            if tail is not None and tail[1] + len(tail[2]) == offset and len(tail[2]) + size <= self.max_write:
+                tail[2] += data
+            else:
+                tail = [path, offset, bytearray(data)]
+                self._queue.append(tail)
+                self._tails[path] = tail
+            self._pending[path] = self._pending.get(path, 0) + size
+            self._total += size
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, path, sync=False):
+        """等待 path 的数据全部写入后关闭文件, sync 时先 fsync; 写盘出错时抛出该错误"""
+        with self._cond:
+            while self._pending.get(path):
+                self._cond.wait()
+            self._pending.pop(path, None)
+            error = self._errors.pop(path, None)
+            f = self._files.pop(path, None)
+        if f is not None:
+            try:
+                if sync and error is None:
+                    os.fsync(f.fileno())
+            finally:
+                f.close()
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    if not self._cond.wait(IDLE_TIMEOUT) and not self._queue:
+                        self._thread = None
+                        return
+                batch, self._queue = self._queue, []
+                self._tails.clear()
+            for path, offset, data in batch:
+                self._write(path, offset, data)
+                with self._cond:
+                    self._pending[path] -= len(data)
+                    self._total -= len(data)
+                    self._cond.notify_all()
+
+    def _write(self, path, offset, data):
+        if path in self._errors:
+            return
+        if self.disk_limiter:
+            self.disk_limiter.consume(len(data))
+        try:
+            f = self._files.get(path)
+            if f is None:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+                f = self._files[path] = os.fdopen(fd, 'r+b', buffering=0)
+            f.seek(offset)
+            view = memoryview(data)
+            while view:
+                view = view[f.write(view):]
+        except OSError as e:
+            with self._cond:
+                self._errors[path] = e
+                f = self._files.pop(path, None)
+            if f is not None:
+                f.close()
+
+
+class WriteStream:
+    """WriteBehind 上的顺序写入流, 接口与文件的 write 相同"""
+
+    def __init__(self, writer, path, offset=0):
+        self.writer = writer
+        self.path = path
+        self.offset = offset
+
+    def write(self, data):
+        self.writer.write(self.path, self.offset, data)
+        self.offset += len(data)
+        return len(data)
+
+    def close(self, sync=False):
+        self.writer.flush(self.path, sync)
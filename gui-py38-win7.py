@@ -2,17 +2,33 @@ import os
 import sys
 import time
 import platform
-import requests
 import json
-from concurrent.futures import ThreadPoolExecutor
-from threading import Thread, Lock
+import multiprocessing
+from threading import Thread
+from queue import Queue, Empty
+from contextlib import nullcontext
 from packaging import version
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import webbrowser
 import subprocess
 import shutil
-import hashlib
+from catpaw import HashMismatchError, fetch_channel_versions, latest_available, verify_hash
+from catpaw.extract import create_extractor, Py7zrExtractor
+from catpaw.staging import install_archive, rollback, has_snapshot, InstallError
+from catpaw import DownloadEngine, DownloadCancelled, fetch_update_info, API_BASE
+from catpaw.netwarm import warm_pool, shared_session
+from catpaw.endpoints import SCOREBOARD, DOWNLOAD_ENDPOINTS
+from catpaw.manifest import API_ENDPOINTS
+from catpaw.selfupdate import download_self_update
+from catpaw.prefetch import Prefetcher
+from catpaw.volumes import volume_files
+from catpaw.mirror import MirrorServer, DEFAULT_MIRROR_PORT
+from catpaw.ratelimit import RateLimiter
+from catpaw.transport import create_transport
+from catpaw.metrics import MetricsServer, MetricsFileWriter
+from catpaw.uiprobe import LagProbe
+from catpaw.jobs import DownloadQueue, QUEUED as JOB_QUEUED, DONE as JOB_DONE, FAILED as JOB_FAILED, CANCELLED as JOB_CANCELLED
 
 def resource_path(relative_path):
     """获取资源的绝对路径,用于PyInstaller打包后定位资源文件"""
@@ -70,9 +86,6 @@ def delete_7z_files():
             except Exception as e:
                 print(f"无法删除文件 {file}: {str(e)}")
 
-# 在程序启动时释放 7z 文件
-extract_7z_files()
-
 # 配置参数
 CURRENT_VERSION = "1.1.1"  # 当前版本号
 CURRENT_VER_CODE = "1111"  # 当前版本代码
@@ -81,71 +94,6 @@ DEFAULT_DOWNLOAD_DIR = os.path.join(os.getcwd(), "RF-Downloader")  # 默认下
 ICON_PATH = resource_path("lty1.ico")   # 应用图标
 CONFIG_PATH = "config.json"  # 保存窗体位置的文件
 
-class DownloadTracker:
-    def __init__(self, total_size):
-        self.total_size = total_size
-        self.downloaded = 0
-        self.lock = Lock()
-        self.start_time = time.time()
-        self.last_update = self.start_time
-        self.last_downloaded = 0
-        self.speed = 0
-        self.remaining_time = 0
-
-    def update(self, size):
-        with self.lock:
-            self.downloaded += size
-
-    def get_progress(self):
-        with self.lock:
-            elapsed = time.time() - self.start_time
-            percent = (self.downloaded / self.total_size) * 100 if self.total_size else 0
-            self.speed = (self.downloaded - self.last_downloaded) / (time.time() - self.last_update + 1e-9)
-            self.last_downloaded = self.downloaded
-            self.last_update = time.time()
-
-            self.remaining_time = (self.total_size - self.downloaded) / self.speed if self.speed > 0 else 0
-
-            return {
-                'percent': percent,
-                'downloaded': self.downloaded,
-                'total': self.total_size,
-                'speed': self.speed,
-                'remaining': self.remaining_time,
-            }
-
-    def _human_size(self, size):
-        units = ('B', 'KB', 'MB', 'GB')
-        index = 0
-        while size >= 1024 and index < 3:
-            size /= 1024
-            index += 1
-        return f"{size:.2f} {units[index]}"
-
-    def _format_time(self, seconds):
-        if seconds <= 0:
-            return "--:--"
-        minutes, seconds = divmod(seconds, 60)
-        hours, minutes = divmod(minutes, 60)
-        days, hours = divmod(hours, 24)
-        if days > 0:
-            return f"{int(days)}天 {int(hours):02}:{int(minutes):02}:{int(seconds):02}"
-        elif hours > 0:
-            return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
-        return f"{int(minutes):02}:{int(seconds):02}"
-
-
-class VersionInfo:
-    def __init__(self, version, ver_code, changelog, level, url, hashb2b, hashb2s):
-        self.version = version
-        self.ver_code = ver_code
-        self.changelog = changelog.replace('\\n', '\n')
-        self.level = level
-        self.url = url
-        self.hashb2b = hashb2b
-        self.hashb2s = hashb2s
-
-
 class DownloaderApp:
     def __init__(self, root):
         self.root = root
@@ -164,11 +112,20 @@ class DownloaderApp:
         self.download_dir = tk.StringVar(value="")
         self.auto_update_value = False  # 用于保存自动更新的勾选状态
         self.auto_thread_value = False  # 用于保存自动选择线程数的勾选状态
+        self.rate_limit_value = 0  # 下载限速 (KB/s), 0 表示不限速
 
         # 窗口位置配置
         self.window_positions = {}
+        self.mirror_config = {}  # 局域网镜像配置 (config.json 中的 mirror 项)
+        self.queue_config = {}  # 下载队列配置 (config.json 中的 queue 项)
+        self.metrics_config = {}  # 下载指标配置 (config.json 中的 metrics 项)
+        self.prefetch_config = {}  # 后台预取配置 (config.json 中的 prefetch 项)
+        self.endpoint_config = {}  # 等价端点配置 (config.json 中的 endpoints 项)
         self.load_window_positions()
 
+        # 所有下载连接 (包括下载器自身更新) 共享的限速器
+        self.rate_limiter = RateLimiter(self.rate_limit_value * 1024)
+
         # 设置主窗口的位置和大小
         self.set_window_position(self.root, "main")
         self.root.minsize(900, 700)
@@ -188,10 +145,74 @@ class DownloaderApp:
         self.old_program_path = os.path.abspath(sys.argv[0])
         self.temp_file_path = os.path.join(self.app_dir, "temp_filepath.txt")
         self.update_bat_path = os.path.join(self.app_dir, "update.bat")
+        self.update_thread = None  # 下载器自身更新的下载线程
 
         self.thread_radios = []  # 用于存储线程选择的单选按钮
 
+        # 等价端点: 按记录的延迟和吞吐量选择 API 和下载服务器, 失败时切换到下一个
+        SCOREBOARD.load(os.path.join(self.app_dir, "endpoints.json"))
+        API_ENDPOINTS.set_bases(self.endpoint_config.get("api") or [API_BASE])
+        DOWNLOAD_ENDPOINTS.set_bases(self.endpoint_config.get("download", []))
+
+        # 局域网镜像: 缓存已校验的压缩包, 并按配置对局域网提供下载
+        self.mirror_server = None
+        self.start_mirror_server()
+
+        # 解压后端: 安装了 py7zr 时进程内解压, 否则 (或配置为 7z 时) 调用 7z.exe
+        self.extractor = create_extractor(self.queue_config.get("extractor", "auto"))
+        # 使用 7z.exe 时在启动时释放 7z 文件; 进程内解压时等到第一次解压再释放 (只用于不支持的压缩方法)
+        self.seven_zip_released = False
+        if not isinstance(self.extractor, Py7zrExtractor):
+            self.release_7z_files()
+
+        # 下载队列: 所有任务共享全局连接数预算、网络限速和写盘限速
+        self.download_queue = DownloadQueue(
+            max_connections=self.queue_config.get("max_connections", 16),
+            max_jobs=self.queue_config.get("max_jobs", 2),
+            limiter=self.rate_limiter,
+            disk_limiter=RateLimiter(self.queue_config.get("disk_limit", 0) * 1024),
+            headers=HEADERS,
+            arch=SYSTEM_ARCH,
+            mirrors=self.mirror_config.get("sources", []),
+            cache_dir=self.get_cache_dir(),
+            # 启用 http2 时所有分段复用一个 HTTP/2 连接, 不可用时自动回退到 HTTP/1.1 连接池
+            transport=create_transport(http2=self.queue_config.get("http2", False), pool_size=self.queue_config.get("max_connections", 16)),
+            # 分段出错时按指数退避重试并从断点继续, 失败次数超过预算时任务失败
+            engine_options={
+                'retries': self.queue_config.get("retries", 5),
+                'failure_budget': self.queue_config.get("failure_budget", 20),
+                'hedging': self.queue_config.get("hedging", True),
+                # 大于 1 时由多个子进程下载各分段 (高带宽的局域网镜像)
+                'processes': self.queue_config.get("processes", 0),
+            },
+            extractor=self.extractor,
+            # 先解压到临时目录再整体替换客户端目录, 上一个版本保留为可回滚的快照
+            staged=self.queue_config.get("staged", True),
+            # 按压缩包中的大小和 CRC32 只写入内容有变化的文件
+            selective=self.queue_config.get("selective", True),
+            # 清单提供块映射时, 除缓存中的旧压缩包外还可复用的本地文件或目录
+            reuse=self.queue_config.get("reuse", []),
+        )
+        self.job_auto_update = {}  # 任务ID -> 完成后是否自动解压
+        self.reported_jobs = set()
+        self.queue_window = None
+        self.queue_refresh_pending = False
+
+        # 下载指标: 本地指标端点和定期写入的指标文件
+        self.metrics_server = None
+        self.metrics_writer = None
+        self.start_metrics_export()
+        # 界面响应探针: 记录 Tk 主循环的卡顿和当时正在执行的操作, 写入会话报告
+        self.ui_probe = None
+        self.start_ui_probe()
+
+        # 后台预取: 空闲时把最新版本下载到已校验缓存, 点击下载后直接解压
+        self.prefetcher = None
+        self.start_prefetch()
+
         self.create_widgets()
+        # 在用户选择选项时预先解析主机并建立连接
+        self.warm_up_connections()
         self.check_for_updates()
 
         # 绑定关闭事件
@@ -211,6 +232,11 @@ class DownloaderApp:
                 with open(CONFIG_PATH, 'r') as f:
                     config = json.load(f)
                     self.window_positions = config.get("window_positions", {})
+                    self.mirror_config = config.get("mirror", {})
+                    self.queue_config = config.get("queue", {})
+                    self.metrics_config = config.get("metrics", {})
+                    self.prefetch_config = config.get("prefetch", {})
+                    self.endpoint_config = config.get("endpoints", {})
                     # 加载用户选择的目录和自动更新状态
                     user_paths = config.get("user_paths", {})
                     if "download_dir" in user_paths:
@@ -227,6 +253,8 @@ class DownloaderApp:
                         self.auto_update_value = user_paths["auto_update"]
                     if "auto_thread" in user_paths:
                         self.auto_thread_value = user_paths["auto_thread"]
+                    if "rate_limit" in user_paths:
+                        self.rate_limit_value = user_paths["rate_limit"]
         except Exception as e:
             print(f"加载配置失败: {str(e)}")
 
@@ -252,12 +280,18 @@ class DownloaderApp:
                 "download_dir": self.download_dir.get() if os.path.exists(self.download_dir.get()) else "",
                 "client_dir": self.client_dir.get() if os.path.exists(self.client_dir.get()) and os.path.exists(os.path.join(self.client_dir.get(), "Reunion.exe")) else "",
                 "auto_update": self.auto_update_value,
-                "auto_thread": self.auto_thread_value
+                "auto_thread": self.auto_thread_value,
+                "rate_limit": self.rate_limit_value
             }
 
             config = {
                 "window_positions": self.window_positions,
-                "user_paths": user_paths
+                "user_paths": user_paths,
+                "mirror": self.mirror_config,
+                "queue": self.queue_config,
+                "metrics": self.metrics_config,
+                "prefetch": self.prefetch_config,
+                "endpoints": self.endpoint_config
             }
 
             with open(CONFIG_PATH, 'w') as f:
@@ -400,6 +434,9 @@ class DownloaderApp:
         ttk.Button(button_frame, text="检查更新", command=self.on_check_for_updates).pack(side=tk.LEFT, padx=10)
         self.download_button = ttk.Button(button_frame, text="开始下载", command=self.start_download, state=tk.DISABLED)
         self.download_button.pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="预取全部通道", command=self.prefetch_all_channels).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="下载队列", command=self.show_queue_window).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="回滚客户端", command=self.rollback_client).pack(side=tk.LEFT, padx=10)
 
         # 版权信息
         copyright_frame = ttk.Frame(bottom_frame)
@@ -454,53 +491,7 @@ class DownloaderApp:
     def fetch_versions(self):
         try:
             channel = self.channel_var.get()
-            filename = f"{channel}.ini"
-            url = f"https://api17-2e40-yzlty.ru2023.top/verify1/{filename}"
-
-            response = requests.get(url, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-            self.versions = []
-
-            current_version = None
-            current_ver_code = None
-            current_changelog = ""
-            current_level = None
-            current_url = None
-            current_hashb2b = None
-            current_hashb2s = None
-            in_changelog = False
-
-            for line in response.text.splitlines():
-                line = line.strip()
-                if line.startswith('[') and line.endswith(']'):
-                    if current_version:
-                        self.versions.append(VersionInfo(current_version, current_ver_code, current_changelog, current_level, current_url, current_hashb2b, current_hashb2s))
-                        current_changelog = ""
-                    current_version = line[1:-1]
-                    current_ver_code = None
-                    current_level = None
-                    current_url = None
-                    current_hashb2b = None
-                    current_hashb2s = None
-                    in_changelog = False
-                elif line.startswith('ver='):
-                    current_ver_code = line[4:]
-                elif line.startswith('changelog='):
-                    current_changelog = line[10:].replace('\\n', '\n')
-                    in_changelog = True
-                elif line.startswith('level='):
-                    current_level = int(line[6:])
-                elif line.startswith('url='):
-                    current_url = line[4:]
-                elif line.startswith('hashb2b='):
-                    current_hashb2b = line[8:]
-                elif line.startswith('hashb2s='):
-                    current_hashb2s = line[8:]
-                elif in_changelog:
-                    current_changelog += '\n' + line
-
-            if current_version and current_url:
-                self.versions.append(VersionInfo(current_version, current_ver_code, current_changelog, current_level, current_url, current_hashb2b, current_hashb2s))
+            self.versions = fetch_channel_versions(channel, headers=HEADERS)
 
             for widget in self.scrollable_frame.winfo_children():
                 widget.destroy()
@@ -547,6 +538,7 @@ class DownloaderApp:
                 if available_versions:
                     self.version_var.set(available_versions[0].ver_code)
                     self.selected_version = available_versions[0]
+                    self.warm_up_connections(available_versions[0].url)
                     self.download_button.config(state=tk.NORMAL)
                 else:
                     self.download_button.config(state=tk.DISABLED)
@@ -556,6 +548,33 @@ class DownloaderApp:
         except Exception as e:
             print(f"获取版本列表失败: {str(e)}")
 
+    def warm_up_connections(self, url=None):
+        """在后台预先解析主机并建立连接池中的连接, 点击下载后直接复用
+
+        不指定 url 时预热 API 服务器和局域网镜像, 选择通道后预热下载服务器 (连接数为所选线程数).
+        """
+        connections = self.selected_thread_count.get() or 4
+        urls = [DOWNLOAD_ENDPOINTS.urls(url)[0]] if url else self.mirror_config.get("sources", [])
+
+        def warm_task():
+            if not url:
+                # 配置了多个端点时先测量延迟, 只预热得分最好的端点
+                for pool in (API_ENDPOINTS, DOWNLOAD_ENDPOINTS):
+                    if len(pool.bases) > 1:
+                        pool.probe()
+                api_base = API_ENDPOINTS.best()
+                try:
+                    warm_pool(shared_session(), api_base)
+                except Exception as e:
+                    print(f"预热连接失败: {api_base}: {str(e)}")
+            for target in urls:
+                try:
+                    self.download_queue.transport.warm(target, connections if url else 1)
+                except Exception as e:
+                    print(f"预热连接失败: {target}: {str(e)}")
+
+        Thread(target=warm_task, daemon=True).start()
+
     def on_version_select(self, version_info):
         if version_info.level == 0:
             self.download_button.config(state=tk.DISABLED)
@@ -589,50 +608,17 @@ class DownloaderApp:
     def check_for_updates(self, user_triggered=False):
         try:
             # 根据系统架构选择不同的 version.ini 文件
-            if SYSTEM_ARCH == 'x86':
-                version_file = "version-win7-1.ini"
-            elif SYSTEM_ARCH == 'x64':
-                version_file = "version-win7.ini"
-            else:
-                version_file = "version-win7.ini"  # 默认使用 version-win7.ini
-
-            url = f"https://api17-2e40-yzlty.ru2023.top/{version_file}"
-            response = requests.get(url, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-
-            latest_ver = None
-            latest_ver_code = None
-            latest_changelog = ""
-            latest_url = None
-            notice = ""
-            in_changelog = False
-
-            for line in response.text.splitlines():
-                line = line.strip()
-                if line.startswith('ver='):
-                    latest_ver = line[4:]
-                elif line.startswith('changelog='):
-                    latest_changelog = line[10:].replace('\\n', '\n')
-                    in_changelog = True
-                elif line.startswith('ver_code='):
-                    latest_ver_code = line[9:]
-                elif line.startswith('url='):
-                    latest_url = line[4:]
-                elif line.startswith('notice='):
-                    notice = line[7:].replace('\\n', '\n')
-                elif in_changelog:
-                    latest_changelog += '\n' + line
-
-            if latest_ver and latest_changelog and latest_ver_code and latest_url:
-                if version.parse(latest_ver) > version.parse(CURRENT_VERSION):
-                    self.show_update_dialog(latest_ver, latest_ver_code, latest_changelog, latest_url)
-                    print(f"新版本 v{latest_ver} ({latest_ver_code}) 可用，当前版本 v{CURRENT_VERSION} ({CURRENT_VER_CODE}) 已不是最新")
+            update_info = fetch_update_info(SYSTEM_ARCH, win7=True, headers=HEADERS)
+            if update_info:
+                if version.parse(update_info.version) > version.parse(CURRENT_VERSION):
+                    self.show_update_dialog(update_info)
+                    print(f"新版本 v{update_info.version} ({update_info.ver_code}) 可用，当前版本 v{CURRENT_VERSION} ({CURRENT_VER_CODE}) 已不是最新")
                 else:
                     print(f"当前已是最新版本 ({CURRENT_VERSION} ({CURRENT_VER_CODE}))")
                     if user_triggered:
                         messagebox.showinfo("更新检查", f"当前已是最新版本: v{CURRENT_VERSION} ({CURRENT_VER_CODE})")
 
-            self.notice_label.config(text=notice)
+                self.notice_label.config(text=update_info.notice)
 
         except Exception as e:
             print(f"检查更新失败: {str(e)}")
@@ -640,7 +626,7 @@ class DownloaderApp:
     def on_check_for_updates(self):
         self.check_for_updates(user_triggered=True)
 
-    def show_update_dialog(self, latest_ver, latest_ver_code, latest_changelog, latest_url):
+    def show_update_dialog(self, update_info):
         self.update_dialog = tk.Toplevel(self.root)
         self.update_dialog.title("更新可用")
         
@@ -653,13 +639,13 @@ class DownloaderApp:
         update_info_frame = ttk.Frame(self.update_dialog)
         update_info_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-        ttk.Label(update_info_frame, text=f"新版本: {latest_ver} ({latest_ver_code})").pack(pady=10)
+        ttk.Label(update_info_frame, text=f"新版本: {update_info.version} ({update_info.ver_code})").pack(pady=10)
 
         changelog_frame = ttk.Frame(update_info_frame)
         changelog_frame.pack(fill=tk.BOTH, expand=True)
 
         changelog_text = tk.Text(changelog_frame, height=10)
-        changelog_text.insert(tk.END, latest_changelog)
+        changelog_text.insert(tk.END, update_info.changelog)
         changelog_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         scrollbar = ttk.Scrollbar(changelog_frame, orient="vertical", command=changelog_text.yview)
@@ -669,76 +655,101 @@ class DownloaderApp:
         button_frame = ttk.Frame(update_info_frame)
         button_frame.pack(fill=tk.X, pady=10)
 
-        ttk.Button(button_frame, text="下载更新", command=lambda: self.download_update(latest_url)).pack(side=tk.LEFT, padx=10)
+        ttk.Button(button_frame, text="下载更新", command=lambda: self.download_update(update_info)).pack(side=tk.LEFT, padx=10)
         ttk.Button(button_frame, text="稍后提醒", command=lambda: self.close_window(self.update_dialog, "update")).pack(side=tk.RIGHT, padx=10)
 
         self.update_dialog.transient(self.root)
         self.update_dialog.grab_set()
 
-    def download_update(self, url):
-        try:
-            response = requests.get(url, headers=HEADERS, stream=True)
-            response.raise_for_status()
+    def download_update(self, update_info):
+        """使用分段下载引擎下载新版本下载器 (校验哈希, 支持断点续传), 进度在主线程中刷新"""
+        if self.update_thread is not None and self.update_thread.is_alive():
+            return
 
-            updater_dir = os.getcwd()
-            os.makedirs(updater_dir, exist_ok=True)
-            save_path = os.path.join(updater_dir, url.split('/')[-1])
-            total_size = int(response.headers.get('Content-Length', 0))
+        self.download_window = tk.Toplevel(self.root)
+        self.download_window.title("下载进度")
 
-            if response.status_code == 304:
-                print("资源未修改")
-                return
+        # 设置和保存窗口位置
+        self.set_window_position(self.download_window, "download")
+        self.download_window.protocol("WM_DELETE_WINDOW", self.close_update_window)
+
+        self.set_window_icon(self.download_window)
+
+        progress_frame = ttk.LabelFrame(self.download_window, text="下载进度", padding="10")
+        progress_frame.pack(fill=tk.X, pady=10)
+        self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate')
+        self.progress_bar.pack(pady=10, fill=tk.X)
+        self.progress_info = ttk.Label(progress_frame, text="")
+        self.progress_info.pack(pady=5)
+        self.create_rate_limit_controls(progress_frame)
+
+        log_frame = ttk.LabelFrame(self.download_window, text="日志", padding="10")
+        log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        self.log_text = tk.Text(log_frame, height=10, state=tk.DISABLED)
+        self.log_text.pack(fill=tk.BOTH, expand=True)
+
+        # 引擎的日志来自下载线程, 先放入队列, 由主线程取出显示
+        self.update_messages = Queue()
+        self.update_result = None
+        self.update_engine = DownloadEngine(
+            threads=4, headers=HEADERS, on_log=self.update_messages.put, limiter=self.rate_limiter, resume=True,
+        )
+        self.create_download_controls(progress_frame, self.update_engine.token)
 
-            self.download_window = tk.Toplevel(self.root)
-            self.download_window.title("下载进度")
-            
-            # 设置和保存窗口位置
-            self.set_window_position(self.download_window, "download")
-            self.download_window.protocol("WM_DELETE_WINDOW", lambda: self.on_child_closing(self.download_window, "download"))
-
-            self.set_window_icon(self.download_window)
-
-            progress_frame = ttk.LabelFrame(self.download_window, text="下载进度", padding="10")
-            progress_frame.pack(fill=tk.X, pady=10)
-            self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate')
-            self.progress_bar.pack(pady=10, fill=tk.X)
-            self.progress_info = ttk.Label(progress_frame, text="")
-            self.progress_info.pack(pady=5)
-
-            log_frame = ttk.LabelFrame(self.download_window, text="日志", padding="10")
-            log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
-            self.log_text = tk.Text(log_frame, height=10, state=tk.DISABLED)
-            self.log_text.pack(fill=tk.BOTH, expand=True)
-
-            tracker = DownloadTracker(total_size)
-            self.progress_bar['maximum'] = total_size
-
-            def download_task():
-                nonlocal tracker
-                with open(save_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            tracker.update(len(chunk))
-                            self.update_progress(tracker)
-
-                # 下载完成后创建临时文件和更新脚本
-                self.create_update_files(save_path)
-                self.download_window.destroy()
-                if hasattr(self, 'update_dialog'):
-                    self.update_dialog.destroy()
-                    
-                # 运行更新脚本并退出当前程序
-                try:
-                    subprocess.Popen(self.update_bat_path, shell=True)
-                    self.root.destroy()
-                except Exception as e:
-                    messagebox.showerror("更新失败", f"无法启动更新脚本: {str(e)}", parent=self.root)
+        def download_task():
+            try:
+                self.update_result = download_self_update(
+                    update_info, os.getcwd(), self.update_engine, current_path=self.old_program_path,
+                    current_version=CURRENT_VERSION, arch=SYSTEM_ARCH,
+                )
+            except Exception as e:
+                self.update_result = e
 
-            Thread(target=download_task).start()
+        self.update_thread = Thread(target=download_task, daemon=True)
+        self.update_thread.start()
+        self.root.after(400, self.poll_update_download)
 
+    def poll_update_download(self):
+        """刷新下载器更新的进度, 下载完成后创建更新脚本并运行"""
+        window_open = self.download_window.winfo_exists()
+        while True:
+            try:
+                message = self.update_messages.get_nowait()
+            except Empty:
+                break
+            print(message)
+            if window_open:
+                self.append_log(message)
+        if window_open and self.update_engine.tracker:
+            self.update_progress(self.update_engine.tracker)
+
+        if self.update_thread.is_alive():
+            self.root.after(400, self.poll_update_download)
+            return
+
+        if isinstance(self.update_result, DownloadCancelled):
+            print("下载器更新已取消")
+            if window_open:
+                self.on_child_closing(self.download_window, "download")
+            return
+        if isinstance(self.update_result, Exception):
+            print(f"更新下载失败: {str(self.update_result)}")
+            messagebox.showerror("更新失败", f"下载更新失败: {str(self.update_result)}", parent=self.root)
+            return
+
+        # 下载完成后创建临时文件和更新脚本
+        self.create_update_files(self.update_result)
+        if window_open:
+            self.download_window.destroy()
+        if hasattr(self, 'update_dialog'):
+            self.update_dialog.destroy()
+
+        # 运行更新脚本并退出当前程序
+        try:
+            subprocess.Popen(self.update_bat_path, shell=True)
+            self.root.destroy()
         except Exception as e:
-            print(f"更新下载失败: {str(e)}")
+            messagebox.showerror("更新失败", f"无法启动更新脚本: {str(e)}", parent=self.root)
 
     def start_download(self):
         if not self.is_channel_selected or not self.selected_version or not self.selected_thread_count.get():
@@ -749,107 +760,178 @@ class DownloaderApp:
             messagebox.showerror("错误", "请选择路径")
             return
 
-        download_url = self.selected_version.url
+        version_info = self.selected_version
 
-        if not download_url:
+        if not version_info.url:
             messagebox.showerror("错误", "无法获取下载链接, 请检查版本信息")
             return
 
-        save_dir = self.path_var.get()
-        save_path = os.path.join(save_dir, download_url.split('/')[-1])
+        # 加入下载队列, 每个任务在队列窗口中单独显示进度
+        job = self.download_queue.submit(version_info, self.path_var.get(), threads=self.selected_thread_count.get(), channel=self.selected_channel)
+        self.job_auto_update[job.id] = self.auto_update_var.get()
+        self.show_queue_window()
 
-        try:
-            response = requests.get(download_url, headers=HEADERS, stream=True)
-            response.raise_for_status()
-            total_size = int(response.headers.get('Content-Length', 0))
+    def prefetch_all_channels(self):
+        """把每个通道的最新可用版本加入下载队列 (只下载到离线包目录, 不解压)"""
+        save_dir = self.download_dir.get() or DEFAULT_DOWNLOAD_DIR
+        for channel_id, description in self.channels:
+            try:
+                version_info = latest_available(fetch_channel_versions(channel_id, headers=HEADERS))
+            except Exception as e:
+                print(f"获取{description}版本列表失败: {str(e)}")
+                continue
+            if version_info:
+                job = self.download_queue.submit(version_info, save_dir, threads=self.selected_thread_count.get() or 4, channel=channel_id)
+                self.job_auto_update[job.id] = False
+        self.show_queue_window()
+
+    def show_queue_window(self):
+        """显示下载队列窗口, 已打开时只刷新"""
+        if self.queue_window is not None and self.queue_window.winfo_exists():
+            self.queue_window.lift()
+            self.refresh_queue_window()
+            return
 
-            if response.status_code == 304:
-                print("资源未修改")
-                return
+        self.queue_window = tk.Toplevel(self.root)
+        self.queue_window.title("下载队列")
 
-            self.download_window = tk.Toplevel(self.root)
-            self.download_window.title("下载进度")
-            
-            # 设置和保存窗口位置
-            self.set_window_position(self.download_window, "download")
-            self.download_window.protocol("WM_DELETE_WINDOW", lambda: self.on_child_closing(self.download_window, "download"))
-
-            self.set_window_icon(self.download_window)
-
-            progress_frame = ttk.LabelFrame(self.download_window, text="下载进度", padding="10")
-            progress_frame.pack(fill=tk.X, pady=10)
-            self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate')
-            self.progress_bar.pack(pady=10, fill=tk.X)
-            self.progress_info = ttk.Label(progress_frame, text="")
-            self.progress_info.pack(pady=5)
-
-            log_frame = ttk.LabelFrame(self.download_window, text="日志", padding="10")
-            log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
-            self.log_text = tk.Text(log_frame, height=10, state=tk.DISABLED)
-            self.log_text.pack(fill=tk.BOTH, expand=True)
-
-            tracker = DownloadTracker(total_size)
-            self.progress_bar['maximum'] = total_size
-
-            num_threads = self.selected_thread_count.get()
-            chunk_size = total_size // num_threads
-
-            def download_range(start, end, part_index):
-                headers = HEADERS.copy()
-                headers['Range'] = f'bytes={start}-{end}'
-                response = requests.get(download_url, headers=headers, stream=True)
-                response.raise_for_status()
-
-                part_path = f"{save_path}.part{part_index}"
-                with open(part_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            tracker.update(len(chunk))
-                            self.update_progress(tracker)
-
-                return part_path
-
-            def download_task():
-                nonlocal tracker
-                ranges = []
-                for i in range(num_threads):
-                    start = i * chunk_size
-                    end = start + chunk_size - 1
-                    if i == num_threads - 1:
-                        end = total_size - 1
-                    ranges.append((start, end, i))
-
-                with ThreadPoolExecutor(max_workers=num_threads) as executor:
-                    futures = [executor.submit(download_range, start, end, i) for start, end, i in ranges]
-                    part_files = [future.result() for future in futures]
-
-                with open(save_path, 'wb') as f:
-                    for part_file in sorted(part_files, key=lambda x: int(x.split('.')[-1].split('part')[-1])):
-                        with open(part_file, 'rb') as part_f:
-                            f.write(part_f.read())
-                        os.remove(part_file)
-
-                # 校验文件哈希值
-                if self.verify_hash(save_path):
-                    # 如果启用了自动更新，则执行解压操作
-                    if self.auto_update_var.get():
-                        self.extract_and_update(save_path)
-                    else:
-                        messagebox.showinfo("下载完成", f"下载完成, 文件已保存到您选择的目录", parent=self.download_window)
-                else:
-                    messagebox.showerror("哈希校验失败", "下载的文件哈希校验失败, 文件可能损坏或被篡改", parent=self.download_window)
-                    os.remove(save_path)  # 删除校验失败的文件
+        # 设置和保存窗口位置
+        self.set_window_position(self.queue_window, "download")
+        self.queue_window.protocol("WM_DELETE_WINDOW", self.close_queue_window)
+
+        self.set_window_icon(self.queue_window)
+
+        settings_frame = ttk.LabelFrame(self.queue_window, text="全局设置", padding="10")
+        settings_frame.pack(fill=tk.X, pady=10)
+        self.create_rate_limit_controls(settings_frame)
+        self.queue_summary = ttk.Label(settings_frame, text="")
+        self.queue_summary.pack(pady=5)
+
+        self.queue_frame = ttk.Frame(self.queue_window, padding="10")
+        self.queue_frame.pack(fill=tk.BOTH, expand=True)
+        self.queue_rows = {}
+
+        self.refresh_queue_window()
+
+    def refresh_queue_window(self):
+        """在主线程中定期刷新每个任务的进度, 并处理刚结束的任务"""
+        if self.queue_refresh_pending:
+            return
+        for job in self.download_queue.jobs():
+            if job.state in (JOB_DONE, JOB_FAILED, JOB_CANCELLED) and job.id not in self.reported_jobs:
+                self.reported_jobs.add(job.id)
+                self.on_job_finished(job)
+
+        if self.queue_window is not None and self.queue_window.winfo_exists():
+            for job in self.download_queue.jobs():
+                self.update_queue_row(job)
+            self.queue_summary.config(text=f"连接数: {self.download_queue.budget.in_use}/{self.download_queue.budget.limit}")
+        elif not self.download_queue.active():
+            return
+
+        self.queue_refresh_pending = True
+        self.root.after(400, self._refresh_queue_tick)
+
+    def _refresh_queue_tick(self):
+        self.queue_refresh_pending = False
+        self.refresh_queue_window()
+
+    def update_queue_row(self, job):
+        row = self.queue_rows.get(job.id)
+        if row is None:
+            row_frame = ttk.LabelFrame(self.queue_frame, text=job.label, padding="5")
+            row_frame.pack(fill=tk.X, pady=5)
+            progress_bar = ttk.Progressbar(row_frame, orient=tk.HORIZONTAL, mode='determinate')
+            progress_bar.pack(fill=tk.X)
+            info = ttk.Label(row_frame, text="")
+            info.pack(pady=2)
+            controls = self.create_download_controls(row_frame, job.token)
+            row = self.queue_rows[job.id] = (progress_bar, info, controls)
+
+        progress_bar, info, controls = row
+        if job.state in (JOB_DONE, JOB_FAILED, JOB_CANCELLED):
+            controls.pack_forget()
+        if job.state == JOB_QUEUED:
+            info.config(text="已暂停 (排队中)" if job.paused else "排队中")
+            return
+        if job.state == JOB_FAILED:
+            info.config(text=f"失败: {str(job.error)}")
+            return
+        if job.state == JOB_CANCELLED:
+            info.config(text="已取消")
+            return
 
-                self.download_window.destroy()
-                if hasattr(self, 'update_dialog'):
-                    self.update_dialog.destroy()
+        progress = job.progress()
+        if progress is None:
+            info.config(text="准备中")
+            return
+        progress_bar['maximum'] = max(progress['total'], 1)
+        progress_bar['value'] = progress['downloaded']
+        tracker = job.engine.tracker
+        if job.state == JOB_DONE:
+            info.config(text=f"已完成 - {tracker._human_size(progress['total'])}")
+        elif job.paused:
+            info.config(text=f"已暂停 - {progress['percent']:.2f}% - {tracker._human_size(progress['downloaded'])}/{tracker._human_size(progress['total'])}")
+        else:
+            info.config(
+                text=f"{progress['percent']:.2f}% - {tracker._human_size(progress['downloaded'])}/{tracker._human_size(progress['total'])} - 下载速度: {tracker._human_size(progress['speed'])}/s - 预计剩余时间: {tracker._format_time(progress['remaining'])}"
+            )
 
-            Thread(target=download_task).start()
+    def start_metrics_export(self):
+        """按配置启动本地指标端点和指标文件"""
+        try:
+            if self.metrics_config.get("port"):
+                self.metrics_server = MetricsServer(self.download_queue.registry, port=self.metrics_config["port"]).start()
+            if self.metrics_config.get("file"):
+                self.metrics_writer = MetricsFileWriter(self.download_queue.registry, self.metrics_config["file"]).start()
+        except Exception as e:
+            print(f"启动指标导出失败: {str(e)}")
 
+    def start_ui_probe(self):
+        """按配置 (metrics 项中的 ui_probe) 启动界面响应探针, 标记可能阻塞主循环的操作"""
+        if not self.metrics_config.get("ui_probe"):
+            return
+        self.ui_probe = LagProbe()
+        # 下载器自身更新的进度由 update_progress 刷新, 下载队列中各任务的进度由 update_queue_row 刷新
+        for name in ("fetch_versions", "check_for_updates", "update_progress", "update_queue_row", "save_window_position"):
+            setattr(self, name, self.ui_probe.wrap(name, getattr(self, name)))
+        self.download_queue.registry.attach("ui", self.ui_probe.summary)
+        self.ui_probe.start(self.root)
+
+    def ui_operation(self, name):
+        """探针开启时把一段代码标记为操作 name"""
+        return self.ui_probe.operation(name) if self.ui_probe else nullcontext()
+
+    def write_session_report(self):
+        """把所有下载任务的指标写入 JSON 会话报告"""
+        report_path = self.metrics_config.get("report")
+        if not report_path:
+            return
+        try:
+            self.download_queue.registry.write_report(report_path)
         except Exception as e:
-            print(f"下载失败: {str(e)}")
-            messagebox.showerror("下载失败", "下载过程中发生错误, 请重试", parent=self.download_window)
+            print(f"写入会话报告失败: {str(e)}")
+
+    def on_job_finished(self, job):
+        self.write_session_report()
+        parent = self.queue_window if self.queue_window is not None and self.queue_window.winfo_exists() else self.root
+        if job.state == JOB_CANCELLED:
+            self.job_auto_update.pop(job.id, None)
+            print(f"下载已取消: {job.label}")
+            return
+        if job.state == JOB_FAILED:
+            if isinstance(job.error, HashMismatchError):
+                messagebox.showerror("哈希校验失败", f"{job.label}: 下载的文件哈希校验失败, 文件可能损坏或被篡改", parent=parent)
+            else:
+                print(f"下载失败: {str(job.error)}")
+                messagebox.showerror("下载失败", f"{job.label}: 下载过程中发生错误, 请重试", parent=parent)
+            return
+
+        # 如果启用了自动更新，则执行解压操作
+        if self.job_auto_update.pop(job.id, False):
+            self.extract_and_update(job.path)
+        else:
+            messagebox.showinfo("下载完成", f"{job.label}: 下载完成, 文件已保存到您选择的目录", parent=parent)
 
     def create_update_files(self, save_path):
         new_program_path = save_path
@@ -867,10 +949,74 @@ class DownloaderApp:
             bat_file.write(f"move /Y {new_program_path} {os.path.dirname(self.old_program_path)}\n")
             bat_file.write(f"{os.path.basename(new_program_path)}\n")
 
+    def create_download_controls(self, parent, token):
+        """添加暂停/继续和取消按钮, 通过令牌控制该下载的所有线程; 返回按钮所在的框架"""
+        control_frame = ttk.Frame(parent)
+        control_frame.pack(pady=2)
+        pause_button = ttk.Button(control_frame, text="继续" if token.paused else "暂停")
+
+        def toggle_pause():
+            if token.paused:
+                token.resume()
+            else:
+                token.pause()
+            pause_button.config(text="继续" if token.paused else "暂停")
+
+        def cancel():
+            if messagebox.askokcancel("取消下载", "确定要取消下载吗? 已下载的临时文件将被删除", parent=parent.winfo_toplevel()):
+                token.cancel()
+
+        pause_button.config(command=toggle_pause)
+        pause_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="取消", command=cancel).pack(side=tk.LEFT, padx=5)
+        return control_frame
+
+    def close_queue_window(self):
+        """关闭下载队列窗口; 还有未完成的任务时询问是取消还是在后台继续"""
+        if self.download_queue.active():
+            answer = messagebox.askyesnocancel(
+                "关闭下载窗口",
+                "还有未完成的下载任务.\n是: 取消这些任务并删除临时文件\n否: 在后台继续下载",
+                parent=self.queue_window,
+            )
+            if answer is None:
+                return
+            if answer:
+                for job in self.download_queue.jobs():
+                    job.cancel()
+        self.on_child_closing(self.queue_window, "download")
+
+    def close_update_window(self):
+        """关闭下载器更新窗口时取消更新下载, 连接立即断开, 临时文件被删除"""
+        if self.update_thread is not None and self.update_thread.is_alive():
+            if not messagebox.askokcancel("取消更新", "确定要取消下载器更新吗?", parent=self.download_window):
+                return
+            self.update_engine.token.cancel()
+        self.on_child_closing(self.download_window, "download")
+
+    def create_rate_limit_controls(self, parent):
+        """在下载窗口中添加限速设置, 下载过程中修改立即生效"""
+        rate_frame = ttk.Frame(parent)
+        rate_frame.pack(pady=5)
+        ttk.Label(rate_frame, text="限速 (KB/s, 0 为不限速):").pack(side=tk.LEFT)
+        rate_var = tk.StringVar(value=str(self.rate_limit_value))
+        ttk.Spinbox(rate_frame, from_=0, to=1000000, increment=512, textvariable=rate_var, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Button(rate_frame, text="应用", command=lambda: self.apply_rate_limit(rate_var)).pack(side=tk.LEFT)
+
+    def apply_rate_limit(self, rate_var):
+        try:
+            rate = max(0, int(rate_var.get()))
+        except ValueError:
+            messagebox.showwarning("警告", "请输入有效的限速数值")
+            return
+        self.rate_limit_value = rate
+        self.rate_limiter.set_rate(rate * 1024)
+
     def update_progress(self, tracker):
         current_time = time.time()
         if not hasattr(self, 'last_update_time') or current_time - self.last_update_time >= 0.4:
             progress = tracker.get_progress()
+            self.progress_bar['maximum'] = max(progress['total'], 1)
             self.progress_bar['value'] = progress['downloaded']
             self.progress_info.config(
                 text=f"{progress['percent']:.2f}% - {tracker._human_size(progress['downloaded'])}/{tracker._human_size(progress['total'])} - 下载速度: {tracker._human_size(progress['speed'])}/s - 预计剩余时间: {tracker._format_time(progress['remaining'])}"
@@ -881,6 +1027,12 @@ class DownloaderApp:
             self.log_text.configure(state=tk.DISABLED)
             self.last_update_time = current_time
 
+    def append_log(self, message):
+        self.log_text.configure(state=tk.NORMAL)
+        self.log_text.insert(tk.END, message + "\n")
+        self.log_text.see(tk.END)
+        self.log_text.configure(state=tk.DISABLED)
+
     def choose_path(self):
         if self.auto_update_var.get():
             # 选择客户端目录
@@ -952,8 +1104,15 @@ class DownloaderApp:
         else:
             return 16
 
+    def release_7z_files(self):
+        """释放 7z 文件, 每次运行只释放一次"""
+        if not self.seven_zip_released:
+            extract_7z_files()
+            self.seven_zip_released = True
+
     def extract_and_update(self, archive_path):
         try:
+            self.release_7z_files()
             # 获取客户端目录
             client_dir = self.client_dir.get()
 
@@ -970,38 +1129,29 @@ class DownloaderApp:
             self.extraction_log_text = tk.Text(log_frame, height=15, state=tk.NORMAL, wrap=tk.WORD)
             self.extraction_log_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+            self.extraction_progress_bar = ttk.Progressbar(log_frame, mode='determinate')
+            self.extraction_progress_bar.pack(fill=tk.X, padx=10, pady=(0, 10))
+            self.extraction_progress = None
+
             # 开始解压并显示日志
-            extract_cmd = f'7z.exe x -bb1 "{archive_path}" -o"{client_dir}" -y'
+            def on_output(output_line):
+                with self.ui_operation("extraction_log"):
+                    self.extraction_log_text.insert(tk.END, output_line)
+                    self.extraction_log_text.see(tk.END)
+                    self.extraction_window.update()
+
+            def on_progress(progress):
+                self.extraction_progress = progress
 
             def run_extraction():
                 try:
-                    # 启动7z解压进程并捕获输出
-                    process = subprocess.Popen(
-                        extract_cmd,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        universal_newlines=True
-                    )
+                    install_archive(archive_path, client_dir, on_output=on_output, on_progress=on_progress, extractor=self.extractor,
+                                    staged=self.queue_config.get("staged", True), on_log=lambda message: on_output(message + "\n"),
+                                    selective=self.queue_config.get("selective", True))
 
-                    # 读取并显示输出
-                    while True:
-                        output_line = process.stdout.readline()
-                        if output_line == '' and process.poll() is not None:
-                            break
-                        if output_line:
-                            self.extraction_log_text.insert(tk.END, output_line)
-                            self.extraction_log_text.see(tk.END)
-                            self.extraction_window.update()
-
-                    # 等待进程完成
-                    return_code = process.wait()
-                    if return_code != 0:
-                        messagebox.showerror("解压失败", f"解压过程中发生错误，返回状态码: {return_code}", parent=self.extraction_window)
-                        return
-
-                    # 删除下载的压缩包
-                    os.remove(archive_path)
+                    # 删除下载的压缩包 (分卷版本删除所有分卷)
+                    for path in volume_files(archive_path):
+                        os.remove(path)
 
                     messagebox.showinfo("更新完成", "重聚未来客户端已成功更新，请手动启动客户端", parent=self.extraction_window)
                 except Exception as e:
@@ -1011,14 +1161,84 @@ class DownloaderApp:
 
             # 启动解压线程
             Thread(target=run_extraction).start()
+            self.poll_extraction_progress()
 
         except Exception as e:
-            messagebox.showerror("更新失败", f"更新过程中发生错误: {str(e)}", parent=self.download_window)
+            messagebox.showerror("更新失败", f"更新过程中发生错误: {str(e)}", parent=self.root)
+
+    def rollback_client(self):
+        """把客户端目录换回上一次更新前的快照, 再次回滚可以换回当前版本"""
+        client_dir = self.client_dir.get()
+        if not client_dir or not has_snapshot(client_dir):
+            messagebox.showinfo("回滚", "没有可以回滚的版本", parent=self.root)
+            return
+        if not messagebox.askokcancel("回滚", "确定要把客户端换回上一次更新前的版本吗? 再次回滚可以换回当前版本", parent=self.root):
+            return
+        try:
+            rollback(client_dir)
+        except InstallError as e:
+            messagebox.showerror("回滚失败", str(e), parent=self.root)
+            return
+        messagebox.showinfo("回滚完成", "客户端已换回上一个版本", parent=self.root)
+
+    def poll_extraction_progress(self):
+        """按解压后端提供的进度刷新进度条: 有总字节数时按字节, 否则只显示正在进行"""
+        if not self.extraction_window.winfo_exists():
+            return
+        progress = self.extraction_progress
+        if progress and progress['total_bytes']:
+            self.extraction_progress_bar.config(mode='determinate', maximum=progress['total_bytes'], value=progress['bytes'])
+        elif progress:
+            self.extraction_progress_bar.config(mode='indeterminate')
+            self.extraction_progress_bar.step()
+        self.root.after(200, self.poll_extraction_progress)
+
+    def start_mirror_server(self):
+        """按配置启动局域网镜像服务"""
+        if not self.mirror_config.get("serve"):
+            return
+        try:
+            self.mirror_server = MirrorServer(self.get_cache_dir(), port=self.mirror_config.get("port", DEFAULT_MIRROR_PORT)).start()
+            print(f"局域网镜像已启动, 端口: {self.mirror_server.port}")
+        except Exception as e:
+            print(f"启动局域网镜像失败: {str(e)}")
+
+    def get_cache_dir(self):
+        """已校验压缩包的缓存目录, 未启用镜像、缓存和预取时返回 None"""
+        if not self.mirror_config.get("serve") and not self.mirror_config.get("cache_dir") and not self.prefetch_config.get("enabled"):
+            return None
+        return self.mirror_config.get("cache_dir") or os.path.join(self.app_dir, "RF-Cache")
+
+    def start_prefetch(self):
+        """按配置启动后台预取, 前台有下载任务或正在下载更新时暂停"""
+        if not self.prefetch_config.get("enabled"):
+            return
+        channel = self.prefetch_config.get("channel", "stable")
+        self.prefetcher = Prefetcher(
+            self.get_cache_dir(), lambda: fetch_channel_versions(channel, headers=HEADERS), busy=self.is_downloading,
+            rate=self.prefetch_config.get("rate_limit", 512) * 1024, headers=HEADERS, arch=SYSTEM_ARCH,
+            interval=self.prefetch_config.get("interval", 1800), on_log=lambda message: print(f"[预取] {message}"),
+        ).start()
+
+    def is_downloading(self):
+        """前台是否有下载 (下载队列中的任务或下载器自身更新)"""
+        return self.download_queue.active() or (self.update_thread is not None and self.update_thread.is_alive())
 
     def on_closing(self):
         """保存主窗体位置并关闭程序"""
         self.save_window_position(self.root, "main")
         if messagebox.askokcancel("退出", "确定要退出程序吗?"):
+            if self.mirror_server:
+                self.mirror_server.stop()
+            if self.prefetcher:
+                self.prefetcher.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            if self.metrics_writer:
+                self.metrics_writer.stop()
+            if self.ui_probe:
+                self.ui_probe.stop()
+                self.write_session_report()
             # 删除释放的 7z 文件
             delete_7z_files()
             # 关闭程序时删除临时文件
@@ -1185,31 +1405,14 @@ class DownloaderApp:
 
             self.developer_button.config(command=check_developer_instruction)
 
-    def verify_hash(self, file_path):
-        try:
-            # 根据系统架构选择哈希算法
-            if SYSTEM_ARCH == 'x86':
-                expected_hash = self.selected_version.hashb2s
-                hash_algo = hashlib.blake2s(digest_size=32)
-            else:
-                expected_hash = self.selected_version.hashb2b
-                hash_algo = hashlib.blake2b(digest_size=32)
-
-            # 计算文件哈希值
-            with open(file_path, 'rb') as f:
-                while chunk := f.read(8192):
-                    hash_algo.update(chunk)
-            actual_hash = hash_algo.hexdigest()
-
-            # 比较哈希值
-            return actual_hash.lower() == expected_hash.lower()
-
-        except Exception as e:
-            print(f"哈希校验失败: {str(e)}")
-            return False
+    def verify_hash(self, file_path, version_info=None):
+        # 根据系统架构选择哈希算法并校验
+        return verify_hash(file_path, version_info or self.selected_version, SYSTEM_ARCH)
 
 
 if __name__ == "__main__":
+    # 打包后的程序中多进程下载的子进程也从这里启动, 必须在其他启动操作之前
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = DownloaderApp(root)
     app.set_window_icon(root)